@@ -3,6 +3,7 @@ let map;
 let mapLayer;
 let geojsonData;
 let currentHour = 17;
+let snapshot = null;
 const zoneMetricsById = new Map();
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -21,14 +22,65 @@ const value = parseInt(hourSlider.value, 10);
 currentHour = value;
 hourLabel.textContent = formatHourLabel(value);
 loadMapForHour(value);
-loadTopZones(value);
+showTopZones(value);
 });
 hourLabel.textContent = formatHourLabel(currentHour);
 }
 loadOverview();
 loadHourlyDensitySeries();
 initializeMap();
+loadSnapshot();
+}
+
+// One fetch for the whole zones x 24 grid; after that hour changes and zone clicks stay client-side
+async function loadSnapshot() {
+try {
+const res = await fetch("/api/snapshot");
+if (!res.ok) {
 loadTopZones(currentHour);
+return;
+}
+snapshot = await res.json();
+} catch (e) {
+snapshot = null;
+}
+showTopZones(currentHour);
+}
+
+function showTopZones(hour) {
+if (!snapshot) {
+loadTopZones(hour);
+return;
+}
+renderTopZonesRows(topZonesFromSnapshot(hour, 10));
+}
+
+// Cell (zone i, hour h) sits at index i * hours + h in every metric array
+function snapshotCell(zoneIndex, hour) {
+const i = zoneIndex * snapshot.hours + hour;
+const m = snapshot.metrics;
+return {
+zone_id: snapshot.zone_ids[zoneIndex],
+zone_name: snapshot.zone_names[zoneIndex],
+borough: snapshot.boroughs[zoneIndex],
+trip_count: m.trip_count[i],
+exposure_index: m.exposure[i],
+avg_trip_duration: m.duration[i],
+revenue_volatility: m.volatility[i],
+stability_score: m.stability[i],
+risk_score: m.risk[i]
+};
+}
+
+function topZonesFromSnapshot(hour, limit) {
+const rows = [];
+for (let z = 0; z < snapshot.zone_ids.length; z++) {
+const cell = snapshotCell(z, hour);
+cell.exposure_score = cell.exposure_index;
+rows.push(cell);
+}
+rows.sort((a, b) => Number(b.risk_score || 0) - Number(a.risk_score || 0));
+return rows.slice(0, limit);
 }
 
 function formatHourLabel(hour) {
@@ -250,12 +302,18 @@ tbody.appendChild(tr);
 
 async function loadTopZones(hour) {
 try {
-const tbody = document.getElementById("topZonesBody");
 const res = await fetch("/api/top_zones?hour=" + hour);
 if (!res.ok) {
 return;
 }
 const data = await res.json();
+renderTopZonesRows(data);
+} catch (e) {
+}
+}
+
+function renderTopZonesRows(data) {
+const tbody = document.getElementById("topZonesBody");
 if (!tbody) {
 return;
 }
@@ -284,12 +342,24 @@ tr.appendChild(tripsCell);
 tr.appendChild(exposureCell);
 tbody.appendChild(tr);
 }
-} catch (e) {
-}
 }
 
 async function handleZoneSelection(zoneId) {
 const idValue = String(zoneId);
+if (snapshot) {
+const zoneIndex = snapshot.zone_ids.indexOf(Number(zoneId));
+if (zoneIndex >= 0) {
+const cell = snapshotCell(zoneIndex, currentHour);
+setText("detail-zone-name", cell.zone_name || idValue);
+setText("detail-zone-borough", cell.borough || "");
+setText("detail-trips-per-hour", formatNumber(cell.trip_count || 0));
+setText("detail-avg-duration", formatDecimal(cell.avg_trip_duration));
+setText("detail-exposure-index", formatDecimal(cell.exposure_index));
+setText("detail-revenue-stability", formatDecimal(cell.stability_score));
+setText("detail-risk-score", formatDecimal(cell.risk_score));
+return;
+}
+}
 try {
 const res = await fetch("/api/zone/" + encodeURIComponent(idValue) + "?hour=" + currentHour);
 if (!res.ok) {
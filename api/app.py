@@ -1,6 +1,10 @@
 import os
 import sys
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import json
+import numpy as np
+import mysql.connector
+from datetime import date
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 
 # Figure out where this file is so we can find other project files
 DSA_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -8,13 +12,69 @@ PROJECT_ROOT = os.path.dirname(DSA_DIR)
 if DSA_DIR not in sys.path:
     sys.path.append(DSA_DIR)
 
-from database_config import get_connection
+from database_config import get_connection, get_pool_stats
+from metrics_store import ZoneHourlyStore
+from risk_scorer import DriverScore, RISK_LEVELS
+from driver_scores import fetch_stored_score, is_current, score_row, upsert_scores
+from http_cache import conditional_get, init_http_cache
 
 # Where the HTML, JS, and CSS files live
 FRONTEND_PATH = os.path.join(PROJECT_ROOT, 'frontend')
 
+# Most zones returned by one /api/top_zones page
+MAX_TOP_ZONES_LIMIT = 500
+
+# Batch scoring limits
+MAX_BATCH_SIZE = 50000          # most driver_ids accepted in one request
+BATCH_STREAM_THRESHOLD = 1000   # stream the response once there are more results than this
+BATCH_STREAM_CHUNK = 1000       # results per streamed chunk
+
 app = Flask(__name__)
 
+# Zone x hour metrics live in memory; this loads them now and reloads after each pipeline run
+zone_store = ZoneHourlyStore()
+zone_store.start()
+
+
+def data_version():
+    # Changes every time the pipeline reruns, so it doubles as the ETag / Last-Modified source
+    grid = zone_store.grid
+    return grid.version if grid is not None else None
+
+
+# 304s for unchanged GETs, gzip/brotli for JSON bodies
+init_http_cache(app)
+
+
+def parse_date_range():
+    # Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD (pickup dates, both included); raises ValueError if bad
+    dates = []
+    for name in ('start', 'end'):
+        value = request.args.get(name) or None
+        try:
+            dates.append(date.fromisoformat(value) if value else None)
+        except ValueError:
+            raise ValueError(f"{name} must be a date like 2024-01-31")
+    start, end = dates
+    if start and end and start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+
+def grid_for_dates(grid, start, end):
+    # The grid to answer from: the full history, or just the trips between start and end
+    # Returns (grid, None) or (None, error response)
+    if start is None and end is None:
+        return grid, None
+    if grid.daily is None:
+        return None, (jsonify({"error": "Date ranges are not available until the daily rollup is built"}), 503)
+    window = grid.window(start, end)
+    if window is None:
+        return None, (jsonify({"error": f"No trips between {start or 'the start'} and {end or 'the end'} "
+                                        f"(data covers {grid.daily.first_day} to {grid.daily.last_day})"}), 404)
+    return window, None
+
+
 # Home page
 @app.route("/")
 def home():
@@ -25,146 +85,100 @@ def dashboard():
     return send_from_directory(FRONTEND_PATH, 'dashboard.html')
 
 @app.route('/api/overview', methods=['GET'])
+@conditional_get(data_version)
 def get_overview():
 
-    conn = get_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    grid = zone_store.get()
+    data = grid.overview if grid is not None else None
 
-    try:
-        cursor.execute("SELECT * FROM overview_metrics WHERE id = 1;")
-        data = cursor.fetchone()
-        
-        if not data:
-            return jsonify({"error": "No overview metrics found"}), 404
-
-        response = {
-            "total_trips": data.get("total_trips", 0),
-            "high_risk_zones_count": data.get("high_risk_zones", 0),
-            "peak_exposure_hour": data.get("peak_exposure_hour", 0),
-            "revenue_volatility_score": data.get("avg_revenue_volatility", 0)
-        }
+    if not data:
+        return jsonify({"error": "No overview metrics found"}), 404
 
-        return jsonify(response)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    response = {
+        "total_trips": data.get("total_trips", 0),
+        "high_risk_zones_count": data.get("high_risk_zones", 0),
+        "peak_exposure_hour": data.get("peak_exposure_hour", 0),
+        "revenue_volatility_score": data.get("avg_revenue_volatility", 0)
+    }
+
+    return jsonify(response)
 
 @app.route('/api/zone/<int:zone_id>', methods=['GET'])
+@conditional_get(data_version)
 def get_zone_details(zone_id):
 
     hour = request.args.get('hour', type=int)
 
     if hour is None:
         return jsonify({"error": "Hour parameter is required"}), 400
-
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
-        SELECT zone_name, trip_count,
-               avg_trip_duration, exposure_index,
-               revenue_volatility, stability_score, risk_score
-        FROM zone_hourly_metrics
-        WHERE zone_id = %s AND hour = %s;
-    """, (zone_id, hour))
-
-    data = cursor.fetchone()
-
-    cursor.close()
-    conn.close()
-
-    if not data:
+    try:
+        start, end = parse_date_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
+    grid, error = grid_for_dates(grid, start, end)
+    if error:
+        return error
+
+    response = grid.zone_hour(zone_id, hour)
+    if not response:
         return jsonify({"error": "Zone or hour not found"}), 404
 
-    response = {
-        "zone_name": data["zone_name"],
-        "trip_count": data["trip_count"],
-        "avg_trip_duration": data["avg_trip_duration"],
-        "exposure_index": data["exposure_index"],
-        "revenue_volatility": data["revenue_volatility"],
-        "stability_score": data["stability_score"],
-        "risk_score": data["risk_score"]
-    }
-
     return jsonify(response)
 
 
 # Returns total trips for each hour (0-23) so the density chart can draw in one request
 @app.route('/api/hourly_density', methods=['GET'])
+@conditional_get(data_version)
 def get_hourly_density():
-    conn = get_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
 
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT hour, SUM(trip_count) AS total_trips
-            FROM zone_hourly_metrics
-            GROUP BY hour
-            ORDER BY hour;
-        """)
-        rows = cursor.fetchall()
-        result = {}
-        for r in rows:
-            result[r["hour"]] = r["total_trips"] or 0
-        # Fill in any missing hours with 0
-        response = []
-        for h in range(24):
-            response.append({"hour": h, "total_trips": int(result.get(h, 0))})
-        return jsonify(response)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    return jsonify(grid.hourly_density())
 
 
 @app.route('/api/top_zones', methods=['GET'])
+@conditional_get(data_version)
 def get_top_zones():
     hour = request.args.get('hour', type=int)
     if hour is None:
         return jsonify({"error": "Hour parameter is required"}), 400
 
-    conn = get_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cursor = conn.cursor(dictionary=True)
+    limit = request.args.get('limit', 10, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    min_trips = request.args.get('min_trips', type=int)
+    borough = request.args.get('borough') or None
+    if not 1 <= limit <= MAX_TOP_ZONES_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {MAX_TOP_ZONES_LIMIT}"}), 400
+    if offset < 0 or (min_trips is not None and min_trips < 0):
+        return jsonify({"error": "offset and min_trips can't be negative"}), 400
     try:
-        cursor.execute("""
-            SELECT zhm.zone_id, zhm.zone_name, COALESCE(z.borough, '') AS borough,
-                   zhm.risk_score, zhm.trip_count, zhm.exposure_index
-            FROM zone_hourly_metrics zhm
-            LEFT JOIN Zone z ON zhm.zone_id = z.zone_id
-            WHERE zhm.hour = %s
-            ORDER BY zhm.risk_score DESC
-            LIMIT 10;
-        """, (hour,))
+        start, end = parse_date_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        rows = cursor.fetchall()
-        response = []
-        for r in rows:
-            response.append({
-                "zone_id": r["zone_id"],
-                "zone_name": r["zone_name"],
-                "borough": r.get("borough", ""),
-                "risk_score": r.get("risk_score", 0),
-                "trip_count": r.get("trip_count", 0),
-                "exposure_score": r.get("exposure_index", 0)
-            })
-
-        return jsonify(response)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
+    grid, error = grid_for_dates(grid, start, end)
+    if error:
+        return error
+
+    return jsonify(grid.top_zones(hour, limit=limit, offset=offset, borough=borough, min_trips=min_trips))
+
+# The full zones x 24 grid in one response so the dashboard can switch hours without refetching
+@app.route('/api/snapshot', methods=['GET'])
+@conditional_get(data_version)
+def get_snapshot():
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
+
+    return jsonify(grid.snapshot())
 
 @app.route('/api/driver-risk', methods=['POST'])
 def calculate_driver_risk():
@@ -175,138 +189,109 @@ def calculate_driver_risk():
     
     if not driver_id:
         return jsonify({"error": "driver_id is required"}), 400
+
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
+    scorer = grid.scorer
     
     conn = get_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
     cursor = conn.cursor(dictionary=True)
+    try:
+        # Fast path: the driver and their precomputed score in one primary-key read
+        try:
+            driver = fetch_stored_score(cursor, driver_id)
+        except mysql.connector.errors.ProgrammingError:
+            # driver_risk_scores hasn't been built yet, so just look the driver up
+            cursor.execute("SELECT user_id, user_name FROM user WHERE user_id = %s;", (driver_id,))
+            driver = cursor.fetchone()
+
+        # Scores from before the zone risks last changed are worked out again below
+        if driver and is_current(driver, grid.version):
+            score = DriverScore(
+                float(driver["composite_risk_score"]),
+                driver["risk_level"],
+                driver["total_trips"],
+                {z: scorer.zone_name(z) or "Unknown" for z in driver["zone_ids"]},
+                driver["hours"]
+            )
+            return jsonify(render_driver_risk(driver, score))
     
-    # Check if this driver exists in the database
-    cursor.execute("SELECT user_id, user_name FROM user WHERE user_id = %s;", (driver_id,))
-    driver = cursor.fetchone()
-    
-    if not driver:
-        # Tell the user how many drivers we actually have
-        cursor.execute("SELECT MIN(user_id), MAX(user_id), COUNT(*) FROM user;")
-        info = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        total = info["COUNT(*)"] if info else 0
-        max_id = info["MAX(user_id)"] if info else 0
-        return jsonify({"error": f"Driver ID {driver_id} not found. We have {total} drivers (IDs 1-{max_id})."}), 404
-    
-    # Get all the zones and hours this driver has worked in
-    cursor.execute("""
-        SELECT driver_id, zone_id, hour, trips_in_period, avg_risk_in_zone
-        FROM driver_operations
-        WHERE driver_id = %s
-        ORDER BY hour, zone_id;
-    """, (driver_id,))
-    
-    operations = cursor.fetchall()
+        if not driver:
+            # Tell the user how many drivers we actually have
+            cursor.execute("SELECT MIN(user_id), MAX(user_id), COUNT(*) FROM user;")
+            info = cursor.fetchone()
+            total = info["COUNT(*)"] if info else 0
+            max_id = info["MAX(user_id)"] if info else 0
+            return jsonify({"error": f"Driver ID {driver_id} not found. We have {total} drivers (IDs 1-{max_id})."}), 404
     
-    if not operations:
-        # No records found, so make some from the zone metrics as a fallback
-        import random
-        rng = random.Random(driver_id)
-        cursor.execute("SELECT zone_id, hour, risk_score FROM zone_hourly_metrics WHERE risk_score > 0 ORDER BY zone_id, hour;")
-        all_metrics = cursor.fetchall()
-        if not all_metrics:
-            cursor.close()
-            conn.close()
-            return jsonify({"error": "No zone metrics available to generate a profile"}), 500
-        # Pick a few random zone-hour combos for this driver
-        sample_size = min(rng.randint(3, 6), len(all_metrics))
-        chosen = rng.sample(all_metrics, sample_size)
-        for m in chosen:
-            trips = rng.randint(5, 40)
-            cursor.execute(
-                "INSERT INTO driver_operations (driver_id, zone_id, hour, trips_in_period, avg_risk_in_zone) VALUES (%s,%s,%s,%s,%s);",
-                (driver_id, m['zone_id'], m['hour'], trips, m['risk_score'])
-            )
-        conn.commit()
-        # Now grab those new records
+        # Get all the zones and hours this driver has worked in
         cursor.execute("""
-            SELECT driver_id, zone_id, hour, trips_in_period, avg_risk_in_zone
+            SELECT zone_id, hour, trips_in_period
             FROM driver_operations
             WHERE driver_id = %s
             ORDER BY hour, zone_id;
         """, (driver_id,))
-        operations = cursor.fetchall()
-    
-    # Look up zone names and add up the risk across all trips
-    operating_zones = {}
-    operating_hours = set()
-    total_risk = 0
-    total_trips = 0
-    valid_operations = []
-    
-    for op in operations:
-        zone_id = op["zone_id"]
-        hour = op["hour"]
-        trips = op["trips_in_period"]
-        risk = op["avg_risk_in_zone"]
-        
-        # Look up the zone name if we haven't already
-        if zone_id not in operating_zones:
-            cursor.execute("SELECT zone_id, zone_name FROM zone_hourly_details WHERE zone_id = %s AND hour = %s LIMIT 1;", (zone_id, hour))
-            zone_info = cursor.fetchone()
-            if zone_info:
-                operating_zones[zone_id] = zone_info["zone_name"]
-                valid_operations.append(op)
-            else:
-                continue  # Skip this operation if zone doesn't exist
-        else:
-            valid_operations.append(op)
-        
-        operating_hours.add(hour)
-        total_trips += trips
-        total_risk += risk * trips  # Weighted by trip count
     
-    cursor.close()
-    conn.close()
-    
-    # Work out the final risk score (10 = safest, 80 = riskiest)
-    # We weight each zone's risk by how many trips the driver made there
-    raw_risk = (total_risk / total_trips) if total_trips > 0 else 0.0  # 0-1 scale
-    composite_risk = 10 + (raw_risk * 70)  # maps 0->10, 1->80
-    composite_risk = min(80, max(10, round(composite_risk, 2)))
+        operations = cursor.fetchall()
     
-    # Decide the risk label based on the score
-    if composite_risk < 25:
-        risk_level = "Low"
-    elif composite_risk < 45:
-        risk_level = "Medium"
-    elif composite_risk < 65:
-        risk_level = "High"
-    else:
-        risk_level = "Very High"
+        if not operations:
+            # No records found, so make some from the zone metrics as a fallback
+            import random
+            rng = random.Random(driver_id)
+            rows, hours = np.nonzero(scorer.risk > 0)
+            all_metrics = [
+                {"zone_id": int(scorer.zone_ids[r]), "hour": int(h), "risk": float(scorer.risk[r, h])}
+                for r, h in zip(rows, hours)
+            ]
+            if not all_metrics:
+                return jsonify({"error": "No zone metrics available to generate a profile"}), 500
+            # Pick a few random zone-hour combos for this driver
+            sample_size = min(rng.randint(3, 6), len(all_metrics))
+            chosen = rng.sample(all_metrics, sample_size)
+            for m in chosen:
+                trips = rng.randint(5, 40)
+                cursor.execute(
+                    "INSERT INTO driver_operations (driver_id, zone_id, hour, trips_in_period, avg_risk_in_zone) VALUES (%s,%s,%s,%s,%s);",
+                    (driver_id, m['zone_id'], m['hour'], trips, m['risk'])
+                )
+                operations.append({"zone_id": m['zone_id'], "hour": m['hour'], "trips_in_period": trips})
+
+        # Weight each zone's risk by how many trips the driver made there (10 = safest, 80 = riskiest)
+        score = scorer.score(
+            [op["zone_id"] for op in operations],
+            [op["hour"] for op in operations],
+            [op["trips_in_period"] for op in operations]
+        )
+
+        # Save it so the next lookup for this driver is a single read
+        try:
+            upsert_scores(cursor, [score_row(driver_id, score, grid.version)])
+        except mysql.connector.errors.ProgrammingError:
+            pass
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return jsonify(render_driver_risk(driver, score))
+
+
+def render_driver_risk(driver, score):
+    # Turns a DriverScore into the response shown on the driver page
+    operating_zones = score.zones
+    operating_hours = score.hours
+    total_trips = score.total_trips
+    composite_risk = score.composite_risk
+    risk_level = score.risk_level
     
     # Build nice text for zones and hours
     zones_list = ", ".join([f"{operating_zones[z]} (Zone {z})" for z in sorted(operating_zones.keys())])
     hours_list = ", ".join([f"{h}:00" for h in sorted(operating_hours)])
     
-    # Put together the explanation text
-    zone_details = []
-    hour_details = []
-    
-    for op in valid_operations:
-        zone_id = op["zone_id"]
-        hour = op["hour"]
-        trips = op["trips_in_period"]
-        risk = op["avg_risk_in_zone"]
-        
-        zone_name = operating_zones.get(zone_id, "Unknown")
-        risk_desc = "Low" if risk < 0.33 else ("Medium" if risk < 0.67 else "High")
-        zone_details.append(f"{zone_name} - you did {trips} trips here, risk is {risk_desc}")
-        
-        if hour not in [h["hour"] for h in hour_details]:
-            hour_details.append({"hour": hour, "trips": 0})
-    
-    # Add up trips per hour
-    for op in valid_operations:
-        for h in hour_details:
-            if h["hour"] == op["hour"]:
-                h["trips"] += op["trips_in_period"]
-    
     # The full explanation shown to the driver
     explanation_text = f"""
 Here is how we worked out your risk score:
@@ -367,7 +352,98 @@ Here is how we worked out your risk score:
         }
     }
     
-    return jsonify(response)
+    return response
+
+
+@app.route('/api/driver-risk/batch', methods=['POST'])
+def calculate_driver_risk_batch():
+    # Scores many drivers (or "all") with one query and no explanation text
+    data = request.get_json(silent=True) or {}
+    driver_ids = data.get('driver_ids')
+
+    if driver_ids == "all":
+        driver_ids = None
+    elif (isinstance(driver_ids, list) and driver_ids
+          and all(isinstance(d, int) and not isinstance(d, bool) for d in driver_ids)):
+        driver_ids = sorted(set(driver_ids))
+        if len(driver_ids) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} driver_ids per batch"}), 400
+    else:
+        return jsonify({"error": 'driver_ids must be a list of integers or "all"'}), 400
+
+    grid = zone_store.get()
+    if grid is None:
+        return jsonify({"error": "Zone metrics are not loaded"}), 500
+
+    conn = get_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    cursor = conn.cursor()
+    try:
+        # Every requested driver plus all their operations, in one round trip
+        query = """
+            SELECT u.user_id, d.zone_id, d.hour, d.trips_in_period
+            FROM user u
+            LEFT JOIN driver_operations d ON d.driver_id = u.user_id
+        """
+        if driver_ids is None:
+            cursor.execute(query + " ORDER BY u.user_id;")
+        else:
+            placeholders = ", ".join(["%s"] * len(driver_ids))
+            cursor.execute(query + f" WHERE u.user_id IN ({placeholders}) ORDER BY u.user_id;", driver_ids)
+        rows = cursor.fetchall()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    found = {r[0] for r in rows}
+    not_found = [] if driver_ids is None else [d for d in driver_ids if d not in found]
+    ops = [r for r in rows if r[1] is not None]
+
+    # Zones the scorer doesn't know are skipped, same as the single-driver endpoint
+    drivers, composite, levels, trips, zones, hours = grid.scorer.score_many(
+        [r[0] for r in ops], [r[1] for r in ops], [r[2] for r in ops], [r[3] for r in ops])
+    scored = set(drivers.tolist())
+    results = [
+        {
+            "driver_id": d,
+            "score": s,
+            "level": RISK_LEVELS[l],
+            "trips": t,
+            "zones": z,
+            "hours": h
+        }
+        for d, s, l, t, z, h in zip(drivers.tolist(), composite.tolist(), levels.tolist(),
+                                    trips.tolist(), zones.tolist(), hours.tolist())
+    ]
+    no_operations = sorted(found - scored)
+
+    if len(results) <= BATCH_STREAM_THRESHOLD:
+        return jsonify({
+            "count": len(results),
+            "results": results,
+            "not_found": not_found,
+            "no_operations": no_operations
+        })
+
+    # Big batches go out in chunks so the whole JSON body is never built at once
+    def generate():
+        yield '{"count": %d, "not_found": %s, "no_operations": %s, "results": [' % (
+            len(results), json.dumps(not_found), json.dumps(no_operations))
+        for start in range(0, len(results), BATCH_STREAM_CHUNK):
+            chunk = json.dumps(results[start:start + BATCH_STREAM_CHUNK])[1:-1]
+            yield ("," if start else "") + chunk
+        yield "]}"
+
+    return Response(generate(), mimetype="application/json")
+
+# Shows how the database connection pool is doing (in use, idle, wait times)
+@app.route('/api/pool_stats', methods=['GET'])
+def pool_stats():
+    return jsonify(get_pool_stats())
 
 # Serve any other file from the frontend folder (must be the last route)
 @app.route("/<path:filename>")
@@ -1,5 +1,7 @@
 import os
 import sys
+import threading
+import time
 import mysql.connector
 
 # Figure out where this file is so we can find other project files
@@ -8,20 +10,208 @@ PROJECT_ROOT = os.path.dirname(DSA_DIR)
 if DSA_DIR not in sys.path:
     sys.path.append(DSA_DIR)
 
-# Connect to the MySQL database and return the connection
+# Login details for MySQL (override with environment variables if needed)
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("DB_PORT", 3306)),
+    "user": os.environ.get("DB_USER", "trials_user"),
+    "password": os.environ.get("DB_PASSWORD", "trials_pass"),
+    "database": os.environ.get("DB_NAME", "nyc_taxi_temp"),
+    "auth_plugin": "mysql_native_password"
+}
+
+# Pool settings
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))              # most connections open at once
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))       # seconds to wait for a free connection
+POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))  # recycle connections older than this
+
+
+class PooledConnection:
+    """Wraps a MySQL connection so that close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._returned = False
+        self.created_at = time.monotonic()
+
+    def __getattr__(self, name):
+        # Anything we don't handle ourselves goes straight to the real connection
+        return getattr(self._raw, name)
+
+    def close(self):
+        """Give the connection back to the pool instead of closing the socket"""
+        if not self._returned:
+            self._returned = True
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    """A fixed-size pool of MySQL connections with borrow/return and usage stats"""
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME, **config):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.config = config or DB_CONFIG
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._stats = {
+            "borrows": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "created": 0,
+            "recycled": 0,
+            "failed_health_checks": 0
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._stats["created"] += 1
+        return raw
+
+    def _expired(self, raw_created_at):
+        return self.max_lifetime and time.monotonic() - raw_created_at > self.max_lifetime
+
+    def _healthy(self, raw):
+        # Cheap round trip to make sure the server didn't drop us while idle
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def borrow(self):
+        """Take a connection from the pool, waiting up to `timeout` seconds if all are busy"""
+        start = time.monotonic()
+        waited = False
+        with self._lock:
+            while not self._idle and self._in_use >= self.size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise mysql.connector.errors.PoolError(
+                        f"No free connection after {self.timeout}s ({self.size} in use)")
+                self._lock.wait(remaining)
+
+            entry = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            wait_time = time.monotonic() - start
+            self._stats["borrows"] += 1
+            self._stats["total_wait_time"] += wait_time
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], wait_time)
+            if waited:
+                self._stats["waits"] += 1
+
+        # Connect / health check outside the lock so other threads aren't held up
+        try:
+            if entry is not None:
+                raw, created_at = entry
+                if self._expired(created_at):
+                    self._discard(raw)
+                    with self._lock:
+                        self._stats["recycled"] += 1
+                    entry = None
+                elif not self._healthy(raw):
+                    self._discard(raw)
+                    with self._lock:
+                        self._stats["failed_health_checks"] += 1
+                    entry = None
+
+            if entry is None:
+                conn = PooledConnection(self, self._connect())
+            else:
+                conn = PooledConnection(self, raw)
+                conn.created_at = created_at
+            return conn
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn):
+        """Put a borrowed connection back so the next request can use it"""
+        raw = conn._raw
+        keep = not self._expired(conn.created_at)
+        if keep:
+            try:
+                # Don't let half-finished transactions leak into the next borrower
+                if raw.in_transaction:
+                    raw.rollback()
+            except mysql.connector.Error:
+                keep = False
+
+        with self._lock:
+            self._in_use -= 1
+            if keep:
+                self._idle.append((raw, conn.created_at))
+            else:
+                self._stats["recycled"] += 1
+            self._lock.notify()
+
+        if not keep:
+            self._discard(raw)
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Snapshot of how the pool is being used"""
+        with self._lock:
+            borrows = self._stats["borrows"]
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "borrows": borrows,
+                "waits": self._stats["waits"],
+                "timeouts": self._stats["timeouts"],
+                "avg_wait_ms": round(self._stats["total_wait_time"] / borrows * 1000, 3) if borrows else 0.0,
+                "max_wait_ms": round(self._stats["max_wait_time"] * 1000, 3),
+                "created": self._stats["created"],
+                "recycled": self._stats["recycled"],
+                "failed_health_checks": self._stats["failed_health_checks"]
+            }
+
+    def close_all(self):
+        """Close every idle connection (busy ones are closed when they come back)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Build the shared pool the first time someone asks for it
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**DB_CONFIG)
+    return _pool
+
+
+# Borrow a connection from the shared pool (call conn.close() to give it back)
 def get_connection():
     try:
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="trials_user",
-            password="trials_pass",
-            database="nyc_taxi_temp",
-            auth_plugin="mysql_native_password"
-        )
-        return conn
+        return get_pool().borrow()
     except mysql.connector.Error as err:
         print(f"Error: {err}")
         return None
 
 
-
+def get_pool_stats():
+    return get_pool().stats()
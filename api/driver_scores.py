@@ -0,0 +1,98 @@
+# Reads and writes the precomputed driver_risk_scores table
+# The pipeline fills it (database/refresh_driver_scores.py) so /api/driver-risk is one primary-key read
+# zone_risk_version is the overview_metrics.last_updated of the zone risks a score was worked out from,
+# so the API can tell a score from before the last populate_precomputed_tables.py run and redo it
+
+import json
+
+CREATE_DRIVER_RISK_SCORES = """
+    CREATE TABLE IF NOT EXISTS driver_risk_scores (
+        driver_id             INT           NOT NULL,
+        composite_risk_score  DECIMAL(5,2)  NOT NULL,
+        risk_level            VARCHAR(10)   NOT NULL,
+        total_trips           INT           NOT NULL DEFAULT 0,
+        zone_count            INT           NOT NULL DEFAULT 0,
+        hour_count            INT           NOT NULL DEFAULT 0,
+        zone_ids              JSON          NOT NULL,
+        hours                 JSON          NOT NULL,
+        zone_risk_version     DATETIME      DEFAULT NULL,
+        computed_at           TIMESTAMP     DEFAULT CURRENT_TIMESTAMP
+                                            ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (driver_id),
+        FOREIGN KEY (driver_id) REFERENCES user(user_id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;
+"""
+
+UPSERT_DRIVER_RISK_SCORE = """
+    INSERT INTO driver_risk_scores
+        (driver_id, composite_risk_score, risk_level, total_trips, zone_count, hour_count, zone_ids, hours,
+         zone_risk_version)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        composite_risk_score = VALUES(composite_risk_score),
+        risk_level = VALUES(risk_level),
+        total_trips = VALUES(total_trips),
+        zone_count = VALUES(zone_count),
+        hour_count = VALUES(hour_count),
+        zone_ids = VALUES(zone_ids),
+        hours = VALUES(hours),
+        zone_risk_version = VALUES(zone_risk_version),
+        computed_at = CURRENT_TIMESTAMP;
+"""
+
+
+def create_table(cursor):
+    # driver_risk_scores, with zone_risk_version added to tables made before it existed
+    cursor.execute(CREATE_DRIVER_RISK_SCORES)
+    cursor.execute("SHOW COLUMNS FROM driver_risk_scores LIKE 'zone_risk_version';")
+    if not cursor.fetchall():
+        cursor.execute("ALTER TABLE driver_risk_scores ADD COLUMN zone_risk_version DATETIME DEFAULT NULL AFTER hours;")
+
+
+def score_row(driver_id, score, version=None):
+    # One driver_risk_scores row from a DriverScore worked out from the zone risks at version
+    zone_ids = sorted(score.zones)
+    return (
+        int(driver_id),
+        round(float(score.composite_risk), 2),
+        score.risk_level,
+        int(score.total_trips),
+        len(zone_ids),
+        len(score.hours),
+        json.dumps(zone_ids),
+        json.dumps(list(score.hours)),
+        version
+    )
+
+
+def fetch_stored_score(cursor, driver_id):
+    # The driver and their stored score in one primary-key lookup
+    # Returns None if the driver doesn't exist; score columns are None if not computed yet
+    cursor.execute("""
+        SELECT u.user_id, u.user_name,
+               s.composite_risk_score, s.risk_level, s.total_trips, s.zone_ids, s.hours, s.zone_risk_version
+        FROM user u
+        LEFT JOIN driver_risk_scores s ON s.driver_id = u.user_id
+        WHERE u.user_id = %s;
+    """, (driver_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    for key in ("zone_ids", "hours"):
+        if isinstance(row.get(key), (str, bytes)):
+            row[key] = json.loads(row[key])
+    return row
+
+
+def is_current(row, version):
+    # True if a stored score was worked out from the zone risks at version (or there's nothing to compare)
+    if row.get("composite_risk_score") is None:
+        return False
+    if version is None:
+        return True
+    return row.get("zone_risk_version") is not None and row["zone_risk_version"] >= version
+
+
+def upsert_scores(cursor, rows):
+    if rows:
+        cursor.executemany(UPSERT_DRIVER_RISK_SCORE, rows)
@@ -0,0 +1,114 @@
+# HTTP caching helpers for the JSON API
+# ETag/Last-Modified come from the data version, so repeat visits get a 304 instead of a body,
+# and JSON bodies are compressed with brotli (if installed) or gzip
+
+import os
+import gzip
+import hashlib
+import functools
+from datetime import timezone
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# How long browsers may reuse a response before checking back (seconds)
+CACHE_MAX_AGE = int(os.environ.get("API_CACHE_MAX_AGE", 60))
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 500
+
+# Compressed bodies are kept per (ETag, encoding) so each one is only compressed once
+COMPRESSED_CACHE_SIZE = 512
+_compressed = {}
+
+
+def _as_utc(version):
+    # MySQL TIMESTAMPs come back naive; treat them as UTC for the HTTP date headers
+    if version.tzinfo is None:
+        return version.replace(tzinfo=timezone.utc)
+    return version
+
+
+def conditional_get(version_fn):
+    # Decorator for GET views whose output only changes when the data version does
+    # version_fn returns the current version (a datetime) or None if it isn't known
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_fn()
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = hashlib.sha1(f"{version.isoformat()}|{request.full_path}".encode()).hexdigest()[:20]
+            last_modified = _as_utc(version)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and last_modified.replace(microsecond=0) <= since
+
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = CACHE_MAX_AGE
+            response.cache_control.must_revalidate = True
+            return response
+        return wrapper
+    return decorator
+
+
+def _pick_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    # after_request hook: compress JSON bodies the client says it can handle
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or response.mimetype != "application/json" or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _pick_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    etag, _ = response.get_etag()
+    key = (etag, encoding) if etag else None
+    body = _compressed.get(key) if key else None
+    if body is None:
+        if encoding == "br":
+            body = brotli.compress(data, quality=5)
+        else:
+            body = gzip.compress(data, compresslevel=6)
+        if key:
+            if len(_compressed) >= COMPRESSED_CACHE_SIZE:
+                _compressed.clear()
+            _compressed[key] = body
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_http_cache(app):
+    app.after_request(compress_response)
@@ -0,0 +1,79 @@
+# The zone-hour metric formulas, worked out from per zone-hour totals with integer maths
+# Shared by the pandas engine (database/aggregation_engine.py) and the date-range queries
+# (window_metrics.py) so both give exactly what populate_precomputed_tables.py stores: money and
+# scores are whole cents and MySQL's DECIMAL rounding (half away from zero, 4 extra digits on
+# division) is copied step by step.
+
+import math
+import numpy as np
+
+HOURS = 24
+
+# MySQL's div_precision_increment: a division result gets 4 more decimal places than its dividend
+DIV_DIGITS = 10 ** 4
+
+
+def div_round(num, den):
+    # num / den rounded to a whole number, halves away from zero (how MySQL rounds DECIMAL results)
+    # Works on int64 arrays or plain Python ints; den must be positive
+    if isinstance(num, np.ndarray):
+        return np.sign(num) * ((2 * np.abs(num) + den) // (2 * den))
+    return (1 if num >= 0 else -1) * ((2 * abs(num) + den) // (2 * den))
+
+
+def derive_metrics(trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum):
+    # zones x 24 int64 totals (minutes, fares in cents, squared fares in 1/10000ths) -> the
+    # zone_hourly_metrics columns in cents: exposure, duration, congestion and risk are zones x 24,
+    # volatility is one value per zone (the same for each of its hours)
+    n_zones = len(trip_count)
+    has_trips = trip_count > 0
+
+    # Exposure: ROUND((trip_count / hour max) * 100, 2) -> the 4-place quotient is already in cents
+    max_count = trip_count.max(axis=0) if n_zones else np.zeros(HOURS, dtype=np.int64)
+    exposure = np.zeros_like(trip_count)
+    exposure[has_trips] = div_round(trip_count[has_trips] * DIV_DIGITS,
+                                    np.broadcast_to(max_count, trip_count.shape)[has_trips])
+
+    # Duration: ROUND(duration_sum / trip_count, 2), the division first rounded to 4 places
+    duration = np.zeros_like(trip_count)
+    duration[has_trips] = div_round(div_round(duration_sum[has_trips] * DIV_DIGITS, trip_count[has_trips]), 100)
+
+    # Congestion: ROUND(duration * exposure / 100, 2) in cents
+    congestion = div_round(duration * exposure, 100 * 100)
+
+    # Volatility: population stddev of the zone's fares from count / sum / sum of squares,
+    # each division rounded to 4 more places exactly like the SQL expression
+    zone_fare_count = fare_count.sum(axis=1)
+    zone_fare_sum = fare_sum.sum(axis=1)
+    zone_fare_sq_sum = fare_sq_sum.sum(axis=1)
+    volatility = np.zeros(n_zones, dtype=np.int64)
+    for i in np.flatnonzero(zone_fare_count).tolist():
+        # The few hundred zones are done with Python ints, so nothing can overflow
+        n = int(zone_fare_count[i])
+        s1 = int(zone_fare_sum[i])                              # scale 2
+        s2 = int(zone_fare_sq_sum[i])                           # scale 4
+        mean_sq = div_round(s1 * s1 * DIV_DIGITS, n)            # s1 * s1 / n at scale 8
+        variance = div_round((s2 * DIV_DIGITS - mean_sq) * DIV_DIGITS, n)  # at scale 12
+        # SQRT works on doubles, and ROUND(double, 2) is rint(x * 100)
+        volatility[i] = int(np.rint(math.sqrt(max(variance, 0) / 10 ** 12) * 100))
+
+    # Risk: 0.4 x exposure + 0.3 x congestion scaled to 0-100 + 0.3 x volatility scaled to 0-100
+    # Maximums only look at zone-hours with trips; 1 if they're all zero
+    max_congestion = int(congestion[has_trips].max()) if has_trips.any() else 0
+    max_volatility = int(volatility[has_trips.any(axis=1)].max()) if has_trips.any() else 0
+    max_congestion = max_congestion or 100
+    max_volatility = max_volatility or 100
+
+    # (x / max) gets 6 places, x 100, x 0.3 -> 7 places; 0.4 x exposure -> 3 places; sum in 1e-7 units
+    congestion_part = div_round(congestion * 10 ** 6, max_congestion)
+    volatility_part = div_round(np.broadcast_to(volatility[:, None], trip_count.shape) * 10 ** 6, max_volatility)
+    total = 40000 * exposure + 300 * congestion_part + 300 * volatility_part
+    risk = div_round(total, 10 ** 5)
+
+    return {
+        "exposure": exposure,
+        "duration": duration,
+        "congestion": congestion,
+        "volatility": volatility,
+        "risk": risk
+    }
@@ -0,0 +1,175 @@
+# Binary snapshot of the zone x hour grid that the pipeline writes and the API memory-maps
+# Layout: fixed preamble (magic, format version, header length), a JSON header with the data version,
+# overview row, zone ids/names/boroughs and where each array lives, then one fixed-width
+# zones x 24 array per metric, each starting on a 64-byte boundary. If the grid had its daily rollup
+# attached, its running totals follow as (days + 1) x zones x 24 arrays, so date ranges need no queries.
+# Opening it costs one header parse; the arrays are views straight onto the mapped pages, so
+# every gunicorn worker shares the same physical memory through the page cache.
+
+import os
+import json
+import mmap
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+MAGIC = b"ZHMA"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sIQ")     # magic, format version, header length
+ALIGNMENT = 64
+
+# Default place the pipeline writes to and the API looks (override with METRICS_ARTIFACT_PATH)
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ARTIFACT_PATH = os.path.join(os.path.dirname(API_DIR), 'data', 'zone_hourly_metrics.zhm')
+
+# Arrays stored per grid, with their on-disk dtype (little-endian, fixed width)
+ARRAYS = (
+    ("trip_count", "<i8"),
+    ("exposure_index", "<f8"),
+    ("avg_trip_duration", "<f8"),
+    ("congestion_index", "<f8"),
+    ("revenue_volatility", "<f8"),
+    ("risk_score", "<f8"),
+    ("stability_score", "<f8"),
+    ("present", "|b1")
+)
+
+# The daily rollup's running totals are whole numbers (see window_metrics.py)
+DAILY_DTYPE = "<i8"
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _overview_to_json(overview):
+    if overview is None:
+        return None
+    out = {}
+    for key, value in overview.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        out[key] = value
+    return out
+
+
+def _overview_from_json(overview):
+    # Put back the types the MySQL row had so /api/overview renders the same either way
+    if overview is None:
+        return None
+    if overview.get("last_updated"):
+        overview["last_updated"] = datetime.fromisoformat(overview["last_updated"])
+    if overview.get("avg_revenue_volatility") is not None:
+        overview["avg_revenue_volatility"] = Decimal(overview["avg_revenue_volatility"])
+    return overview
+
+
+def write_artifact(grid, path=DEFAULT_ARTIFACT_PATH):
+    # Write the grid next to the final path and rename it into place, so a reader either
+    # maps the old file or the new one, never a half-written one
+    header = {
+        "version": grid.version.isoformat() if grid.version is not None else None,
+        "overview": _overview_to_json(grid.overview),
+        "zones": grid.zone_count,
+        "hours": grid.trip_count.shape[1],
+        "zone_ids": [int(z) for z in grid.zone_ids],
+        "zone_names": grid.zone_names,
+        "boroughs": grid.boroughs,
+        "arrays": {}
+    }
+
+    # Each blob is (where its spec goes in the header, name, data)
+    blobs = [(header["arrays"], name, np.ascontiguousarray(getattr(grid, name), dtype=dtype))
+             for name, dtype in ARRAYS]
+    daily = getattr(grid, "daily", None)
+    if daily is not None:
+        header["daily"] = {"first_day": daily.first_day.isoformat(), "days": daily.days, "arrays": {}}
+        blobs += [(header["daily"]["arrays"], name, np.ascontiguousarray(sums, dtype=DAILY_DTYPE))
+                  for name, sums in daily.sums.items()]
+
+    # Header size depends on the offsets, so lay out the arrays after a generous guess and retry if needed
+    start = 0
+    while True:
+        offset = start
+        for specs, name, data in blobs:
+            offset = _align(offset)
+            specs[name] = {"dtype": data.dtype.str, "offset": offset}
+            offset += data.nbytes
+        encoded = json.dumps(header).encode("utf-8")
+        needed = _align(PREAMBLE.size + len(encoded))
+        if needed <= start:
+            break
+        start = needed
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+        f.write(encoded)
+        for specs, name, data in blobs:
+            f.seek(specs[name]["offset"])
+            f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_header(f):
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) != PREAMBLE.size:
+        raise ArtifactError("file is too short")
+    magic, fmt, header_len = PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ArtifactError("not a zone metrics artifact")
+    if fmt != FORMAT_VERSION:
+        raise ArtifactError(f"format version {fmt} (expected {FORMAT_VERSION})")
+    return json.loads(f.read(header_len).decode("utf-8"))
+
+
+def read_version(path=DEFAULT_ARTIFACT_PATH):
+    # Just the data version, without mapping the arrays (for cheap change checks)
+    with open(path, "rb") as f:
+        version = _read_header(f)["version"]
+    return datetime.fromisoformat(version) if version else None
+
+
+def _map_array(mapped, name, spec, shape):
+    dtype = np.dtype(spec["dtype"])
+    count = int(np.prod(shape))
+    if spec["offset"] + dtype.itemsize * count > len(mapped):
+        raise ArtifactError(f"{name} runs past the end of the file")
+    return np.frombuffer(mapped, dtype=dtype, count=count, offset=spec["offset"]).reshape(shape)
+
+
+def open_artifact(path=DEFAULT_ARTIFACT_PATH):
+    # Map the file read-only; the arrays returned are views into the mapping, not copies
+    # Returns the header fields plus "arrays" ({name: zones x hours array}) and "mapping"; "daily" is
+    # None or {"first_day", "days", "arrays": {total: (days + 1) x zones x hours array}}
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    shape = (header["zones"], header["hours"])
+    arrays = {name: _map_array(mapped, name, header["arrays"][name], shape) for name, _ in ARRAYS}
+
+    daily = header.get("daily")
+    if daily is not None:
+        daily_shape = (daily["days"] + 1,) + shape
+        daily["first_day"] = date.fromisoformat(daily["first_day"])
+        daily["arrays"] = {name: _map_array(mapped, name, spec, daily_shape)
+                           for name, spec in daily["arrays"].items()}
+    header["daily"] = daily
+
+    header["version"] = datetime.fromisoformat(header["version"]) if header["version"] else None
+    header["overview"] = _overview_from_json(header["overview"])
+    header["arrays"] = arrays
+    header["mapping"] = mapped
+    return header
@@ -0,0 +1,415 @@
+# Keeps the zone x hour metrics grid in memory so the read endpoints never hit MySQL
+
+import os
+import threading
+import numpy as np
+
+from database_config import get_connection
+from risk_scorer import DriverRiskScorer
+import metrics_artifact
+import window_metrics
+
+HOURS = 24
+
+# How often (seconds) the background thread checks whether the pipeline has run again
+REFRESH_INTERVAL = float(os.environ.get("METRICS_REFRESH_INTERVAL", 30))
+
+# Binary grid written by `populate_precomputed_tables.py --artifact`; when set, the grid is
+# memory-mapped from this file instead of being read out of MySQL
+ARTIFACT_PATH = os.environ.get("METRICS_ARTIFACT_PATH") or None
+
+# Date-range grids kept per grid, so repeat queries for the same range don't redo the maths
+WINDOW_CACHE_SIZE = 64
+
+# Columns copied out of zone_hourly_metrics, in the order they are stored in the grid
+METRIC_COLUMNS = (
+    "trip_count",
+    "exposure_index",
+    "avg_trip_duration",
+    "congestion_index",
+    "revenue_volatility",
+    "risk_score"
+)
+
+
+def _round(value):
+    return round(float(value), 2)
+
+
+class ZoneHourlyGrid:
+    """Read-only copy of zone_hourly_metrics stored as zones x 24 arrays"""
+
+    def __init__(self, zone_ids, zone_names, boroughs, metrics, present, version=None, overview=None,
+                 stability_score=None):
+        self.zone_ids = np.asarray(zone_ids, dtype=np.int32)
+        self.zone_names = list(zone_names)
+        self.boroughs = list(boroughs)
+        self.zone_index = {int(z): i for i, z in enumerate(self.zone_ids)}
+        self.present = np.asarray(present, dtype=bool)
+        self.version = version
+        self.overview = overview    # the overview_metrics row that was current when this grid loaded
+
+        self.trip_count = np.asarray(metrics["trip_count"], dtype=np.int64)
+        self.exposure_index = np.asarray(metrics["exposure_index"], dtype=np.float64)
+        self.avg_trip_duration = np.asarray(metrics["avg_trip_duration"], dtype=np.float64)
+        self.congestion_index = np.asarray(metrics["congestion_index"], dtype=np.float64)
+        self.revenue_volatility = np.asarray(metrics["revenue_volatility"], dtype=np.float64)
+        self.risk_score = np.asarray(metrics["risk_score"], dtype=np.float64)
+        # Stability is just the flip side of risk (same rule as the stability_score column)
+        if stability_score is None:
+            stability_score = np.round(100 - self.risk_score, 2)
+        self.stability_score = np.asarray(stability_score, dtype=np.float64)
+
+        # Totals for the density chart never change, so work them out once
+        self.hourly_totals = self.trip_count.sum(axis=0)
+        self._build_rankings()
+        self._scorer = None
+        self._snapshot = None
+        self.daily = None           # window_metrics.DailyRollup, attached by the store if the rollup exists
+        self._windows = {}
+        self._windows_lock = threading.Lock()
+
+    @property
+    def zone_count(self):
+        return len(self.zone_ids)
+
+    @property
+    def scorer(self):
+        # Driver scorer built from this grid's risk column (made on first use)
+        if self._scorer is None:
+            self._scorer = DriverRiskScorer.from_grid(self)
+        return self._scorer
+
+    def zone_hour(self, zone_id, hour):
+        # Everything the zone detail panel needs for one zone at one hour
+        i = self.zone_index.get(zone_id)
+        if i is None or not 0 <= hour < HOURS or not self.present[i, hour]:
+            return None
+        return {
+            "zone_name": self.zone_names[i],
+            "trip_count": int(self.trip_count[i, hour]),
+            "avg_trip_duration": _round(self.avg_trip_duration[i, hour]),
+            "exposure_index": _round(self.exposure_index[i, hour]),
+            "revenue_volatility": _round(self.revenue_volatility[i, hour]),
+            "stability_score": _round(self.stability_score[i, hour]),
+            "risk_score": _round(self.risk_score[i, hour])
+        }
+
+    def _build_rankings(self):
+        # Zone rows for each hour sorted riskiest first (ties keep zone order), plus the same
+        # rankings split by borough, so a page of top zones is just a slice
+        self.rankings = []
+        for hour in range(HOURS):
+            rows = np.flatnonzero(self.present[:, hour])
+            self.rankings.append(rows[np.argsort(-self.risk_score[rows, hour], kind="stable")])
+
+        borough_keys = np.array([(b or "").lower() for b in self.boroughs], dtype=object)
+        self.borough_rankings = {}
+        for key in set(borough_keys.tolist()):
+            in_borough = borough_keys == key
+            self.borough_rankings[key] = [order[in_borough[order]] for order in self.rankings]
+
+    def top_zones(self, hour, limit=10, offset=0, borough=None, min_trips=None):
+        # Riskiest zones for an hour, highest first, optionally for one borough and/or busy zones only
+        if not 0 <= hour < HOURS:
+            return []
+        if borough is None:
+            order = self.rankings[hour]
+        else:
+            by_hour = self.borough_rankings.get(borough.lower())
+            if by_hour is None:
+                return []
+            order = by_hour[hour]
+
+        if min_trips:
+            order = order[self.trip_count[order, hour] >= min_trips]
+        return [self._zone_summary(i, hour) for i in order[offset:offset + limit]]
+
+    def _zone_summary(self, i, hour):
+        return {
+            "zone_id": int(self.zone_ids[i]),
+            "zone_name": self.zone_names[i],
+            "borough": self.boroughs[i],
+            "risk_score": _round(self.risk_score[i, hour]),
+            "trip_count": int(self.trip_count[i, hour]),
+            "exposure_score": _round(self.exposure_index[i, hour])
+        }
+
+    def window(self, start=None, end=None):
+        # A grid with the same zones worked out from only the trips picked up between start and end
+        # (dates, both included). None if the daily rollup isn't loaded or has no days in the range.
+        if self.daily is None:
+            return None
+        key = (start, end)
+        with self._windows_lock:
+            grid = self._windows.get(key)
+        if grid is None:
+            # Worked out outside the lock; two requests for a new range at once just both do the maths
+            totals = self.daily.totals(start, end)
+            if totals is None:
+                return None
+            grid = ZoneHourlyGrid(self.zone_ids, self.zone_names, self.boroughs,
+                                  window_metrics.grid_metrics(totals),
+                                  np.ones_like(self.present), self.version)
+            with self._windows_lock:
+                if len(self._windows) >= WINDOW_CACHE_SIZE:
+                    self._windows.clear()
+                self._windows[key] = grid
+        return grid
+
+    def hourly_density(self):
+        return [{"hour": h, "total_trips": int(self.hourly_totals[h])} for h in range(HOURS)]
+
+    def snapshot(self):
+        # The whole grid in a columnar layout: zone lists once, then one flat array per metric
+        # Cell (zone i, hour h) sits at position i * 24 + h in every metric array
+        if self._snapshot is None:
+            def flat(values):
+                return np.round(values, 2).ravel().tolist()
+
+            self._snapshot = {
+                "version": self.version.isoformat() if self.version is not None else None,
+                "hours": HOURS,
+                "zone_ids": self.zone_ids.tolist(),
+                "zone_names": self.zone_names,
+                "boroughs": self.boroughs,
+                "metrics": {
+                    "trip_count": self.trip_count.ravel().tolist(),
+                    "exposure": flat(self.exposure_index),
+                    "duration": flat(self.avg_trip_duration),
+                    "volatility": flat(self.revenue_volatility),
+                    "stability": flat(self.stability_score),
+                    "risk": flat(self.risk_score)
+                }
+            }
+        return self._snapshot
+
+
+def fetch_version(conn):
+    # overview_metrics.last_updated moves forward every time the pipeline runs
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT last_updated FROM overview_metrics WHERE id = 1;")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def fetch_overview(conn):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM overview_metrics WHERE id = 1;")
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def load_grid(conn):
+    # Read the whole zone_hourly_metrics table in one go and pack it into arrays
+    overview = fetch_overview(conn)
+    version = overview.get("last_updated") if overview else None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT zhm.zone_id, zhm.hour, zhm.zone_name, COALESCE(z.borough, '') AS borough,
+                   {', '.join('zhm.' + c for c in METRIC_COLUMNS)}
+            FROM zone_hourly_metrics zhm
+            LEFT JOIN Zone z ON zhm.zone_id = z.zone_id
+            ORDER BY zhm.zone_id, zhm.hour;
+        """)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    zone_ids = []
+    zone_names = []
+    boroughs = []
+    positions = {}
+    for r in rows:
+        if r[0] not in positions:
+            positions[r[0]] = len(zone_ids)
+            zone_ids.append(r[0])
+            zone_names.append(r[2] or "")
+            boroughs.append(r[3] or "")
+
+    shape = (len(zone_ids), HOURS)
+    metrics = {c: np.zeros(shape) for c in METRIC_COLUMNS}
+    present = np.zeros(shape, dtype=bool)
+    for r in rows:
+        i = positions[r[0]]
+        hour = r[1]
+        present[i, hour] = True
+        for offset, c in enumerate(METRIC_COLUMNS):
+            value = r[4 + offset]
+            metrics[c][i, hour] = float(value) if value is not None else 0.0
+
+    return ZoneHourlyGrid(zone_ids, zone_names, boroughs, metrics, present, version, overview)
+
+
+def load_daily_rollup(conn, grid):
+    # Read zone_daily_hourly_stats and turn it into running totals lined up with the grid's zones
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT pickup_date, zone_id, hour, {', '.join(window_metrics.SUM_COLUMNS)}
+            FROM zone_daily_hourly_stats;
+        """)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return window_metrics.build_rollup(rows, grid.zone_index)
+
+
+def load_grid_from_artifact(path):
+    # Build a grid on top of the memory-mapped artifact (no copies of the big arrays, no queries)
+    # The daily rollup comes from the artifact too, when it was written with one
+    artifact = metrics_artifact.open_artifact(path)
+    if artifact["hours"] != HOURS:
+        raise metrics_artifact.ArtifactError(f"artifact has {artifact['hours']} hours per zone, expected {HOURS}")
+    arrays = artifact["arrays"]
+    grid = ZoneHourlyGrid(
+        artifact["zone_ids"], artifact["zone_names"], artifact["boroughs"],
+        {c: arrays[c] for c in METRIC_COLUMNS}, arrays["present"],
+        version=artifact["version"], overview=artifact["overview"],
+        stability_score=arrays["stability_score"]
+    )
+    daily = artifact["daily"]
+    if daily is not None:
+        grid.daily = window_metrics.DailyRollup(daily["first_day"], daily["arrays"])
+    grid.mapping = artifact["mapping"]     # keeps the file mapped for as long as the grid is in use
+    return grid
+
+
+class ZoneHourlyStore:
+    """Holds the current ZoneHourlyGrid and swaps in a new one when the pipeline reruns"""
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, artifact_path=ARTIFACT_PATH):
+        self.refresh_interval = refresh_interval
+        self.artifact_path = artifact_path
+        self.grid = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _use_artifact(self):
+        return self.artifact_path is not None and os.path.exists(self.artifact_path)
+
+    def _artifact_version(self):
+        try:
+            return metrics_artifact.read_version(self.artifact_path)
+        except (OSError, ValueError, metrics_artifact.ArtifactError):
+            return None
+
+    def _database_version(self):
+        # overview_metrics.last_updated, or None if MySQL can't be reached
+        conn = get_connection()
+        if not conn:
+            return None
+        try:
+            return fetch_version(conn)
+        except Exception:
+            return None
+        finally:
+            conn.close()
+
+    def _artifact_is_behind(self):
+        # A precompute run without --artifact leaves the file behind the tables; MySQL is then the
+        # only up-to-date copy (if MySQL can't be reached the file is all there is)
+        live = self._database_version()
+        written = self._artifact_version()
+        if live is None or (written is not None and written >= live):
+            return False
+        print(f"Warning: {self.artifact_path} is at version {written} but overview_metrics is at {live}, "
+              f"reading MySQL instead (rerun populate_precomputed_tables.py with --artifact)")
+        return True
+
+    def load(self):
+        # Build a fresh grid and swap it in (readers keep using the old one until then)
+        if self._use_artifact() and not self._artifact_is_behind():
+            try:
+                grid = load_grid_from_artifact(self.artifact_path)
+                print(f"Mapped zone metrics from {self.artifact_path}: {grid.zone_count} zones "
+                      f"(version {grid.version})")
+                # Serving from the file means no queries at all: date ranges only work if it has the rollup
+                if grid.daily is not None:
+                    print(f"Mapped daily rollup: {grid.daily.first_day} to {grid.daily.last_day}")
+                else:
+                    print("Artifact has no daily rollup, date ranges are unavailable")
+                self.grid = grid
+                return self.grid
+            except (OSError, ValueError, KeyError, metrics_artifact.ArtifactError) as e:
+                print(f"Error mapping {self.artifact_path}, reading MySQL instead: {e}")
+
+        conn = get_connection()
+        if not conn:
+            return self.grid
+        try:
+            grid = load_grid(conn)
+            print(f"Loaded zone metrics: {grid.zone_count} zones (version {grid.version})")
+            self._attach_daily(grid, conn)
+            self.grid = grid
+        except Exception as e:
+            print(f"Error loading zone metrics: {e}")
+        finally:
+            conn.close()
+        return self.grid
+
+    def _attach_daily(self, grid, conn):
+        # Date-range queries need the daily rollup; without it the grid still serves everything else
+        try:
+            grid.daily = load_daily_rollup(conn, grid)
+            if grid.daily is not None:
+                print(f"Loaded daily rollup: {grid.daily.first_day} to {grid.daily.last_day}")
+        except Exception as e:
+            print(f"Error loading daily rollup, date ranges are unavailable: {e}")
+
+    def refresh_if_changed(self):
+        # Only reload when overview_metrics.last_updated (or the artifact's copy of it) has moved
+        # In artifact mode both are looked at, so tables published without a new file still get served
+        if self._use_artifact():
+            versions = [v for v in (self._artifact_version(), self._database_version()) if v is not None]
+            if not versions:
+                return False
+            version = max(versions)
+        else:
+            conn = get_connection()
+            if not conn:
+                return False
+            try:
+                version = fetch_version(conn)
+            finally:
+                conn.close()
+
+        grid = self.grid
+        if grid is not None and version is not None and grid.version is not None and version <= grid.version:
+            return False
+        with self._load_lock:
+            self.load()
+        return True
+
+    def get(self):
+        # The loaded grid, loading it on first use if startup couldn't
+        if self.grid is None:
+            with self._load_lock:
+                if self.grid is None:
+                    self.load()
+        return self.grid
+
+    def start(self):
+        # Load now and keep an eye on the pipeline from a background thread
+        self.get()
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._watch, name="zone-metrics-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                print(f"Error checking zone metrics version: {e}")
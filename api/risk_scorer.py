@@ -0,0 +1,141 @@
+# Driver risk scoring shared by the API, seed_drivers.py and batch jobs
+# Keeps a zones x 24 risk matrix in memory so scoring a driver needs no queries
+
+import numpy as np
+
+HOURS = 24
+
+# Risk level cut-offs on the 10-80 scale (below 25 Low, below 45 Medium, below 65 High)
+RISK_LEVEL_CUTOFFS = [25, 45, 65]
+RISK_LEVELS = ["Low", "Medium", "High", "Very High"]
+
+
+def risk_level(score):
+    return RISK_LEVELS[int(np.searchsorted(RISK_LEVEL_CUTOFFS, score, side='right'))]
+
+
+def composite_from_raw(raw_risk):
+    # Map a 0-1 trip-weighted risk onto the 10-80 scale (0 -> 10, 1 -> 80)
+    return np.clip(np.round(10 + np.asarray(raw_risk, dtype=np.float64) * 70, 2), 10, 80)
+
+
+class DriverScore:
+    """The result of scoring one driver's operating profile"""
+
+    def __init__(self, composite_risk, risk_level, total_trips, zones, hours):
+        self.composite_risk = composite_risk
+        self.risk_level = risk_level
+        self.total_trips = total_trips
+        self.zones = zones      # {zone_id: zone_name} for every known zone the driver works in
+        self.hours = hours      # sorted list of hours the driver works
+
+
+class DriverRiskScorer:
+    """Scores (zone, hour, trips) profiles against a dense zones x 24 risk matrix"""
+
+    def __init__(self, zone_ids, zone_names, risk_matrix):
+        self.zone_ids = np.asarray(zone_ids, dtype=np.int64)
+        self.zone_names = list(zone_names)
+        # Risk on a 0-1 scale, the same value seed_drivers.py stores as avg_risk_in_zone
+        self.risk = np.asarray(risk_matrix, dtype=np.float64).reshape(len(self.zone_ids), HOURS)
+
+        # zone_id -> row lookup as an array so whole columns of zone ids map in one step
+        size = int(self.zone_ids.max()) + 1 if len(self.zone_ids) else 1
+        self._rows = np.full(size, -1, dtype=np.int64)
+        self._rows[self.zone_ids] = np.arange(len(self.zone_ids))
+
+    @classmethod
+    def from_grid(cls, grid):
+        # Reuse the API's in-memory ZoneHourlyGrid (risk_score is 0-100 there)
+        return cls(grid.zone_ids, grid.zone_names, grid.risk_score / 100.0)
+
+    @classmethod
+    def from_connection(cls, conn):
+        # Build the matrix straight from zone_hourly_metrics (used by the database scripts)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT zone_id, hour, zone_name, risk_score
+                FROM zone_hourly_metrics
+                ORDER BY zone_id, hour;
+            """)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        positions = {}
+        zone_names = []
+        for zone_id, _, zone_name, _ in rows:
+            if zone_id not in positions:
+                positions[zone_id] = len(zone_names)
+                zone_names.append(zone_name or "")
+        risk = np.zeros((len(positions), HOURS))
+        for zone_id, hour, _, risk_score in rows:
+            risk[positions[zone_id], hour] = float(risk_score or 0) / 100.0
+        return cls(list(positions), zone_names, risk)
+
+    def rows_for(self, zone_ids):
+        # Matrix row for each zone id (-1 for zones we don't know about)
+        zone_ids = np.asarray(zone_ids, dtype=np.int64)
+        rows = np.full(zone_ids.shape, -1, dtype=np.int64)
+        in_range = (zone_ids >= 0) & (zone_ids < len(self._rows))
+        rows[in_range] = self._rows[zone_ids[in_range]]
+        return rows
+
+    def risk_for(self, zone_ids, hours):
+        # 0-1 risk for each (zone, hour) pair, 0 where the zone is unknown
+        rows = self.rows_for(zone_ids)
+        hours = np.asarray(hours, dtype=np.int64)
+        known = (rows >= 0) & (hours >= 0) & (hours < HOURS)
+        risk = np.zeros(rows.shape)
+        risk[known] = self.risk[rows[known], hours[known]]
+        return risk
+
+    def zone_name(self, zone_id):
+        row = self.rows_for([zone_id])[0]
+        return self.zone_names[row] if row >= 0 else None
+
+    def score(self, zone_ids, hours, trips):
+        # Score one driver from parallel arrays of zone ids, hours and trip counts
+        zone_ids = np.asarray(zone_ids, dtype=np.int64)
+        hours = np.asarray(hours, dtype=np.int64)
+        trips = np.asarray(trips, dtype=np.float64)
+
+        # Operations in zones we don't know about are skipped
+        known = self.rows_for(zone_ids) >= 0
+        zone_ids, hours, trips = zone_ids[known], hours[known], trips[known]
+
+        total_trips = trips.sum()
+        raw_risk = (trips * self.risk_for(zone_ids, hours)).sum() / total_trips if total_trips > 0 else 0.0
+        composite = float(composite_from_raw(raw_risk))
+
+        zones = {int(z): self.zone_name(z) for z in np.unique(zone_ids)}
+        return DriverScore(composite, risk_level(composite), int(total_trips), zones,
+                           sorted(int(h) for h in np.unique(hours)))
+
+    def score_many(self, driver_ids, zone_ids, hours, trips):
+        # Score every driver in one pass over flat (driver, zone, hour, trips) columns
+        # Returns arrays: driver ids, composite score, level index, trips, zone count, hour count
+        driver_ids = np.asarray(driver_ids, dtype=np.int64)
+        zone_ids = np.asarray(zone_ids, dtype=np.int64)
+        hours = np.asarray(hours, dtype=np.int64)
+        trips = np.asarray(trips, dtype=np.float64)
+
+        known = self.rows_for(zone_ids) >= 0
+        driver_ids, zone_ids, hours, trips = driver_ids[known], zone_ids[known], hours[known], trips[known]
+
+        drivers, idx = np.unique(driver_ids, return_inverse=True)
+        n = len(drivers)
+        total_trips = np.bincount(idx, weights=trips, minlength=n)
+        weighted_risk = np.bincount(idx, weights=trips * self.risk_for(zone_ids, hours), minlength=n)
+        raw_risk = np.divide(weighted_risk, total_trips, out=np.zeros(n), where=total_trips > 0)
+        composite = composite_from_raw(raw_risk)
+        levels = np.searchsorted(RISK_LEVEL_CUTOFFS, composite, side='right')
+
+        # Count distinct zones and hours per driver
+        zone_pairs = np.unique(idx * (len(self._rows) + 1) + zone_ids)
+        hour_pairs = np.unique(idx * HOURS + hours)
+        zone_counts = np.bincount(zone_pairs // (len(self._rows) + 1), minlength=n)
+        hour_counts = np.bincount(hour_pairs // HOURS, minlength=n)
+
+        return drivers, composite, levels, total_trips.astype(np.int64), zone_counts, hour_counts
@@ -0,0 +1,88 @@
+# Zone-hour metrics for any range of pickup dates, worked out from zone_daily_hourly_stats
+# The daily totals are kept as running (prefix) sums over the days, so the totals for a date range
+# are one subtraction per zone-hour cell however long the range is. The metrics then come from
+# those totals through metric_formulas.py, the same maths the full-history tables match.
+
+from datetime import timedelta
+import numpy as np
+
+from metric_formulas import HOURS, derive_metrics
+
+# Totals kept per day x zone x hour, all as whole numbers so the running sums are exact
+# (fares in cents, squared fares in 1/10000ths)
+SUM_COLUMNS = ("trip_count", "duration_sum", "fare_count", "fare_sum", "fare_sq_sum")
+SUM_SCALES = {"fare_sum": 100, "fare_sq_sum": 10000}
+
+
+def grid_metrics(totals):
+    # zones x 24 totals -> the zone_hourly_metrics columns as floats, zone-hours without trips all zero
+    # (the same as fill_missing_hours leaves them)
+    m = derive_metrics(**totals)
+    has_trips = totals["trip_count"] > 0
+    volatility = np.broadcast_to(m["volatility"][:, None], has_trips.shape)
+    return {
+        "trip_count": totals["trip_count"],
+        "exposure_index": m["exposure"] / 100,
+        "avg_trip_duration": m["duration"] / 100,
+        "congestion_index": m["congestion"] / 100,
+        "revenue_volatility": np.where(has_trips, volatility, 0) / 100,
+        "risk_score": np.where(has_trips, m["risk"], 0) / 100
+    }
+
+
+class DailyRollup:
+    """Running totals of zone_daily_hourly_stats over the days, lined up with a grid's zones"""
+
+    def __init__(self, first_day, sums):
+        # sums holds (days + 1) x zones x 24 arrays where [d] is the total of the days before day d
+        self.first_day = first_day
+        self.sums = sums
+        self.days = sums["trip_count"].shape[0] - 1
+
+    @property
+    def last_day(self):
+        return self.first_day + timedelta(days=self.days - 1)
+
+    def totals(self, start=None, end=None):
+        # Totals for pickup dates start..end (both included, clipped to the data), or None if
+        # the range doesn't overlap any day with data
+        if self.days == 0:
+            return None
+        first = 0 if start is None else max((start - self.first_day).days, 0)
+        last = self.days - 1 if end is None else min((end - self.first_day).days, self.days - 1)
+        if first > last:
+            return None
+        return {c: self.sums[c][last + 1] - self.sums[c][first] for c in SUM_COLUMNS}
+
+
+def build_rollup(rows, zone_index):
+    # rows are (pickup_date, zone_id, hour, trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)
+    # zone_index maps zone_id -> grid row; zones the grid doesn't have are left out
+    if not rows:
+        return None
+    columns = list(zip(*rows))
+    dates = np.array(columns[0], dtype="datetime64[D]")
+    first = dates.min()
+    days = int((dates.max() - first).astype(np.int64)) + 1
+    day = (dates - first).astype(np.int64) + 1
+
+    # zone ids -> grid rows through a dense lookup (ids are small); rows for unknown zones are dropped
+    zone_ids = np.array(columns[1], dtype=np.int64)
+    lookup = np.full(max(max(zone_index, default=0), zone_ids.max()) + 1, -1, dtype=np.int64)
+    lookup[list(zone_index)] = list(zone_index.values())
+    zone_rows = lookup[zone_ids]
+    keep = zone_rows >= 0
+    day, zone_rows, hour = day[keep], zone_rows[keep], np.array(columns[2], dtype=np.int64)[keep]
+
+    daily = {}
+    for offset, c in enumerate(SUM_COLUMNS):
+        # DECIMAL totals turn into whole numbers exactly: a double holds them to well under a unit
+        # at these sizes, and rint removes what's left (drivers that return floats work the same way)
+        values = np.array([v if v is not None else 0 for v in columns[3 + offset]], dtype=np.float64)
+        values = np.rint(values * SUM_SCALES.get(c, 1)).astype(np.int64)[keep]
+        daily[c] = np.zeros((days + 1, len(zone_index), HOURS), dtype=np.int64)
+        np.add.at(daily[c], (day, zone_rows, hour), values)
+    first_day = first.astype(object)
+
+    # Row 0 stays zero, so sums[d] ends up as the total of days 0..d-1
+    return DailyRollup(first_day, {c: np.cumsum(a, axis=0) for c, a in daily.items()})
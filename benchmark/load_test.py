@@ -0,0 +1,268 @@
+# Load tests the API endpoints with concurrent clients and reports throughput and latency percentiles as JSON
+# Seed a database first with seed_benchmark_db.py, then point DB_* at it:
+#
+#   DB_NAME=nyc_taxi_bench python benchmark/load_test.py --concurrency 1,8,32 --output results.json
+#
+# Without --url the API is started in this process on a threaded werkzeug server.
+
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Figure out where this file is so we can find other project files
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+
+from database_config import DB_CONFIG, get_connection
+
+HOURS = 24
+PERCENTILES = (50, 95, 99)
+BATCH_SAMPLE = 100      # driver ids per /api/driver-risk/batch request
+
+
+# Each endpoint turns a random generator plus the ids in the database into (method, path, json body)
+ENDPOINTS = {
+    "overview": lambda rng, ids: ("GET", "/api/overview", None),
+    "zone": lambda rng, ids: ("GET", f"/api/zone/{rng.choice(ids['zones'])}?hour={rng.randrange(HOURS)}", None),
+    "top_zones": lambda rng, ids: ("GET", f"/api/top_zones?hour={rng.randrange(HOURS)}", None),
+    "hourly_density": lambda rng, ids: ("GET", "/api/hourly_density", None),
+    "snapshot": lambda rng, ids: ("GET", "/api/snapshot", None),
+    "driver_risk": lambda rng, ids: ("POST", "/api/driver-risk", {"driver_id": rng.choice(ids['drivers'])}),
+    "driver_risk_batch": lambda rng, ids: (
+        "POST", "/api/driver-risk/batch",
+        {"driver_ids": rng.sample(ids['drivers'], min(BATCH_SAMPLE, len(ids['drivers'])))}),
+}
+
+
+def fetch_ids():
+    # Real zone and driver ids so requests hit rows that exist, plus the trip count for the report
+    conn = get_connection()
+    if not conn:
+        return None
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT DISTINCT zone_id FROM zone_hourly_metrics ORDER BY zone_id")
+        zones = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT user_id FROM user ORDER BY user_id")
+        drivers = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT COUNT(*) FROM trip")
+        trips = cur.fetchone()[0]
+        return {"zones": zones, "drivers": drivers, "trips": trips}
+    finally:
+        cur.close()
+        conn.close()
+
+
+def start_local_server(host="127.0.0.1"):
+    # Run the Flask app in a background thread; returns the base URL
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import app as api
+
+    if api.zone_store.get() is None:
+        raise RuntimeError("The API could not load zone metrics - is the benchmark database seeded?")
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(host, 0, api.app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{server.server_port}", server
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened if the server drops it"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        # Returns (status, seconds taken)
+        headers = {"Accept-Encoding": "gzip"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            start = time.perf_counter()
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                return response.status, time.perf_counter() - start
+            except (http.client.HTTPException, OSError):
+                # OSError covers dropped connections and timeouts; either way the socket can't be reused
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_endpoint(base_url, name, ids, concurrency, total_requests, warmup, seed):
+    # Fire total_requests at one endpoint from `concurrency` threads and summarise the latencies
+    make_request = ENDPOINTS[name]
+    per_worker = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0)
+                  for i in range(concurrency)]
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [{} for _ in range(concurrency)]
+    errors = [0] * concurrency
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(i):
+        rng = random.Random(seed * 1000 + i)
+        client = Client(base_url)
+        try:
+            for _ in range(warmup):
+                client.request(*make_request(rng, ids))
+        except Exception:
+            pass
+        ready.wait()
+        for _ in range(per_worker[i]):
+            try:
+                status, elapsed = client.request(*make_request(rng, ids))
+            except Exception:
+                errors[i] += 1
+                continue
+            latencies[i].append(elapsed)
+            statuses[i][status] = statuses[i].get(status, 0) + 1
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    lat = np.concatenate([np.asarray(l) for l in latencies]) * 1000
+    status_counts = {}
+    for s in statuses:
+        for code, n in s.items():
+            status_counts[str(code)] = status_counts.get(str(code), 0) + n
+    non_2xx = sum(n for code, n in status_counts.items() if not code.startswith("2"))
+
+    result = {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": int(len(lat)),
+        "errors": sum(errors) + non_2xx,
+        "status_counts": status_counts,
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(len(lat) / wall, 1) if wall > 0 else 0.0,
+        "latency_ms": {}
+    }
+    if len(lat):
+        values = np.percentile(lat, PERCENTILES)
+        result["latency_ms"] = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)}
+        result["latency_ms"]["mean"] = round(float(lat.mean()), 3)
+        result["latency_ms"]["max"] = round(float(lat.max()), 3)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Insurtech API")
+    parser.add_argument("--url", help="base URL of a running server (default: start one in this process)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"comma-separated endpoints to test (default: all of {', '.join(ENDPOINTS)})")
+    parser.add_argument("--concurrency", default="8",
+                        help="concurrent clients; a comma-separated list runs each level in turn (default 8)")
+    parser.add_argument("--requests", type=int, default=2000, help="timed requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per client before timing")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the request mix")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    try:
+        levels = [int(c) for c in args.concurrency.split(",")]
+    except ValueError:
+        parser.error("--concurrency must be a comma-separated list of integers")
+    if not levels or min(levels) < 1 or args.requests < 1:
+        parser.error("--concurrency and --requests must be at least 1")
+
+    ids = fetch_ids()
+    if not ids or not ids["zones"] or not ids["drivers"]:
+        print("Could not read zone and driver ids - run seed_benchmark_db.py first", file=sys.stderr)
+        sys.exit(1)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        base_url, server = start_local_server()
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    results = []
+    try:
+        for concurrency in levels:
+            for name in endpoints:
+                result = run_endpoint(base_url, name, ids, concurrency, args.requests, args.warmup, args.seed)
+                results.append(result)
+                lat = result["latency_ms"]
+                print(f"  {name:18s} c={concurrency:<3d} {result['throughput_rps']:9.1f} req/s  "
+                      f"p50={lat.get('p50', 0):8.2f}ms  p95={lat.get('p95', 0):8.2f}ms  "
+                      f"p99={lat.get('p99', 0):8.2f}ms  errors={result['errors']}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "server": "in-process" if args.url is None else args.url,
+        "database": {"host": DB_CONFIG["host"], "name": DB_CONFIG["database"],
+                     "trips": ids["trips"], "zones": len(ids["zones"]), "drivers": len(ids["drivers"])},
+        "python": platform.python_version(),
+        "requests_per_endpoint": args.requests,
+        "warmup_per_client": args.warmup,
+        "seed": args.seed,
+        "results": results
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Fills a MySQL database with a scaled copy of the cleaned trips so the API can be load tested
+# Runs the normal pipeline (load_data -> populate_precomputed_tables -> seed_drivers -> refresh_driver_scores)
+# against whatever DB_* environment variables point at. Every table in that database is rebuilt.
+#
+#   DB_NAME=nyc_taxi_bench python benchmark/seed_benchmark_db.py --scale 10
+
+import sys
+import os
+import csv
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Figure out where this file is so we can find other project files
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'database'))
+
+from database_config import DB_CONFIG, get_connection
+import load_data
+import populate_precomputed_tables
+import seed_drivers
+import refresh_driver_scores
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Copies are shifted by whole weeks so every trip keeps its weekday and hour (and so its zone-hour cell)
+COPY_SHIFT = timedelta(weeks=1)
+
+
+def write_scaled_csv(scale, source=load_data.TRIP_CSV, target=None):
+    # Write `scale` copies of the trips CSV (a fractional scale keeps that share of the rows)
+    # Returns the path of the new file and how many trips it holds
+    if target is None:
+        target = os.path.join(tempfile.gettempdir(), f"cleaned_yellow_trips_x{scale:g}.csv")
+
+    with open(source, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames
+        rows = list(reader)
+
+    copies = int(scale)
+    extra = int(round(len(rows) * (scale - copies)))
+
+    written = 0
+    with open(target, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for copy in range(copies + (1 if extra else 0)):
+            shift = COPY_SHIFT * copy
+            for r in (rows if copy < copies else rows[:extra]):
+                if copy:
+                    r = dict(r)
+                    for col in ('tpep_pickup_datetime', 'tpep_dropoff_datetime'):
+                        r[col] = (datetime.strptime(r[col], DATETIME_FORMAT) + shift).strftime(DATETIME_FORMAT)
+                writer.writerow(r)
+                written += 1
+    return target, written
+
+
+def table_counts(tables=('trip', 'zone_hourly_metrics', 'user', 'driver_operations', 'driver_risk_scores')):
+    conn = get_connection()
+    if not conn:
+        return None
+    cur = conn.cursor()
+    try:
+        counts = {}
+        for t in tables:
+            cur.execute(f"SELECT COUNT(*) FROM `{t}`")
+            counts[t] = cur.fetchone()[0]
+        return counts
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database with a scaled copy of the trip data")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="how many copies of cleaned_yellow_trips.csv to load (default 1, may be fractional)")
+    parser.add_argument("--csv", default=load_data.TRIP_CSV, help="trips CSV to scale up")
+    parser.add_argument("--force", action="store_true",
+                        help="allow seeding the default database (its tables get dropped)")
+    args = parser.parse_args()
+
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+    # Guard against wiping the development database by accident
+    if "DB_NAME" not in os.environ and not args.force:
+        parser.error(f"set DB_NAME to a scratch database (or pass --force to rebuild '{DB_CONFIG['database']}')")
+
+    print(f"Insurtech - Seeding benchmark database '{DB_CONFIG['database']}' on "
+          f"{DB_CONFIG['host']}:{DB_CONFIG['port']} at scale x{args.scale:g}")
+    print()
+
+    trip_csv, trips = write_scaled_csv(args.scale, source=args.csv)
+    print(f"Wrote {trips} trips to {trip_csv}")
+    print()
+
+    try:
+        load_data.main(trip_csv=trip_csv)
+        populate_precomputed_tables.main()
+        seed_drivers.seed()
+        refresh_driver_scores.refresh()
+    finally:
+        os.remove(trip_csv)
+
+    # The pipeline scripts only print their errors, so check the tables actually got filled
+    counts = table_counts()
+    if not counts or not all(counts.values()):
+        print(f"\nBenchmark database is incomplete: {counts}")
+        sys.exit(1)
+    print(f"\nBenchmark database ready: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,13 @@
 import pandas as pd
 import numpy as np
 import os
+import io
+import glob
+import shutil
+import argparse
+import contextlib
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import json
 
@@ -17,6 +24,7 @@ DATA_DIR = SCRIPT_DIR if os.path.basename(SCRIPT_DIR) == 'data' else os.path.joi
 TRIP_DATA_PATH = os.path.join(DATA_DIR, 'yellow_tripdata_2025-01.parquet')
 ZONE_METADATA_PATH = os.path.join(DATA_DIR, 'locations.csv')
 CLEANED_TRIP_DATA = os.path.join(DATA_DIR, 'yellow_trips_cleaned.csv')
+CLEANED_TRIP_PARQUET = os.path.join(DATA_DIR, 'yellow_trips_cleaned')
 CLEANING_LOG_PATH = os.path.join(DATA_DIR, 'data_cleaning_log.json')
 CLEANING_REPORT_PATH = os.path.join(DATA_DIR, 'data_cleaning_report.txt')
 
@@ -31,13 +39,68 @@ MAX_PASSENGER_COUNT = 6  # Yellow cabs are 4-seaters
 MIN_TRIP_DURATION = timedelta(minutes=1)
 MAX_TRIP_DURATION = timedelta(hours=8)
 
+# Rows without these can't be used at all; the imputed ones get the median filled in instead
+CRITICAL_FIELDS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime',
+                   'PULocationID', 'DOLocationID', 'fare_amount']
+IMPUTED_FIELDS = ['passenger_count', 'trip_distance']
+
+# Streaming mode (--stream) reads the trips this many rows at a time, so memory use depends
+# on the chunk size instead of the size of the month being cleaned
+STREAM_CHUNK_SIZE = 250_000
+
+# Each outlier check sets its own bit in a row's reason mask; a row is excluded if any bit is set,
+# and it counts once towards every reason it has (so a row failing two checks is in both counts)
+OUTLIER_REASONS = {
+    'Invalid location ID': 1 << 0,
+    'Anomalous trip distance': 1 << 1,
+    'Anomalous fare amount': 1 << 2,
+    'Invalid passenger count': 1 << 3,
+    'Invalid trip duration': 1 << 4,
+    'Future timestamp (temporal anomaly)': 1 << 5
+}
+
+# Example issues kept per stage in the JSON log (streaming logs a few for every chunk)
+MAX_ISSUES_PER_STAGE = 100
+
+# Rows logged as examples for each failed check when not sampling
+ISSUE_EXAMPLES = 3
+
+# Parquet output (--parquet) is a folder per pickup date and hour (pickup_date=2025-01-31/pickup_hour=7/),
+# so readers that filter on them skip every other folder; each file is compressed with this codec
+PARQUET_PARTITIONS = ['pickup_date', 'pickup_hour']
+PARQUET_COMPRESSION = 'zstd'
+
+# Lean mode (--lean): each column in the smallest type its values fit, so a month takes far less memory
+# while it's cleaned. A number column only changes type once it has no missing values and every value
+# fits; money and distance go to float32 when every value still rounds to the same cents, and
+# normalization rounds them in float64 again.
+LEAN_DTYPES = {
+    'VendorID': 'uint8', 'passenger_count': 'uint8', 'RatecodeID': 'uint8',
+    'PULocationID': 'int16', 'DOLocationID': 'int16',
+    'trip_distance': 'float32', 'fare_amount': 'float32', 'extra': 'float32', 'mta_tax': 'float32',
+    'tip_amount': 'float32', 'tolls_amount': 'float32', 'total_amount': 'float32'
+}
+# Text columns with only a handful of distinct values, kept as categoricals in lean mode
+LEAN_CATEGORIES = ['payment_type', 'trip_type', 'store_and_fwd_flag',
+                   'pickup_zone', 'pickup_borough', 'dropoff_zone', 'dropoff_borough']
+
+# Optional event log (--log-jsonl): one JSON object per line, appended as cleaning goes
+CLEANING_EVENTS_PATH = os.path.join(DATA_DIR, 'data_cleaning_log.jsonl')
+
 # Logging system: This class keeps track of everything that gets excluded
 # and why it was excluded. No surprises - everything is documented.
 
 class DataCleaningLogger:
-    """Keeps a running log of everything that gets excluded during cleaning"""
+    """Keeps a running log of everything that gets excluded during cleaning
     
-    def __init__(self):
+    With sample_size set, the examples are a reservoir sample of that many issues per stage and reason,
+    drawn from every offending row, next to exact per-reason issue counts, so the log stays the same
+    size however dirty the data is. With events_path set, what happens is also appended there as
+    JSON Lines while cleaning runs (the file stays open until save() or close()). With trace_memory set, each stage also gets the peak memory
+    tracemalloc saw while it ran.
+    """
+    
+    def __init__(self, sample_size=None, events_path=None, seed=0, trace_memory=False):
         self.log = {
             'timestamp': datetime.now().isoformat(),
             'stages': {},
@@ -49,17 +112,77 @@ class DataCleaningLogger:
             },
             'field_statistics': {}
         }
+        self.sample_size = sample_size
+        self.events_path = events_path
+        self.trace_memory = trace_memory
+        self.rng = np.random.default_rng(seed)
+        # (stage, reason) -> the sampled issues and how many issues there were in total
+        self.samples = {}
+        self.seen = {}
+        self._events = open(events_path, 'w') if events_path else None
+    
+    def event(self, kind, **fields):
+        """Append one line to the JSON Lines event log (if there is one)"""
+        if self._events is None:
+            return
+        self._events.write(json.dumps({'event': kind, 'time': datetime.now().isoformat(), **fields}, default=str) + '\n')
+    
+    def add_events(self, path, source=None):
+        """Copy another logger's event log into this one, each line tagged with the file it came from"""
+        if self._events is None or not path or not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                self._events.write(json.dumps(dict(json.loads(line), file=source), default=str) + '\n'
+                                   if source else line)
+    
+    def close(self):
+        """Close the event log; a logger goes back from a worker process without its open file"""
+        if self._events is not None:
+            self._events.close()
+            self._events = None
     
     def add_stage(self, stage_name, description):
-        """Start tracking a new cleaning stage"""
+        """Start tracking a new cleaning stage (again for every chunk when streaming, so keep the counts)"""
+        if stage_name in self.log['stages']:
+            return
         self.log['stages'][stage_name] = {
             'description': description,
             'issues_found': [],
             'records_affected': 0
         }
+        if self.sample_size:
+            self.log['stages'][stage_name]['issue_counts'] = {}
+        self.event('stage', stage=stage_name, description=description)
+    
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """Keep the peak traced memory while the block runs as the stage's peak_memory_mb (the highest
+        over every chunk when streaming); counts what Python and numpy allocate, data held from earlier
+        stages included"""
+        if not self.trace_memory:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            stage_log = self.log['stages'].get(stage)
+            if stage_log is not None:
+                stage_log['peak_memory_mb'] = max(stage_log.get('peak_memory_mb', 0), peak)
+                print(f"  Peak memory: {peak:,.1f} MB")
+                self.event('memory', stage=stage, peak_mb=peak)
     
     def log_issue(self, stage, row_index, field, reason, value=None):
         """Record a specific data quality problem with context"""
+        if self.sample_size:
+            self.log_issues(stage, [row_index], field, reason, (lambda _: value) if value is not None else None)
+            return
+        if len(self.log['stages'][stage]['issues_found']) >= MAX_ISSUES_PER_STAGE:
+            return
         issue = {
             'row': row_index,
             'field': field,
@@ -68,43 +191,282 @@ class DataCleaningLogger:
         }
         self.log['stages'][stage]['issues_found'].append(issue)
     
-    def log_exclusion(self, reason):
-        """Track why we excluded a record (count by reason)"""
+    def log_issues(self, stage, rows, field, reason, value=None):
+        """Record a problem found on many rows at once; value(row) describes a row and is only
+        called for the rows that end up in the log (the first few, or the sampled ones)"""
+        if not self.sample_size:
+            for row in list(rows[:ISSUE_EXAMPLES]):
+                self.log_issue(stage, row, field, reason, value(row) if value else None)
+            return
+        
+        # Reservoir sampling (algorithm R), decided for the whole batch at once: the i-th issue
+        # overall is kept with probability sample_size / i and replaces a random earlier pick
+        rows = np.asarray(rows)
+        key = (stage, reason)
+        sample = self.samples.setdefault(key, [])
+        seen = self.seen.get(key, 0)
+        position = seen + np.arange(1, len(rows) + 1)
+        keep = (position <= self.sample_size) | (self.rng.random(len(rows)) * position < self.sample_size)
+        for i in np.flatnonzero(keep):
+            row = rows[i].item()
+            issue = {
+                'row': row,
+                'field': field,
+                'reason': reason,
+                'value': str(value(row)) if value else 'N/A'
+            }
+            if len(sample) < self.sample_size:
+                sample.append(issue)
+            else:
+                sample[self.rng.integers(self.sample_size)] = issue
+        self.seen[key] = seen + len(rows)
+        
+        stage_log = self.log['stages'][stage]
+        stage_log['issue_counts'][reason] = self.seen[key]
+        stage_log['issues_found'] = [issue for (name, _), issues in self.samples.items()
+                                     if name == stage for issue in issues]
+        self.event('issues', stage=stage, field=field, reason=reason, count=len(rows))
+    
+    def log_exclusion(self, reason, count=1):
+        """Track why we excluded records (count by reason; count is how many rows at once)"""
+        count = int(count)
+        if count <= 0:
+            return
         if reason not in self.log['records']['exclusion_reasons']:
             self.log['records']['exclusion_reasons'][reason] = 0
-        self.log['records']['exclusion_reasons'][reason] += 1
-        self.log['records']['total_excluded'] += 1
+        self.log['records']['exclusion_reasons'][reason] += count
+        self.log['records']['total_excluded'] += count
+        self.event('exclusion', reason=reason, count=count)
     
     def save(self):
         """Export the log as JSON for detailed analysis"""
         with open(CLEANING_LOG_PATH, 'w') as f:
             json.dump(self.log, f, indent=2, default=str)
         print(f"Detailed log saved to: {CLEANING_LOG_PATH}")
+        if self._events is not None:
+            self.event('summary', log=self.log)
+            self.close()
+            print(f"Event log saved to: {self.events_path}")
+    
+    def merge(self, other, source=None):
+        """Add another run's counts into this log (one per worker when cleaning several files)"""
+        records = self.log['records']
+        for key in ('initial_count', 'final_count', 'total_excluded'):
+            records[key] += other.log['records'][key]
+        for reason, count in other.log['records']['exclusion_reasons'].items():
+            records['exclusion_reasons'][reason] = records['exclusion_reasons'].get(reason, 0) + count
+        
+        for stage_name, stage in other.log['stages'].items():
+            self.add_stage(stage_name, stage['description'])
+            merged = self.log['stages'][stage_name]
+            merged['records_affected'] += stage['records_affected']
+            if 'peak_memory_mb' in stage:
+                # Workers are separate processes, so the highest of them is what one file needs
+                merged['peak_memory_mb'] = max(merged.get('peak_memory_mb', 0), stage['peak_memory_mb'])
+            if self.sample_size:
+                continue
+            # Row numbers only mean something within their own file, so say which one
+            room = max(MAX_ISSUES_PER_STAGE - len(merged['issues_found']), 0)
+            for issue in stage['issues_found'][:room]:
+                merged['issues_found'].append(dict(issue, file=source) if source else issue)
+        
+        if self.sample_size:
+            for key, issues in other.samples.items():
+                self._merge_sample(key, [dict(issue, file=source) if source else issue for issue in issues],
+                                   other.seen[key])
+        self.event('merge', file=source, records=other.log['records'])
+    
+    def _merge_sample(self, key, issues, count):
+        # Combine two reservoir samples into one over both sets of issues: every issue stands in for
+        # (issues it was sampled from / sample size) issues, so pick by that weight
+        stage, reason = key
+        mine = self.samples.get(key, [])
+        seen = self.seen.get(key, 0)
+        pool = mine + issues
+        if not pool:
+            return
+        weights = np.concatenate([np.full(len(mine), seen / max(len(mine), 1)),
+                                  np.full(len(issues), count / max(len(issues), 1))])
+        picks = self.rng.choice(len(pool), size=min(self.sample_size, len(pool)), replace=False,
+                                p=weights / weights.sum())
+        self.samples[key] = [pool[i] for i in sorted(picks)]
+        self.seen[key] = seen + count
+        
+        stage_log = self.log['stages'][stage]
+        stage_log['issue_counts'][reason] = self.seen[key]
+        stage_log['issues_found'] = [issue for (name, _), issues in self.samples.items()
+                                     if name == stage for issue in issues]
+
+
+class RunningValueCounts:
+    """How often each value has turned up so far; enough for an exact median or mode over many chunks"""
+
+    def __init__(self):
+        self.counts = pd.Series(dtype='int64')
+
+    def add(self, values):
+        self.counts = self.counts.add(values.dropna().value_counts(), fill_value=0).astype('int64')
+
+    def merge(self, other):
+        self.counts = self.counts.add(other.counts, fill_value=0).astype('int64')
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def min(self):
+        return self.counts.index.min()
+
+    def max(self):
+        return self.counts.index.max()
+
+    def mean(self):
+        return float((self.counts.index.to_numpy(dtype='float64') * self.counts.to_numpy()).sum() / self.total())
+
+    def median(self):
+        # Middle value (or the average of the two middle ones) of the sorted values, like Series.median()
+        counts = self.counts.sort_index()
+        n = int(counts.sum())
+        if n == 0:
+            return float('nan')
+        seen = counts.cumsum().to_numpy()
+        low = counts.index[np.searchsorted(seen, (n - 1) // 2, side='right')]
+        high = counts.index[np.searchsorted(seen, n // 2, side='right')]
+        return (low + high) / 2
+
+    def mode(self):
+        # Most common value, the smallest one on a tie (like Series.mode()[0])
+        return self.counts.sort_index().idxmax()
+
+
+class FieldStatistics:
+    """Normalized field statistics for the log, added up over every chunk that was cleaned"""
+
+    FIELDS = ['trip_distance', 'fare_amount', 'passenger_count', 'total_amount']
+
+    def __init__(self):
+        self.values = {field: RunningValueCounts() for field in self.FIELDS}
+
+    def add(self, df):
+        for field, counts in self.values.items():
+            counts.add(df[field])
+
+    def merge(self, other):
+        # Statistics over two sets of files together (the counts add up, so medians stay exact)
+        for field, counts in self.values.items():
+            counts.merge(other.values[field])
+
+    def to_dict(self):
+        stats = {}
+        for field, counts in self.values.items():
+            if field == 'passenger_count':
+                stats[field] = {'min': int(counts.min()), 'max': int(counts.max()),
+                                'mean': counts.mean(), 'mode': int(counts.mode())}
+            else:
+                stats[field] = {'min': float(counts.min()), 'max': float(counts.max()),
+                                'mean': counts.mean(), 'median': float(counts.median())}
+        return stats
+
+
+class SeenTrips:
+    """64-bit hashes of the duplicate key of every trip kept so far, so streaming can catch duplicates
+    that end up in different chunks (a sorted array: 8 bytes per trip)"""
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def mark(self, keys):
+        # True for rows whose key was kept in an earlier chunk or earlier in this one; remembers the rest
+        # Numbers are hashed as whole cents, so a column read as int, float64 or float32 (lean mode) in one
+        # chunk and another type in the next still matches
+        keys = keys.assign(**{col: self._cents(keys[col]) for col in keys.columns
+                              if pd.api.types.is_numeric_dtype(keys[col])})
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        seen_before = np.zeros(len(hashes), dtype=bool)
+        if len(self.hashes):
+            pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+            seen_before = self.hashes[pos] == hashes
+        duplicate = seen_before | pd.Series(hashes).duplicated().to_numpy()
+        self.hashes = np.union1d(self.hashes, hashes[~duplicate])
+        return pd.Series(duplicate, index=keys.index)
+
+    @staticmethod
+    def _cents(values):
+        if values.dtype.kind != 'f':
+            values = values.astype('float64')
+        return (round_cents(values) * 100).round().astype('Int64')
 
 
 # STAGE 1: DATA INTEGRATION
 
-def load_and_integrate_data():
+def compact_dtypes(df, floats=True):
+    # Lean mode: move df's columns to the types in LEAN_DTYPES / LEAN_CATEGORIES where the values allow
+    # it (see above), in place; floats=False leaves money and distance alone (after normalization)
+    for col, dtype in LEAN_DTYPES.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values) or values.isna().any():
+            continue
+        if np.dtype(dtype).kind == 'f':
+            if not floats:
+                continue
+            # A median imputed halfway between two cents can round the other way in float32
+            narrow = values.astype(dtype)
+            if (round_cents(narrow) == values.round(2)).all():
+                df[col] = narrow
+            continue
+        info = np.iinfo(dtype)
+        if len(values) and ((values % 1 != 0).any() or values.min() < info.min or values.max() > info.max):
+            continue
+        df[col] = values.astype(dtype)
+    
+    for col in LEAN_CATEGORIES:
+        if (col in df.columns and not pd.api.types.is_numeric_dtype(df[col])
+                and not isinstance(df[col].dtype, pd.CategoricalDtype)):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def round_cents(values):
+    # Round to 2 decimals; float32 columns (lean mode) go back to float64 first so they round to the
+    # same cents as a full-width run
+    if values.dtype == np.float32:
+        values = values.astype('float64')
+    return values.round(2)
+
+
+def load_and_integrate_data(path=None, logger=None, lean=False):
     # Load trip data and zone metadata, perform initial integrity checks
+    # lean: shrink the columns to LEAN_DTYPES right after loading
     print("\n" + "="*80)
     print("STAGE 1: DATA INTEGRATION")
     print("="*80)
     
-    logger = DataCleaningLogger()
+    logger = logger or DataCleaningLogger()
     logger.add_stage('integration', 'Load trip data and zone metadata')
     
     # Load trip data
-    print(f"\n[1.1] Loading trip data from: {TRIP_DATA_PATH}")
-    if TRIP_DATA_PATH.endswith('.parquet'):
-        trips_df = pd.read_parquet(TRIP_DATA_PATH)
+    path = path or TRIP_DATA_PATH
+    print(f"\n[1.1] Loading trip data from: {path}")
+    if path.endswith('.parquet'):
+        trips_df = pd.read_parquet(path)
     else:
-        trips_df = pd.read_csv(TRIP_DATA_PATH)
+        trips_df = pd.read_csv(path)
     initial_count = len(trips_df)
     logger.log['records']['initial_count'] = initial_count
     print(f"  Loaded {initial_count} trip records")
     print(f"  Columns: {', '.join(trips_df.columns.tolist())}")
+    if lean:
+        compact_dtypes(trips_df)
+        print(f"  Lean column types: {trips_df.memory_usage().sum() / 2**20:,.1f} MB (strings not counted)")
     
-    # Load zone metadata
+    zones_df, valid_locations = load_zone_metadata()
+    
+    return trips_df, zones_df, valid_locations, logger
+
+
+def load_zone_metadata():
+    # Load zone metadata and the set of valid location IDs
     print(f"\n[1.2] Loading zone metadata from: {ZONE_METADATA_PATH}")
     zones_df = pd.read_csv(ZONE_METADATA_PATH)
     print(f"  Loaded {len(zones_df)} zone records")
@@ -119,13 +481,43 @@ def load_and_integrate_data():
     # Store zone lookup for later validation
     valid_locations = set(zones_df['LocationID'].astype(int).unique())
     
-    return trips_df, zones_df, valid_locations, logger
+    return zones_df, valid_locations
+
+
+def iter_trip_chunks(path=TRIP_DATA_PATH, chunk_size=STREAM_CHUNK_SIZE, columns=None):
+    # Yield the trips chunk_size rows at a time (parquet record batches or CSV chunks)
+    # Each chunk is indexed by its rows' position in the file, so logged row numbers match a full load
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+    
+    offset = 0
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+def imputation_medians(path=TRIP_DATA_PATH, chunk_size=STREAM_CHUNK_SIZE):
+    # Streaming needs the whole file's medians before the first chunk is imputed, so read just the
+    # columns involved once and count values (the same rows handle_missing_values takes the median over)
+    values = {field: RunningValueCounts() for field in IMPUTED_FIELDS}
+    for chunk in iter_trip_chunks(path, chunk_size, columns=CRITICAL_FIELDS + IMPUTED_FIELDS):
+        usable = chunk[~chunk[CRITICAL_FIELDS].isnull().any(axis=1)]
+        for field, counts in values.items():
+            counts.add(usable[field])
+    return {field: counts.median() for field, counts in values.items()}
 
 
 # STAGE 2: DATA INTEGRITY - MISSING VALUES
 
-def handle_missing_values(df, valid_locations, logger):
+def handle_missing_values(df, valid_locations, logger, medians=None, lean=False):
     # Identify and handle missing values - critical vs non-critical
+    # medians: values to impute with instead of this frame's own medians (streaming passes the file's)
+    # lean: filter without the extra copy, then shrink the columns that no longer have gaps
     print("\n" + "="*80)
     print("STAGE 2: DATA INTEGRITY - MISSING VALUES")
     print("="*80)
@@ -141,8 +533,7 @@ def handle_missing_values(df, valid_locations, logger):
     initial_count = len(df)
     
     # Identify rows with missing critical fields
-    critical_fields = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 
-                       'PULocationID', 'DOLocationID', 'fare_amount']
+    critical_fields = CRITICAL_FIELDS
     
     mask_critical_missing = df[critical_fields].isnull().any(axis=1)
     rows_with_critical_missing = mask_critical_missing.sum()
@@ -156,24 +547,23 @@ def handle_missing_values(df, valid_locations, logger):
                 logger.log_issue('missing_values', -1, col, 'Missing critical field', None)
     
     # Filter: Remove rows with missing critical fields
-    df_cleaned = df[~mask_critical_missing].copy()
+    df_cleaned = df[~mask_critical_missing] if lean else df[~mask_critical_missing].copy()
     rows_excluded = initial_count - len(df_cleaned)
-    logger.log['stages']['missing_values']['records_affected'] = rows_excluded
-    for _ in range(rows_excluded):
-        logger.log_exclusion('Missing critical field')
+    logger.log['stages']['missing_values']['records_affected'] += rows_excluded
+    logger.log_exclusion('Missing critical field', rows_excluded)
     
     print(f"\n[2.3] Handling non-critical missing values:")
     
     # passenger_count: Fill with median if missing
     if df_cleaned['passenger_count'].isnull().sum() > 0:
-        median_passengers = df_cleaned['passenger_count'].median()
+        median_passengers = medians['passenger_count'] if medians else df_cleaned['passenger_count'].median()
         print(f"  - passenger_count: Imputing {df_cleaned['passenger_count'].isnull().sum()} "
               f"missing values with median ({median_passengers})")
         df_cleaned['passenger_count'] = df_cleaned['passenger_count'].fillna(median_passengers)
     
     # trip_distance: Fill with median if missing
     if df_cleaned['trip_distance'].isnull().sum() > 0:
-        median_distance = df_cleaned['trip_distance'].median()
+        median_distance = medians['trip_distance'] if medians else df_cleaned['trip_distance'].median()
         print(f"  - trip_distance: Imputing {df_cleaned['trip_distance'].isnull().sum()} "
               f"missing values with median ({median_distance:.2f})")
         df_cleaned['trip_distance'] = df_cleaned['trip_distance'].fillna(median_distance)
@@ -181,13 +571,18 @@ def handle_missing_values(df, valid_locations, logger):
     print(f"\n  Missing value handling complete")
     print(f"  Records remaining: {len(df_cleaned)} (excluded: {rows_excluded})")
     
+    if lean:
+        compact_dtypes(df_cleaned)
+    
     return df_cleaned
 
 
 # STAGE 3: DATA INTEGRITY - DUPLICATES
 
-def remove_duplicates(df, logger):
+def remove_duplicates(df, logger, seen=None, lean=False):
     # Identify and remove duplicate records (same pickup_time + dropoff_time + locations + fare)
+    # seen: a SeenTrips shared across chunks when streaming, so duplicates in earlier chunks count too
+    # lean: no copies (copy-on-write keeps the caller's frame safe)
     print("\n" + "="*80)
     print("STAGE 3: DATA INTEGRITY - DUPLICATES")
     print("="*80)
@@ -201,7 +596,10 @@ def remove_duplicates(df, logger):
                         'PULocationID', 'DOLocationID', 'fare_amount']
     
     # Count duplicates
-    duplicate_mask = df.duplicated(subset=duplicate_subset, keep='first')
+    if seen is None:
+        duplicate_mask = df.duplicated(subset=duplicate_subset, keep='first')
+    else:
+        duplicate_mask = seen.mark(df[duplicate_subset])
     num_duplicates = duplicate_mask.sum()
     
     print(f"\n[3.1] Searching for exact duplicate trips...")
@@ -213,22 +611,21 @@ def remove_duplicates(df, logger):
         # Show examples
         duplicate_records = df[duplicate_mask]
         print(f"\n  Example duplicates:")
-        for idx, row in duplicate_records.head(3).iterrows():
+        for _, row in duplicate_records.head(3).iterrows():
             print(f"    - {row['tpep_pickup_datetime']} → {row['tpep_dropoff_datetime']} "
                   f"(${row['fare_amount']:.2f})")
-            logger.log_issue('duplicates', idx, 'All fields', 'Exact duplicate found', 
-                           f"{row['tpep_pickup_datetime']}")
+        logger.log_issues('duplicates', duplicate_records.index, 'All fields', 'Exact duplicate found',
+                          lambda idx: f"{df.at[idx, 'tpep_pickup_datetime']}")
         
         # Remove duplicates (keep first occurrence)
-        df_cleaned = df[~duplicate_mask].copy()
-        logger.log['stages']['duplicates']['records_affected'] = num_duplicates
-        for _ in range(num_duplicates):
-            logger.log_exclusion('Duplicate record')
+        df_cleaned = df[~duplicate_mask] if lean else df[~duplicate_mask].copy()
+        logger.log['stages']['duplicates']['records_affected'] += num_duplicates
+        logger.log_exclusion('Duplicate record', num_duplicates)
         
         print(f"\n  Removed {num_duplicates} duplicates (kept first occurrence)")
     else:
         print(f"\n  No exact duplicates found")
-        df_cleaned = df.copy()
+        df_cleaned = df if lean else df.copy()
     
     print(f"  Records remaining: {len(df_cleaned)}")
     
@@ -237,8 +634,10 @@ def remove_duplicates(df, logger):
 
 # STAGE 4: DATA INTEGRITY - OUTLIERS AND PHYSICAL ANOMALIES
 
-def detect_and_handle_outliers(df, valid_locations, logger):
+def detect_and_handle_outliers(df, valid_locations, logger, now=None, lean=False):
     # Detect data that doesn't make sense: validate locations, distances, fares, passengers, duration, timestamps
+    # now: the cut-off for future timestamps (streaming fixes it once so every chunk uses the same one)
+    # lean: filter without the extra copy
     print("\n" + "="*80)
     print("STAGE 4: DATA INTEGRITY - OUTLIERS & ANOMALIES")
     print("="*80)
@@ -246,7 +645,8 @@ def detect_and_handle_outliers(df, valid_locations, logger):
     logger.add_stage('outliers', 'Detect and handle outliers and anomalies')
     
     initial_count = len(df)
-    rows_to_exclude = []
+    # One byte per row with a bit per failed check (see OUTLIER_REASONS)
+    reasons = np.zeros(len(df), dtype=np.uint8)
     
     # Convert datetime columns
     df['tpep_pickup_datetime'] = pd.to_datetime(df['tpep_pickup_datetime'], errors='coerce')
@@ -257,17 +657,13 @@ def detect_and_handle_outliers(df, valid_locations, logger):
     invalid_pu_loc = ~df['PULocationID'].isin(valid_locations)
     invalid_do_loc = ~df['DOLocationID'].isin(valid_locations)
     
-    invalid_locations_count = (invalid_pu_loc | invalid_do_loc).sum()
+    invalid_location = invalid_pu_loc | invalid_do_loc
+    invalid_locations_count = invalid_location.sum()
     if invalid_locations_count > 0:
         print(f"  Found {invalid_locations_count} records with invalid location IDs")
-        invalid_loc_indices = df[invalid_pu_loc | invalid_do_loc].index.tolist()
-        rows_to_exclude.extend(invalid_loc_indices)
-        for idx in invalid_loc_indices[:3]:  # Show first 3
-            row = df.loc[idx]
-            logger.log_issue('outliers', idx, 'Location ID', 'Invalid location ID',
-                           f"PU:{row['PULocationID']}, DO:{row['DOLocationID']}")
-        for _ in range(invalid_locations_count):
-            logger.log_exclusion('Invalid location ID')
+        reasons[invalid_location.to_numpy()] |= OUTLIER_REASONS['Invalid location ID']
+        logger.log_issues('outliers', df.index[invalid_location.to_numpy()], 'Location ID', 'Invalid location ID',
+                          lambda idx: f"PU:{df.at[idx, 'PULocationID']}, DO:{df.at[idx, 'DOLocationID']}")
     else:
         print(f"  All location IDs are valid")
     
@@ -281,13 +677,9 @@ def detect_and_handle_outliers(df, valid_locations, logger):
     
     if invalid_distance_count > 0:
         print(f"  Found {invalid_distance_count} records with anomalous trip distance")
-        invalid_dist_indices = df[invalid_distance].index.tolist()
-        rows_to_exclude.extend(invalid_dist_indices)
-        for idx in invalid_dist_indices[:3]:  # Show first 3
-            logger.log_issue('outliers', idx, 'trip_distance', 'Anomalous distance',
-                           f"{df.loc[idx, 'trip_distance']:.2f} miles")
-        for _ in range(invalid_distance_count):
-            logger.log_exclusion('Anomalous trip distance')
+        reasons[invalid_distance.to_numpy()] |= OUTLIER_REASONS['Anomalous trip distance']
+        logger.log_issues('outliers', df.index[invalid_distance.to_numpy()], 'trip_distance', 'Anomalous distance',
+                          lambda idx: f"{df.at[idx, 'trip_distance']:.2f} miles")
     else:
         print(f"  All trip distances are within acceptable range")
     
@@ -301,13 +693,9 @@ def detect_and_handle_outliers(df, valid_locations, logger):
     
     if invalid_fare_count > 0:
         print(f"  Found {invalid_fare_count} records with anomalous fare amounts")
-        invalid_fare_indices = df[invalid_fare].index.tolist()
-        rows_to_exclude.extend(invalid_fare_indices)
-        for idx in invalid_fare_indices[:3]:  # Show first 3
-            logger.log_issue('outliers', idx, 'fare_amount', 'Anomalous fare',
-                           f"${df.loc[idx, 'fare_amount']:.2f}")
-        for _ in range(invalid_fare_count):
-            logger.log_exclusion('Anomalous fare amount')
+        reasons[invalid_fare.to_numpy()] |= OUTLIER_REASONS['Anomalous fare amount']
+        logger.log_issues('outliers', df.index[invalid_fare.to_numpy()], 'fare_amount', 'Anomalous fare',
+                          lambda idx: f"${df.at[idx, 'fare_amount']:.2f}")
     else:
         print(f"  All fare amounts are within acceptable range")
     
@@ -321,99 +709,105 @@ def detect_and_handle_outliers(df, valid_locations, logger):
     
     if invalid_passenger_count > 0:
         print(f"  Found {invalid_passenger_count} records with invalid passenger count")
-        invalid_pass_indices = df[invalid_passenger].index.tolist()
-        rows_to_exclude.extend(invalid_pass_indices)
-        for idx in invalid_pass_indices[:3]:  # Show first 3
-            logger.log_issue('outliers', idx, 'passenger_count', 'Invalid passenger count',
-                           df.loc[idx, 'passenger_count'])
-        for _ in range(invalid_passenger_count):
-            logger.log_exclusion('Invalid passenger count')
+        reasons[invalid_passenger.to_numpy()] |= OUTLIER_REASONS['Invalid passenger count']
+        logger.log_issues('outliers', df.index[invalid_passenger.to_numpy()], 'passenger_count',
+                          'Invalid passenger count', lambda idx: df.at[idx, 'passenger_count'])
     else:
         print(f"  All passenger counts are valid")
     
     # ---- CHECK 5: Trip Duration ----
     print(f"\n[4.5] Validating trip duration...")
-    df['trip_duration'] = df['tpep_dropoff_datetime'] - df['tpep_pickup_datetime']
+    trip_duration = df['tpep_dropoff_datetime'] - df['tpep_pickup_datetime']
     print(f"  Valid range: {MIN_TRIP_DURATION} to {MAX_TRIP_DURATION}")
     
-    invalid_duration = (df['trip_duration'] < MIN_TRIP_DURATION) | (df['trip_duration'] > MAX_TRIP_DURATION)
+    invalid_duration = (trip_duration < MIN_TRIP_DURATION) | (trip_duration > MAX_TRIP_DURATION)
     invalid_duration_count = invalid_duration.sum()
     
     if invalid_duration_count > 0:
         print(f"  Found {invalid_duration_count} records with invalid trip duration")
-        invalid_dur_indices = df[invalid_duration].index.tolist()
-        rows_to_exclude.extend(invalid_dur_indices)
-        for idx in invalid_dur_indices[:3]:  # Show first 3
-            logger.log_issue('outliers', idx, 'trip_duration', 'Invalid duration',
-                           str(df.loc[idx, 'trip_duration']))
-        for _ in range(invalid_duration_count):
-            logger.log_exclusion('Invalid trip duration')
+        reasons[invalid_duration.to_numpy()] |= OUTLIER_REASONS['Invalid trip duration']
+        logger.log_issues('outliers', df.index[invalid_duration.to_numpy()], 'trip_duration', 'Invalid duration',
+                          lambda idx: str(trip_duration.at[idx]))
     else:
         print(f"  All trip durations are within acceptable range")
     
     # ---- CHECK 6: Temporal Anomalies (Future dates) ----
     print(f"\n[4.6] Validating temporal records...")
-    now = pd.Timestamp.now()
+    now = now if now is not None else pd.Timestamp.now()
     invalid_temporal = df['tpep_pickup_datetime'] > now
     invalid_temporal_count = invalid_temporal.sum()
     
     if invalid_temporal_count > 0:
         print(f"  Found {invalid_temporal_count} records with future timestamps")
-        invalid_temp_indices = df[invalid_temporal].index.tolist()
-        rows_to_exclude.extend(invalid_temp_indices)
-        for _ in range(invalid_temporal_count):
-            logger.log_exclusion('Future timestamp (temporal anomaly)')
+        reasons[invalid_temporal.to_numpy()] |= OUTLIER_REASONS['Future timestamp (temporal anomaly)']
     else:
         print(f"  No temporal anomalies detected")
     
+    # Each reason counts every row with its bit set: tally rows per bit combination, then add up
+    # the combinations that include each bit
+    combinations = np.bincount(reasons, minlength=1 << len(OUTLIER_REASONS))
+    with_bit = np.arange(len(combinations))
+    for reason, bit in OUTLIER_REASONS.items():
+        logger.log_exclusion(reason, combinations[(with_bit & bit) != 0].sum())
+    
     # Remove outlier rows
-    unique_rows_to_exclude = list(set(rows_to_exclude))
-    df_cleaned = df.drop(index=unique_rows_to_exclude).copy()
+    excluded = reasons != 0
+    rows_removed = int(excluded.sum())
+    df_cleaned = df[~excluded] if lean else df[~excluded].copy()
     
-    logger.log['stages']['outliers']['records_affected'] = len(unique_rows_to_exclude)
+    logger.log['stages']['outliers']['records_affected'] += rows_removed
     
     print(f"\n  Outlier detection complete")
-    print(f"  Records removed: {len(unique_rows_to_exclude)}")
+    print(f"  Records removed: {rows_removed}")
     print(f"  Records remaining: {len(df_cleaned)}")
     
-    # Drop temporary column
-    df_cleaned = df_cleaned.drop(columns=['trip_duration'])
-    
     return df_cleaned
 
 
 # STAGE 5: NORMALIZATION
 
-def normalize_data(df, logger):
+def normalize_data(df, logger, stats=None, keep_datetimes=False, lean=False):
     # Normalize and standardize all fields: timestamps (ISO 8601), numeric precision, categorical types
+    # stats: a FieldStatistics shared across chunks when streaming, so the logged statistics cover every chunk
+    # keep_datetimes: leave the timestamps as datetimes (for Parquet) instead of turning them into text
+    # lean: work on df itself rather than a copy, and keep the whole-number columns small
     print("\n" + "="*80)
     print("STAGE 5: DATA NORMALIZATION")
     print("="*80)
     
     logger.add_stage('normalization', 'Normalize and standardize fields')
     
-    df_normalized = df.copy()
+    df_normalized = df if lean else df.copy()
     
     # ---- Normalize Timestamps ----
-    print(f"\n[5.1] Normalizing timestamps to ISO 8601...")
-    df_normalized['tpep_pickup_datetime'] = pd.to_datetime(
-        df_normalized['tpep_pickup_datetime']).dt.strftime('%Y-%m-%d %H:%M:%S')
-    df_normalized['tpep_dropoff_datetime'] = pd.to_datetime(
-        df_normalized['tpep_dropoff_datetime']).dt.strftime('%Y-%m-%d %H:%M:%S')
-    print(f"  Timestamps normalized to format: YYYY-MM-DD HH:MM:SS")
+    if keep_datetimes:
+        # Same whole-second precision as the text format, but kept as real timestamps
+        print(f"\n[5.1] Normalizing timestamps to whole seconds...")
+        df_normalized['tpep_pickup_datetime'] = pd.to_datetime(
+            df_normalized['tpep_pickup_datetime']).dt.floor('s')
+        df_normalized['tpep_dropoff_datetime'] = pd.to_datetime(
+            df_normalized['tpep_dropoff_datetime']).dt.floor('s')
+        print(f"  Timestamps kept as datetimes, rounded down to the second")
+    else:
+        print(f"\n[5.1] Normalizing timestamps to ISO 8601...")
+        df_normalized['tpep_pickup_datetime'] = pd.to_datetime(
+            df_normalized['tpep_pickup_datetime']).dt.strftime('%Y-%m-%d %H:%M:%S')
+        df_normalized['tpep_dropoff_datetime'] = pd.to_datetime(
+            df_normalized['tpep_dropoff_datetime']).dt.strftime('%Y-%m-%d %H:%M:%S')
+        print(f"  Timestamps normalized to format: YYYY-MM-DD HH:MM:SS")
     
     # ---- Normalize Numeric Fields ----
     print(f"\n[5.2] Rounding numeric fields to appropriate precision...")
     
     # Trip distance: 2 decimal places
-    df_normalized['trip_distance'] = df_normalized['trip_distance'].round(2)
+    df_normalized['trip_distance'] = round_cents(df_normalized['trip_distance'])
     print(f"  trip_distance: rounded to 2 decimal places")
     
     # Fare, tolls, tax, total: 2 decimal places
     fare_columns = ['fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount', 'total_amount']
     for col in fare_columns:
         if col in df_normalized.columns:
-            df_normalized[col] = df_normalized[col].round(2)
+            df_normalized[col] = round_cents(df_normalized[col])
     print(f"  Fare-related fields: rounded to 2 decimal places")
     
     # Passenger count: integer
@@ -448,44 +842,260 @@ def normalize_data(df, logger):
         df_normalized['RatecodeID'] = df_normalized['RatecodeID'].astype(int)
         print(f"  RatecodeID: converted to integer")
     
+    if lean:
+        compact_dtypes(df_normalized, floats=False)
+    
     # ---- Verify Field Statistics ----
     print(f"\n[5.4] Recording normalized field statistics...")
     
-    logger.log['field_statistics'] = {
-        'trip_distance': {
-            'min': float(df_normalized['trip_distance'].min()),
-            'max': float(df_normalized['trip_distance'].max()),
-            'mean': float(df_normalized['trip_distance'].mean()),
-            'median': float(df_normalized['trip_distance'].median())
-        },
-        'fare_amount': {
-            'min': float(df_normalized['fare_amount'].min()),
-            'max': float(df_normalized['fare_amount'].max()),
-            'mean': float(df_normalized['fare_amount'].mean()),
-            'median': float(df_normalized['fare_amount'].median())
-        },
-        'passenger_count': {
-            'min': int(df_normalized['passenger_count'].min()),
-            'max': int(df_normalized['passenger_count'].max()),
-            'mean': float(df_normalized['passenger_count'].mean()),
-            'mode': int(df_normalized['passenger_count'].mode()[0])
-        },
-        'total_amount': {
-            'min': float(df_normalized['total_amount'].min()),
-            'max': float(df_normalized['total_amount'].max()),
-            'mean': float(df_normalized['total_amount'].mean()),
-            'median': float(df_normalized['total_amount'].median())
-        }
-    }
+    if stats is None:
+        stats = FieldStatistics()
+    stats.add(df_normalized)
+    logger.log['field_statistics'] = stats.to_dict()
     
     print(f"  Field statistics recorded")
     
     return df_normalized
 
 
+# STREAMING MODE
+
+def clean_in_chunks(chunk_size=STREAM_CHUNK_SIZE, path=None, output=None, stats=None, logger=None,
+                    parquet=False, name='part', lean=False):
+    # Stages 1-5 a chunk at a time: every chunk goes through all of them and is appended to the
+    # cleaned output before the next one is read, so only one chunk is ever in memory.
+    # Returns the logger (counts added up over all chunks) and the number of rows written.
+    path = path or TRIP_DATA_PATH
+    output = output or CLEANED_TRIP_DATA
+    print("\n" + "="*80)
+    print(f"STAGE 1: DATA INTEGRATION (streaming, {chunk_size:,} rows per chunk)")
+    print("="*80)
+    
+    logger = logger or DataCleaningLogger()
+    logger.add_stage('integration', 'Load trip data and zone metadata')
+    
+    with logger.measure('integration'):
+        print(f"\n[1.1] Working out imputation medians from: {path}")
+        medians = imputation_medians(path, chunk_size)
+        for field, median in medians.items():
+            print(f"  {field}: {median}")
+        
+        zones_df, valid_locations = load_zone_metadata()
+    
+    seen = SeenTrips()
+    stats = stats if stats is not None else FieldStatistics()
+    now = pd.Timestamp.now()
+    initial_count = 0
+    final_count = 0
+    chunks = 0
+    
+    for chunk in iter_trip_chunks(path, chunk_size):
+        initial_count += len(chunk)
+        if lean:
+            compact_dtypes(chunk)
+        
+        # Stage output is only printed for the first chunk, after that just the running totals
+        quiet = contextlib.redirect_stdout(io.StringIO()) if chunks else contextlib.nullcontext()
+        with quiet:
+            with logger.measure('missing_values'):
+                chunk = handle_missing_values(chunk, valid_locations, logger, medians=medians, lean=lean)
+            with logger.measure('duplicates'):
+                chunk = remove_duplicates(chunk, logger, seen=seen, lean=lean)
+            with logger.measure('outliers'):
+                chunk = detect_and_handle_outliers(chunk, valid_locations, logger, now=now, lean=lean)
+            with logger.measure('normalization'):
+                chunk = normalize_data(chunk, logger, stats=stats, keep_datetimes=parquet, lean=lean)
+        
+        save_cleaned(chunk, output, parquet=parquet, name=f"{name}-{chunks:05d}", append=bool(chunks))
+        final_count += len(chunk)
+        chunks += 1
+        print(f"\n  Chunk {chunks}: {initial_count:,} records read, {final_count:,} kept so far")
+    
+    logger.log['records']['initial_count'] = initial_count
+    logger.log['streaming'] = {'chunk_size': chunk_size, 'chunks': chunks, 'imputation_medians': medians}
+    return logger, final_count
+
+
+# OUTPUT
+
+def write_parquet_partitions(df, root, name='part'):
+    # Add df's rows to the Parquet dataset in root, one folder per pickup date and hour, keeping the
+    # column types; name starts each new file's name so chunks and workers never overwrite each other
+    if df.empty:
+        return
+    pickup = df['tpep_pickup_datetime']
+    df = df.assign(pickup_date=pickup.dt.strftime('%Y-%m-%d'), pickup_hour=pickup.dt.hour.astype('int8'))
+    df.to_parquet(root, engine='pyarrow', partition_cols=PARQUET_PARTITIONS, compression=PARQUET_COMPRESSION,
+                  index=False, basename_template=f"{name}-{{i}}.parquet")
+
+
+def save_cleaned(df, output, parquet=False, name='part', append=False):
+    # Cleaned rows go to one CSV file (appended to after the first chunk) or into the Parquet dataset
+    if parquet:
+        write_parquet_partitions(df, output, name)
+    else:
+        df.to_csv(output, mode='a' if append else 'w', header=not append, index=False)
+
+
+# ONE FILE, OR SEVERAL MONTHS IN PARALLEL
+
+def clean_file(path=None, output=None, stream=False, chunk_size=STREAM_CHUNK_SIZE, logger=None,
+               parquet=False, name='part', lean=False):
+    # Stages 1-5 for one trips file with the cleaned rows saved to output (a CSV file, or a dataset
+    # folder with parquet=True); lean=True runs them on compact column types without per-stage copies
+    # Returns the logger (final_count filled in) and the field statistics before they're summarized
+    path = path or TRIP_DATA_PATH
+    output = output or CLEANED_TRIP_DATA
+    logger = logger or DataCleaningLogger()
+    stats = FieldStatistics()
+    if lean and int(pd.__version__.split('.')[0]) < 3:
+        # Skipping the copies relies on copy-on-write, which is always on from pandas 3
+        pd.set_option('mode.copy_on_write', True)
+    
+    if stream:
+        # Stages 1-5 chunk by chunk; the cleaned CSV is written as it goes
+        logger, final_count = clean_in_chunks(chunk_size, path=path, output=output, stats=stats, logger=logger,
+                                              parquet=parquet, name=name, lean=lean)
+        
+        print("\nSTAGE 6: SAVE AND REPORT")
+        print(f"\n[6.1] Cleaned data was appended chunk by chunk to: {output}")
+    else:
+        # Stage 1: Data Integration
+        with logger.measure('integration'):
+            trips_df, zones_df, valid_locations, logger = load_and_integrate_data(path, logger=logger, lean=lean)
+        
+        # Stage 2a: Missing Values
+        with logger.measure('missing_values'):
+            trips_df = handle_missing_values(trips_df, valid_locations, logger, lean=lean)
+        
+        # Stage 2b: Duplicates
+        with logger.measure('duplicates'):
+            trips_df = remove_duplicates(trips_df, logger, lean=lean)
+        
+        # Stage 2c: Outliers
+        with logger.measure('outliers'):
+            trips_df = detect_and_handle_outliers(trips_df, valid_locations, logger, lean=lean)
+        
+        # Stage 5: Normalization
+        with logger.measure('normalization'):
+            trips_df = normalize_data(trips_df, logger, stats=stats, keep_datetimes=parquet, lean=lean)
+        
+        # Stage 6: Save and Report
+        print("\nSTAGE 6: SAVE AND REPORT")
+        
+        # Save cleaned data
+        print(f"\n[6.1] Saving cleaned data...")
+        save_cleaned(trips_df, output, parquet=parquet, name=name)
+        print(f"  Cleaned data saved to: {output}")
+        final_count = len(trips_df)
+    
+    logger.log['records']['final_count'] = final_count
+    return logger, stats
+
+
+def find_month_files(patterns):
+    # Expand file names and globs (tried as given, then inside data/) into a sorted list of files
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern) or glob.glob(os.path.join(DATA_DIR, pattern))
+        if not matches:
+            raise FileNotFoundError(f"No trip files match {pattern}")
+        paths.extend(sorted(matches))
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def _clean_month(path, output, stream, chunk_size, sample_size, parquet, lean, trace_memory, events_path):
+    # Runs in a worker process; its stage-by-stage printout would only interleave with the others
+    # Parquet workers all write into the one dataset, their files named after the month's file
+    # Events go to a file of the worker's own, copied into the main event log once the month is done
+    logger = DataCleaningLogger(sample_size=sample_size, events_path=events_path, trace_memory=trace_memory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return clean_file(path, output, stream=stream, chunk_size=chunk_size, logger=logger,
+                              parquet=parquet, name=os.path.splitext(os.path.basename(path))[0], lean=lean)
+    finally:
+        logger.close()
+
+
+def merge_cleaned_parts(parts, output):
+    # Concatenate the per-month CSVs in order. Months with a different set of columns (TLC adds
+    # fields now and then) are lined up on every column seen, left blank where a month lacks one.
+    parts = [p for p in parts if os.path.exists(p)]
+    headers = []
+    for part in parts:
+        with open(part) as f:
+            headers.append(f.readline().rstrip('\n').split(','))
+    columns = list(dict.fromkeys(col for header in headers for col in header))
+    
+    with open(output, 'w', newline='') as out:
+        out.write(','.join(columns) + '\n')
+        for part, header in zip(parts, headers):
+            if header == columns:
+                with open(part, newline='') as f:
+                    f.readline()
+                    shutil.copyfileobj(f, out)
+            else:
+                for chunk in pd.read_csv(part, chunksize=STREAM_CHUNK_SIZE, dtype=str, keep_default_na=False):
+                    chunk.reindex(columns=columns, fill_value='').to_csv(out, header=False, index=False)
+
+
+def clean_months(paths, output=None, stream=False, chunk_size=STREAM_CHUNK_SIZE, processes=None, logger=None,
+                 parquet=False, lean=False):
+    # Clean several monthly files at once, one worker process per file, then merge the cleaned rows
+    # into output (in file order) and the loggers and field statistics into one
+    # With parquet=True the workers write straight into the dataset in output, so there's nothing to merge
+    # Duplicates are found within each month; a trip is only ever published in its own month's file.
+    output = output or CLEANED_TRIP_DATA
+    processes = min(processes or os.cpu_count() or 1, len(paths))
+    parts = [output if parquet else f"{output}.part{i}" for i in range(len(paths))]
+    
+    print("\n" + "="*80)
+    print(f"CLEANING {len(paths)} FILES WITH {processes} WORKER PROCESSES"
+          + (f" (streaming, {chunk_size:,} rows per chunk)" if stream else ""))
+    print("="*80)
+    
+    logger = logger or DataCleaningLogger()
+    stats = FieldStatistics()
+    logger.log['files'] = []
+    events = [f"{logger.events_path}.part{i}" if logger.events_path else None for i in range(len(paths))]
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_clean_month, path, part, stream, chunk_size, logger.sample_size, parquet,
+                                   lean, logger.trace_memory, month_events)
+                       for path, part, month_events in zip(paths, parts, events)]
+            # Merged in file order, whichever worker finishes first
+            for path, future, month_events in zip(paths, futures, events):
+                month_logger, month_stats = future.result()
+                name = os.path.basename(path)
+                logger.add_events(month_events, source=name)
+                logger.merge(month_logger, source=name)
+                stats.merge(month_stats)
+                records = month_logger.log['records']
+                logger.log['files'].append({'file': name, 'initial_count': records['initial_count'],
+                                            'final_count': records['final_count']})
+                print(f"  {name}: {records['initial_count']:,} records read, {records['final_count']:,} kept")
+        
+        print("\nSTAGE 6: SAVE AND REPORT")
+        if parquet:
+            print(f"\n[6.1] Cleaned data from {len(paths)} files saved to: {output}")
+        else:
+            print(f"\n[6.1] Merging {len(paths)} cleaned files into: {output}")
+            merge_cleaned_parts(parts, output)
+    finally:
+        for part in parts:
+            if not parquet and os.path.exists(part):
+                os.remove(part)
+        for month_events in events:
+            if month_events and os.path.exists(month_events):
+                os.remove(month_events)
+    
+    logger.log['field_statistics'] = stats.to_dict()
+    return logger
+
+
 # GENERATE FINAL REPORT
 
-def generate_cleaning_report(logger, initial_count, final_count):
+def generate_cleaning_report(logger, initial_count, final_count, output=None):
     # Generate a human-readable report of the cleaning process
     report = f"""
 DATA CLEANING REPORT - Insurtech Project
@@ -508,6 +1118,16 @@ EXCLUSION BREAKDOWN
         pct = (count / (initial_count - final_count) * 100) if (initial_count - final_count) > 0 else 0
         report += f"  • {reason:40s}: {count:5d} ({pct:5.2f}%)\n"
     
+    peaks = {name: stage['peak_memory_mb'] for name, stage in logger.log['stages'].items()
+             if 'peak_memory_mb' in stage}
+    if peaks:
+        report += f"""
+PEAK MEMORY BY STAGE{' (lean column types)' if logger.log.get('lean') else ''}
+--------------------
+"""
+        for name, peak in peaks.items():
+            report += f"  • {name:40s}: {peak:9,.1f} MB\n"
+    
     report += f"""
 NORMALIZED FIELD STATISTICS
 ----------------------------
@@ -547,14 +1167,19 @@ QUALITY CHECKS PERFORMED
 
 OUTPUT
 
-Cleaned data saved to: {CLEANED_TRIP_DATA}
+Cleaned data saved to: {output or CLEANED_TRIP_DATA}
 Detailed log saved to: {CLEANING_LOG_PATH}
 """
     
     return report
 
-def main():
-    # Execute the complete data cleaning pipeline
+def main(stream=False, chunk_size=STREAM_CHUNK_SIZE, months=None, processes=None, sample_issues=None,
+         events_path=None, parquet_dir=None, lean=False, trace_memory=False):
+    # Execute the complete data cleaning pipeline (stream=True works through the trips in chunks)
+    # months: several trip files to clean in parallel worker processes instead of TRIP_DATA_PATH
+    # sample_issues / events_path: see DataCleaningLogger
+    # parquet_dir: write a partitioned Parquet dataset there instead of the cleaned CSV
+    # lean: compact column types and no per-stage copies; trace_memory: peak memory per stage in the log
     print("\nINSURTECH DATA CLEANING PIPELINE")
     print("Rubric Compliance:")
     print("   Data Integration: Load parquet/CSV and zone metadata")
@@ -562,38 +1187,36 @@ def main():
     print("   Normalization: Standardize timestamps, numeric, categorical fields")
     print("   Transparency: Maintain detailed logs of all exclusions")
     
-    # Stage 1: Data Integration
-    trips_df, zones_df, valid_locations, logger = load_and_integrate_data()
-    
-    # Stage 2a: Missing Values
-    trips_df = handle_missing_values(trips_df, valid_locations, logger)
-    
-    # Stage 2b: Duplicates
-    trips_df = remove_duplicates(trips_df, logger)
-    
-    # Stage 2c: Outliers
-    trips_df = detect_and_handle_outliers(trips_df, valid_locations, logger)
-    
-    # Stage 5: Normalization
-    trips_df = normalize_data(trips_df, logger)
-    
-    # Stage 6: Save and Report
-    print("\nSTAGE 6: SAVE AND REPORT")
+    # A Parquet dataset is built in a folder next to the old one and only replaces it once it's complete
+    parquet = bool(parquet_dir)
+    output = parquet_dir or CLEANED_TRIP_DATA
+    building = f"{parquet_dir}.tmp" if parquet else output
+    if parquet:
+        shutil.rmtree(building, ignore_errors=True)
+    
+    logger = DataCleaningLogger(sample_size=sample_issues, events_path=events_path, trace_memory=trace_memory)
+    if lean:
+        logger.log['lean'] = True
+    if months:
+        logger = clean_months(months, output=building, stream=stream, chunk_size=chunk_size, processes=processes,
+                              logger=logger, parquet=parquet, lean=lean)
+    else:
+        logger, _ = clean_file(TRIP_DATA_PATH, building, stream=stream, chunk_size=chunk_size,
+                               logger=logger, parquet=parquet, lean=lean)
     
-    # Save cleaned data
-    print(f"\n[6.1] Saving cleaned data...")
-    trips_df.to_csv(CLEANED_TRIP_DATA, index=False)
-    print(f"  Cleaned data saved to: {CLEANED_TRIP_DATA}")
+    if parquet:
+        os.makedirs(building, exist_ok=True)
+        shutil.rmtree(output, ignore_errors=True)
+        os.replace(building, output)
     
     # Save detailed log
     initial_count = logger.log['records']['initial_count']
-    final_count = len(trips_df)
-    logger.log['records']['final_count'] = final_count
+    final_count = logger.log['records']['final_count']
     logger.save()
     
     # Generate and save report
     print(f"\n[6.2] Generating cleaning report...")
-    report = generate_cleaning_report(logger, initial_count, final_count)
+    report = generate_cleaning_report(logger, initial_count, final_count, output=output)
     
     with open(CLEANING_REPORT_PATH, 'w') as f:
         f.write(report)
@@ -610,4 +1233,43 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Clean the raw trip records before they are loaded")
+    parser.add_argument("--stream", action="store_true",
+                        help="work through the trips file in chunks so memory stays bounded by the chunk size")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE,
+                        help=f"rows per chunk in streaming mode (default {STREAM_CHUNK_SIZE:,})")
+    parser.add_argument("--months", nargs="+", metavar="FILE_OR_GLOB",
+                        help="clean these monthly trip files (names or globs, also looked up in data/) "
+                             "in parallel and merge them into one cleaned CSV")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes for --months (default: one per CPU core)")
+    parser.add_argument("--sample-issues", type=int, metavar="N",
+                        help="keep a random sample of N example issues per stage and reason (with exact counts) "
+                             "instead of the first few")
+    parser.add_argument("--parquet", nargs="?", const=CLEANED_TRIP_PARQUET, metavar="DIR",
+                        help="write typed, compressed Parquet partitioned by pickup date and hour instead of the CSV "
+                             f"(default folder: {CLEANED_TRIP_PARQUET}, replaced on every run)")
+    parser.add_argument("--log-jsonl", nargs="?", const=CLEANING_EVENTS_PATH, metavar="PATH",
+                        help="also append cleaning events to a JSON Lines file as they happen "
+                             f"(default path: {CLEANING_EVENTS_PATH})")
+    parser.add_argument("--lean", action="store_true",
+                        help="clean with compact column types (small ints, float32 money, categoricals) "
+                             "and no per-stage copies")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record each stage's peak memory (tracemalloc) in the log and report")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.processes is not None and args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.sample_issues is not None and args.sample_issues < 1:
+        parser.error("--sample-issues must be at least 1")
+    months = None
+    if args.months:
+        try:
+            months = find_month_files(args.months)
+        except FileNotFoundError as e:
+            parser.error(str(e))
+    main(stream=args.stream, chunk_size=args.chunk_size, months=months, processes=args.processes,
+         sample_issues=args.sample_issues, events_path=args.log_jsonl, parquet_dir=args.parquet,
+         lean=args.lean, trace_memory=args.trace_memory)
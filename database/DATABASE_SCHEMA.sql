@@ -90,6 +90,8 @@ CREATE TABLE overview_metrics (
 -- 7. Zone Hourly Metrics (1200 rows)
 -- The main analytics table with one row per zone per hour
 -- Has trip counts, exposure, congestion, fare swings, and risk scores
+-- stability_score is generated from risk_score; idx_hour_risk covers "top zones for an hour",
+-- and zone lookups use the primary key
 CREATE TABLE zone_hourly_metrics (
     zone_id             INT            NOT NULL,
     hour                INT            NOT NULL,
@@ -99,59 +101,114 @@ CREATE TABLE zone_hourly_metrics (
     congestion_index    DECIMAL(10,2)  DEFAULT NULL,
     revenue_volatility  DECIMAL(10,2)  DEFAULT NULL,
     risk_score          DECIMAL(10,2)  DEFAULT NULL,
+    stability_score     DECIMAL(10,2)  AS (ROUND(100 - COALESCE(risk_score, 0), 2)) STORED,
     zone_name           VARCHAR(100)   DEFAULT NULL,
     PRIMARY KEY (zone_id, hour),
-    INDEX idx_hour (hour),
-    INDEX idx_zone (zone_id),
-    INDEX idx_risk (risk_score),
+    INDEX idx_hour_risk (hour, risk_score DESC, trip_count, exposure_index, zone_name),
     FOREIGN KEY (zone_id) REFERENCES zone(zone_id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
 
--- 8. Zone Hourly Risk (1200 rows)
--- Smaller version of metrics table, just risk scores and trip counts
-CREATE TABLE zone_hourly_risk (
-    zone_id     INT            NOT NULL,
-    hour        INT            NOT NULL,
-    risk_score  DECIMAL(10,2)  DEFAULT NULL,
-    trip_count  INT            DEFAULT 0,
-    zone_name   VARCHAR(100)   DEFAULT NULL,
-    PRIMARY KEY (zone_id, hour),
-    INDEX idx_hour (hour),
-    FOREIGN KEY (zone_id) REFERENCES zone(zone_id) ON DELETE CASCADE
+-- 8. Zone Hourly Risk (view, 1200 rows)
+-- Used to be its own copy of the risk columns; now just a view over zone_hourly_metrics
+CREATE VIEW zone_hourly_risk AS
+SELECT zone_id, hour, risk_score, trip_count, zone_name
+FROM zone_hourly_metrics;
+
+
+-- 9. Zone Hourly Details (view, 1200 rows)
+-- Full breakdown per zone per hour, used when you click into a zone (also a view now)
+CREATE VIEW zone_hourly_details AS
+SELECT zone_id, hour, zone_name, trip_count, avg_trip_duration,
+       exposure_index, revenue_volatility, stability_score, risk_score
+FROM zone_hourly_metrics;
+
+
+-- 10. Driver Risk Scores (one row per driver)
+-- Each driver's composite score, worked out ahead of time by database/refresh_driver_scores.py
+-- zone_ids and hours are JSON lists so the API can build the explanation without more queries
+-- zone_risk_version is the overview_metrics.last_updated the score was worked out against
+CREATE TABLE driver_risk_scores (
+    driver_id             INT            NOT NULL,
+    composite_risk_score  DECIMAL(5,2)   NOT NULL,
+    risk_level            VARCHAR(10)    NOT NULL,
+    total_trips           INT            NOT NULL DEFAULT 0,
+    zone_count            INT            NOT NULL DEFAULT 0,
+    hour_count            INT            NOT NULL DEFAULT 0,
+    zone_ids              JSON           NOT NULL,
+    hours                 JSON           NOT NULL,
+    zone_risk_version     DATETIME       DEFAULT NULL,
+    computed_at           TIMESTAMP      DEFAULT CURRENT_TIMESTAMP
+                                         ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (driver_id),
+    FOREIGN KEY (driver_id) REFERENCES user(user_id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
 
--- 9. Zone Hourly Details (1200 rows)
--- Full breakdown per zone per hour, used when you click into a zone
-CREATE TABLE zone_hourly_details (
-    zone_id             INT            NOT NULL,
-    hour                INT            NOT NULL,
-    zone_name           VARCHAR(100)   DEFAULT NULL,
-    trip_count          INT            DEFAULT 0,
-    avg_trip_duration   DECIMAL(8,2)   DEFAULT NULL,
-    exposure_index      DECIMAL(5,2)   DEFAULT NULL,
-    revenue_volatility  DECIMAL(5,2)   DEFAULT NULL,
-    stability_score     DECIMAL(5,2)   DEFAULT NULL,
-    risk_score          DECIMAL(5,2)   DEFAULT NULL,
+
+-- 11. Zone Hourly Stats (one row per zone-hour with trips)
+-- Running totals per zone per hour that every metric in zone_hourly_metrics is worked out from
+-- populate_precomputed_tables.py --incremental only adds the newly loaded trips to them
+CREATE TABLE zone_hourly_stats (
+    zone_id        INT             NOT NULL,
+    hour           INT             NOT NULL CHECK (hour >= 0 AND hour <= 23),
+    zone_name      VARCHAR(100),
+    trip_count     INT             NOT NULL DEFAULT 0,
+    duration_sum   BIGINT          NOT NULL DEFAULT 0,
+    fare_count     INT             NOT NULL DEFAULT 0,
+    fare_sum       DECIMAL(20,2)   NOT NULL DEFAULT 0,
+    fare_sq_sum    DECIMAL(30,4)   NOT NULL DEFAULT 0,
     PRIMARY KEY (zone_id, hour),
     FOREIGN KEY (zone_id) REFERENCES zone(zone_id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
 
+-- 12. Precompute Watermark (1 row)
+-- The last trip_id added to zone_hourly_stats, and that trip's pickup time so a reloaded trip table is spotted
+CREATE TABLE precompute_watermark (
+    id                INT         PRIMARY KEY DEFAULT 1,
+    last_trip_id      INT         NOT NULL DEFAULT 0,
+    last_pickup_time  DATETIME    DEFAULT NULL,
+    total_trips       BIGINT      NOT NULL DEFAULT 0,
+    updated_at        TIMESTAMP   DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CHECK (id = 1)
+) ENGINE=InnoDB;
+
+
+-- 13. Zone Daily Hourly Stats (one row per day, zone and hour with trips)
+-- The zone_hourly_stats totals split by pickup date; the API keeps running sums of them over the days
+-- so /api/zone and /api/top_zones can answer for any start/end date range
+CREATE TABLE zone_daily_hourly_stats (
+    pickup_date    DATE            NOT NULL,
+    zone_id        INT             NOT NULL,
+    hour           INT             NOT NULL CHECK (hour >= 0 AND hour <= 23),
+    trip_count     INT             NOT NULL DEFAULT 0,
+    duration_sum   BIGINT          NOT NULL DEFAULT 0,
+    fare_count     INT             NOT NULL DEFAULT 0,
+    fare_sum       DECIMAL(20,2)   NOT NULL DEFAULT 0,
+    fare_sq_sum    DECIMAL(30,4)   NOT NULL DEFAULT 0,
+    PRIMARY KEY (pickup_date, zone_id, hour)
+) ENGINE=InnoDB;
+
+
 -- How the tables connect to each other
 --
--- zone has many locations, metrics, risk rows, and details
+-- zone has many locations, metrics, risk rows, details, and stats rows
 -- location has many trips (through pickup and dropoff IDs)
--- user has many driver_operations
+-- user has many driver_operations and one driver_risk_scores row
 -- overview_metrics is just one row on its own
 --
 -- Which API uses which table
 --
--- GET  /api/overview          reads overview_metrics
--- GET  /api/zone/<id>         reads zone_hourly_details
--- GET  /api/top_zones?hour=H  reads zone_hourly_metrics
--- POST /api/driver-risk       reads user + driver_operations
+-- GET  /api/overview          served from memory (overview_metrics, loaded with the zone metrics)
+-- GET  /api/zone/<id>         served from memory (zone_hourly_metrics, loaded at startup)
+-- GET  /api/top_zones?hour=H  served from memory (zone_hourly_metrics, loaded at startup)
+-- GET  /api/hourly_density    served from memory (zone_hourly_metrics, loaded at startup)
+--      with ?start=&end= /api/zone and /api/top_zones use zone_daily_hourly_stats (also loaded at startup)
+--      the in-memory copy reloads when overview_metrics.last_updated moves forward
+-- POST /api/driver-risk       reads user + driver_risk_scores (primary key lookup)
+--                             falls back to driver_operations for drivers not scored yet
+--                             (or scored against older zone risks)
 
 
 
@@ -0,0 +1,198 @@
+# Builds the zone_hourly_metrics grid in Python straight from the trip files (Parquet or CSV)
+# Used by `populate_precomputed_tables.py --engine pandas` so the heavy aggregation runs on the
+# worker instead of in MySQL. Numbers come out identical to the SQL path: the trips are summed per
+# zone-hour here and the metrics worked out from those sums by api/metric_formulas.py. The sums
+# themselves (per zone-hour and per day) are kept too, for zone_hourly_stats and zone_daily_hourly_stats.
+
+import sys
+import os
+import csv
+import numpy as np
+import pandas as pd
+
+# Same files load_data.py reads
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+
+from metric_formulas import HOURS, derive_metrics
+
+LOCATION_CSV = os.path.join(PROJECT_ROOT, 'data', 'locations.csv')
+TRIP_CSV = os.path.join(PROJECT_ROOT, 'data', 'cleaned_yellow_trips.csv')
+
+TRIP_COLUMNS = ['VendorID', 'tpep_pickup_datetime', 'tpep_dropoff_datetime',
+                'PULocationID', 'DOLocationID', 'fare_amount']
+
+def read_trips(path=TRIP_CSV):
+    # Load the columns we need from a .parquet or .csv trips file, or a Parquet dataset folder
+    # (data_cleaning.py --parquet); the partition columns aren't among them so only these are read
+    if path.endswith('.parquet') or os.path.isdir(path):
+        trips = pd.read_parquet(path, columns=TRIP_COLUMNS)
+    else:
+        trips = pd.read_csv(path, usecols=TRIP_COLUMNS)
+
+    # load_data.py skips rows whose ids don't parse, so drop the same ones here
+    for col in ('VendorID', 'PULocationID', 'DOLocationID', 'fare_amount'):
+        trips[col] = pd.to_numeric(trips[col], errors='coerce')
+    for col in ('tpep_pickup_datetime', 'tpep_dropoff_datetime'):
+        trips[col] = pd.to_datetime(trips[col], errors='coerce')
+    return trips.dropna(subset=['VendorID', 'PULocationID', 'DOLocationID',
+                                'tpep_pickup_datetime', 'tpep_dropoff_datetime'])
+
+
+def read_zones(path=LOCATION_CSV):
+    # Zones and the location -> zone mapping from locations.csv, numbered the way load_data.py
+    # inserts them (first appearance order) in case the real ids aren't available
+    # Returns ({zone_name: (zone_id, borough)}, {loc_id: zone_name})
+    zones = {}
+    locations = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            if r['Zone'] not in zones:
+                zones[r['Zone']] = (len(zones) + 1, r['Borough'])
+            locations[int(r['LocationID'])] = r['Zone']
+    return zones, locations
+
+
+class ZoneHourlyGrid:
+    """zones x 24 metrics built from trips; money and scores are int64 cents
+
+    sums holds the totals the metrics came from (SUM_COLUMNS, zones x 24; fare_sq_sum in cents
+    squared) and daily the same totals for every day-zone-hour with trips, as
+    (first_day, day offsets, grid rows, hours, {total: values}).
+    """
+
+    def __init__(self, zone_ids, zone_names, total_trips, trip_count, exposure, duration,
+                 congestion, volatility, risk, sums=None, daily=None):
+        self.zone_ids = zone_ids
+        self.zone_names = zone_names
+        self.total_trips = total_trips      # every trip read, including ones outside known zones
+        self.trip_count = trip_count
+        self.exposure = exposure
+        self.duration = duration
+        self.congestion = congestion
+        self.volatility = volatility        # one value per zone, repeated for its hours when written
+        self.risk = risk
+        self.sums = sums
+        self.daily = daily
+
+    def metrics_rows(self):
+        # zone_hourly_metrics rows (zone-hours without trips are all zeros, like fill_missing_hours)
+        rows = []
+        for i, (zone_id, zone_name) in enumerate(zip(self.zone_ids, self.zone_names)):
+            for h in range(HOURS):
+                if self.trip_count[i, h]:
+                    rows.append((zone_id, h, int(self.trip_count[i, h]), _cents(self.exposure[i, h]),
+                                 _cents(self.duration[i, h]), _cents(self.congestion[i, h]),
+                                 _cents(self.volatility[i]), _cents(self.risk[i, h]), zone_name))
+                else:
+                    rows.append((zone_id, h, 0, 0, 0, 0, 0, 0, zone_name))
+        return rows
+
+    def stats_rows(self):
+        # zone_hourly_stats rows: one per zone-hour with trips, like the SQL fold
+        rows = []
+        for i, h in zip(*np.nonzero(self.sums["trip_count"])):
+            rows.append((self.zone_ids[i], int(h), self.zone_names[i]) + _sum_values(self.sums, (i, h)))
+        return rows
+
+    def daily_rows(self):
+        # zone_daily_hourly_stats rows: one per day-zone-hour with trips
+        first_day, days, cells, hours, sums = self.daily
+        dates = (first_day + days).astype(object)
+        return [(dates[k], self.zone_ids[cells[k]], int(hours[k])) + _sum_values(sums, k)
+                for k in range(len(days))]
+
+
+# Totals in the order the stats tables take them
+SUM_COLUMNS = ("trip_count", "duration_sum", "fare_count", "fare_sum", "fare_sq_sum")
+
+
+def _sum_values(sums, at):
+    return (int(sums["trip_count"][at]), int(sums["duration_sum"][at]), int(sums["fare_count"][at]),
+            _cents(sums["fare_sum"][at]), _cents(sums["fare_sq_sum"][at], places=4))
+
+
+def _cents(value, places=2):
+    # int cents (or ten-thousandths with places=4) -> a string MySQL stores exactly in a DECIMAL(x,places) column
+    value = int(value)
+    scale = 10 ** places
+    sign = "-" if value < 0 else ""
+    return f"{sign}{abs(value) // scale}.{abs(value) % scale:0{places}d}"
+
+
+def _sum_cells(cell, size, minutes, fare_cents, has_fare):
+    # SUM_COLUMNS for every cell, as exact int64 (fare sums: sort fares by cell and add up each cell's run)
+    trip_count = np.bincount(cell, minlength=size).astype(np.int64)
+    duration_sum = np.bincount(cell, weights=minutes, minlength=size).astype(np.int64)
+
+    fare_cell = cell[has_fare]
+    fare_count = np.bincount(fare_cell, minlength=size).astype(np.int64)
+    cents = fare_cents[has_fare][np.argsort(fare_cell, kind='stable')]
+    with_fares = np.flatnonzero(fare_count)
+    starts = (np.cumsum(fare_count) - fare_count)[with_fares]
+    fare_sum = np.zeros(size, dtype=np.int64)
+    fare_sq_sum = np.zeros(size, dtype=np.int64)
+    if len(with_fares):
+        fare_sum[with_fares] = np.add.reduceat(cents, starts)
+        fare_sq_sum[with_fares] = np.add.reduceat(cents * cents, starts)
+    return dict(zip(SUM_COLUMNS, (trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)))
+
+
+def build_grid(trips, zones, locations, zone_ids=None):
+    # Everything zone_hourly_metrics holds, worked out with grouped numpy operations
+    # zone_ids maps zone_name -> zone_id as stored in the Zone table (defaults to load order)
+    names = list(zones)
+    if zone_ids is None:
+        zone_ids = {name: zones[name][0] for name in names}
+    names = [n for n in names if n in zone_ids]
+    row_of = {name: i for i, name in enumerate(names)}
+    n_zones = len(names)
+
+    # Pickup location -> grid row (-1 when the location or its zone is unknown, like the SQL join)
+    loc_ids = np.array(list(locations), dtype=np.int64)
+    loc_rows = np.array([row_of.get(locations[l], -1) for l in loc_ids], dtype=np.int64)
+    lookup = np.full(int(loc_ids.max()) + 1 if len(loc_ids) else 1, -1, dtype=np.int64)
+    lookup[loc_ids] = loc_rows
+
+    pu = trips['PULocationID'].to_numpy(dtype=np.int64)
+    rows = np.full(len(pu), -1, dtype=np.int64)
+    in_range = (pu >= 0) & (pu < len(lookup))
+    rows[in_range] = lookup[pu[in_range]]
+    known = rows >= 0
+
+    pickup = trips['tpep_pickup_datetime'].to_numpy()[known]
+    dropoff = trips['tpep_dropoff_datetime'].to_numpy()[known]
+    rows = rows[known]
+    hours = pd.DatetimeIndex(pickup).hour.to_numpy().astype(np.int64)
+    cell = rows * HOURS + hours
+    size = n_zones * HOURS
+
+    # TIMESTAMPDIFF(MINUTE, ...) drops the seconds, rounding toward zero
+    seconds = (dropoff.astype('datetime64[s]') - pickup.astype('datetime64[s]')).astype(np.int64)
+    minutes = np.sign(seconds) * (np.abs(seconds) // 60)
+
+    # Fares as whole cents (DECIMAL(10,2) in the trip table); missing fares are left out like in SUM/COUNT
+    fare = trips['fare_amount'].to_numpy(dtype=np.float64)[known]
+    has_fare = ~np.isnan(fare)
+    fare_cents = np.zeros(len(fare), dtype=np.int64)
+    fare_cents[has_fare] = (np.sign(fare[has_fare]) * np.floor(np.abs(fare[has_fare]) * 100 + 0.5 + 1e-9)).astype(np.int64)
+
+    # Summed per day-zone-hour first (only the ones with trips), then per zone-hour from those
+    pickup_days = pickup.astype('datetime64[D]')
+    first_day = pickup_days.min() if len(pickup_days) else np.datetime64('1970-01-01', 'D')
+    day_cells, day_cell = np.unique((pickup_days - first_day).astype(np.int64) * size + cell, return_inverse=True)
+    day_sums = _sum_cells(day_cell.ravel(), len(day_cells), minutes, fare_cents, has_fare)
+
+    sums = {}
+    for c, values in day_sums.items():
+        sums[c] = np.zeros(size, dtype=np.int64)
+        np.add.at(sums[c], day_cells % size, values)
+        sums[c] = sums[c].reshape(n_zones, HOURS)
+    daily = (first_day, day_cells // size, day_cells % size // HOURS, day_cells % HOURS, day_sums)
+
+    m = derive_metrics(sums["trip_count"], sums["duration_sum"], sums["fare_count"], sums["fare_sum"],
+                       sums["fare_sq_sum"])
+
+    return ZoneHourlyGrid([zone_ids[n] for n in names], names, len(trips), sums["trip_count"], m["exposure"],
+                          m["duration"], m["congestion"], m["volatility"], m["risk"], sums=sums, daily=daily)
@@ -0,0 +1,238 @@
+# Stage timings for the database scripts (load_data, populate_precomputed_tables, seed_drivers)
+# Each script opens a RunReport, wraps its connection, and runs its steps inside report.stage(...).
+# Every statement run through a wrapped connection is recorded against the current stage: how often
+# it ran, how long it took and how many rows it returned or changed. Set DB_EXPLAIN=1 to also keep
+# MySQL's EXPLAIN FORMAT=JSON plan for the statements in stages marked explain=True.
+# The report is written as JSON to data/<script>_run_report.json, next to data_cleaning_log.json.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
+REPORT_DIR = os.path.join(PROJECT_ROOT, 'data')
+
+# Plans are only fetched when asked for, since EXPLAIN costs a round trip per statement
+EXPLAIN = os.environ.get("DB_EXPLAIN", "").lower() in ("1", "true", "yes")
+
+# Statements are grouped by their text; long ones are cut down to this many characters in the report
+MAX_SQL_LENGTH = 500
+
+WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+EXPLAIN_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+def _normalize(sql):
+    return " ".join(str(sql).split())
+
+
+class Stage:
+    """Wall time, row counts and statements for one step of a script"""
+
+    def __init__(self, name, explain=False):
+        self.name = name
+        self.explain = explain
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.status = "running"
+        self.error = None
+        self.rows_read = 0
+        self.rows_written = 0
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def count(self, read=0, written=0):
+        # For rows that don't go through a wrapped cursor (CSV lines, rows built in Python)
+        with self._lock:
+            self.rows_read += read
+            self.rows_written += written
+
+    def record(self, sql, seconds, read=0, written=0, calls=1):
+        key = sql[:MAX_SQL_LENGTH]
+        with self._lock:
+            entry = self.statements.setdefault(key, {"sql": key, "calls": 0, "seconds": 0.0,
+                                                     "rows_read": 0, "rows_written": 0})
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+            entry["rows_read"] += read
+            entry["rows_written"] += written
+            self.rows_read += read
+            self.rows_written += written
+        return entry
+
+    def to_dict(self):
+        statements = sorted(self.statements.values(), key=lambda s: -s["seconds"])
+        for s in statements:
+            s["seconds"] = round(s["seconds"], 4)
+        return {
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "statements": statements
+        }
+
+
+class RunReport:
+    """Every stage of one script run, saved as a JSON report at the end"""
+
+    def __init__(self, script, explain=EXPLAIN, path=None):
+        self.script = script
+        self.explain = explain
+        self.path = path or os.path.join(REPORT_DIR, f"{script}_run_report.json")
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.stages = []
+        self.current = None
+        self.info = {}
+
+    @contextmanager
+    def stage(self, name, explain=False):
+        # Everything run through a wrapped connection inside the block is counted for this stage
+        stage = Stage(name, explain=explain and self.explain)
+        previous, self.current = self.current, stage
+        self.stages.append(stage)
+        try:
+            yield stage
+            stage.status = "ok"
+        except BaseException as e:
+            stage.status = "failed"
+            stage.error = str(e) or type(e).__name__
+            raise
+        finally:
+            stage.seconds = time.perf_counter() - stage.started
+            self.current = previous
+            print(f"   [{name}: {stage.seconds:.2f}s, {stage.rows_read} rows read, "
+                  f"{stage.rows_written} rows written]")
+
+    def wrap(self, conn):
+        # A connection whose cursors report to this run (None stays None so callers can still check it)
+        if conn is None or isinstance(conn, InstrumentedConnection):
+            return conn
+        return InstrumentedConnection(conn, self)
+
+    def to_dict(self):
+        return {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "explain": self.explain,
+            "info": self.info,
+            "stages": [s.to_dict() for s in self.stages]
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        print(f"Run report saved to: {self.path}")
+        return self.path
+
+
+def wrap_like(parent, conn):
+    # Instrument conn for the same run as parent (for worker connections opened mid-stage)
+    if isinstance(parent, InstrumentedConnection):
+        return parent._report.wrap(conn)
+    return conn
+
+
+class InstrumentedConnection:
+    """Passes everything through to the real connection, but hands out recording cursors"""
+
+    def __init__(self, conn, report):
+        self._conn = conn
+        self._report = report
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._conn, self._report)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class InstrumentedCursor:
+    """Times each execute and counts the rows it changes and the rows fetched back"""
+
+    def __init__(self, cursor, conn, report):
+        self._cursor = cursor
+        self._conn = conn
+        self._report = report
+        self._entry = None
+
+    def _stage(self):
+        return self._report.current
+
+    def _explain(self, sql, params, entry):
+        # Plan for the statement as it is about to run, kept once per statement text
+        if "plan" in entry or not sql.lstrip().upper().startswith(EXPLAIN_VERBS):
+            return
+        explain_cursor = self._conn.cursor()
+        try:
+            explain_cursor.execute("EXPLAIN FORMAT=JSON " + sql, params)
+            row = explain_cursor.fetchone()
+            entry["plan"] = json.loads(row[0]) if row else None
+        except Exception as e:
+            entry["plan"] = {"error": str(e)}
+        finally:
+            explain_cursor.close()
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        stage = self._stage()
+        if stage is None:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+
+        sql = _normalize(operation)
+        entry = stage.record(sql, 0.0, calls=0)
+        if stage.explain:
+            self._explain(operation, params, entry)
+
+        start = time.perf_counter()
+        result = self._cursor.execute(operation, params, *args, **kwargs)
+        written = max(self._cursor.rowcount, 0) if sql.upper().startswith(WRITE_VERBS) else 0
+        stage.record(sql, time.perf_counter() - start, written=written)
+        self._entry = (stage, sql)
+        return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        stage = self._stage()
+        if stage is None:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+        sql = _normalize(operation)
+        start = time.perf_counter()
+        result = self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        stage.record(sql, time.perf_counter() - start, written=max(self._cursor.rowcount, 0))
+        self._entry = None
+        return result
+
+    def _fetched(self, rows):
+        if self._entry is not None and rows:
+            stage, sql = self._entry
+            stage.record(sql, 0.0, read=rows, calls=0)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
@@ -1,18 +1,25 @@
 # Reads CSV files from the data folder and loads them into the database
+# The trips can also come from the Parquet dataset data_cleaning.py --parquet writes
 
 import sys
 import os
 import csv
+import argparse
 
 # Figure out where this file is so we can find other project files
 DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
 sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
 from database_config import get_connection
+import instrumentation
 
 LOCATION_CSV = os.path.join(PROJECT_ROOT, 'data', 'locations.csv')
 TRIP_CSV = os.path.join(PROJECT_ROOT, 'data', 'cleaned_yellow_trips.csv')
 
+# Columns of the cleaned trips in the order the trip table's INSERT takes them
+TRIP_COLUMNS = ['VendorID', 'tpep_pickup_datetime', 'tpep_dropoff_datetime', 'passenger_count',
+                'trip_distance', 'PULocationID', 'DOLocationID', 'fare_amount', 'total_amount']
+
 
 def create_tables(conn):
     # Wipe the old tables and make fresh ones
@@ -21,6 +28,9 @@ def create_tables(conn):
     cur.execute("SET FOREIGN_KEY_CHECKS=0")
     for t in ('trip', 'location', 'zone'):
         cur.execute(f"DROP TABLE IF EXISTS `{t}`")
+    # Trip ids start again at 1, so the precompute watermark would point at different trips;
+    # without it the next populate_precomputed_tables.py run rebuilds the stats from every trip
+    cur.execute("DROP TABLE IF EXISTS precompute_watermark")
     cur.execute("SET FOREIGN_KEY_CHECKS=1")
     conn.commit()
 
@@ -34,7 +44,7 @@ def create_tables(conn):
         ) ENGINE=InnoDB;
     """)
 
- cur.execute("""
+    cur.execute("""
         CREATE TABLE location (
             loc_id        INT          NOT NULL,
             borough       VARCHAR(50)  DEFAULT NULL,
@@ -45,7 +55,7 @@ def create_tables(conn):
         ) ENGINE=InnoDB;
     """)
 
-cur.execute("""
+    cur.execute("""
         CREATE TABLE trip (
             trip_id              INT           NOT NULL AUTO_INCREMENT,
             vendor_id            INT           DEFAULT NULL,
@@ -64,12 +74,12 @@ cur.execute("""
         ) ENGINE=InnoDB;
     """)
 
-   conn.commit()
+    conn.commit()
     cur.close()
     print("[1/3] Tables created (zone, location, trip)")
 
 def load_locations(conn):
-    # Read locations.csv and fill the zone and location tables
+    # Read locations.csv and fill the zone and location tables (returns how many CSV rows were read)
     cur = conn.cursor()
 
     with open(LOCATION_CSV, 'r', encoding='utf-8') as f:
@@ -104,7 +114,7 @@ def load_locations(conn):
         service = r['service_zone']
         zone_id = zone_map.get(zone_name)
 
- cur.execute(
+        cur.execute(
             "INSERT INTO location (loc_id, borough, zone_name, service_zone, zone_id) "
             "VALUES (%s, %s, %s, %s, %s)",
             (loc_id, borough, zone_name, service, zone_id)
@@ -113,10 +123,33 @@ def load_locations(conn):
     conn.commit()
     cur.close()
     print(f"[2/3] Loaded {len(zones_seen)} zones and {len(rows)} locations from locations.csv")
+    return len(rows)
+
+
+def is_parquet(path):
+    # A single .parquet file or a dataset folder of them
+    return os.path.isdir(path) or path.endswith('.parquet')
 
 
-def load_trips(conn, batch_size=500):
-    # Read the trips CSV and load them into the trip table in batches
+def parquet_trip_batches(path, batch_size):
+    # Insert-ready rows from a Parquet file or dataset, batch_size at a time
+    # Only the trip table's columns are read; the values are already typed, so the timestamps just
+    # need the same text form the CSV has and missing values become None
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    for record_batch in dataset.to_batches(columns=TRIP_COLUMNS, batch_size=batch_size):
+        df = record_batch.to_pandas()
+        for col in ('tpep_pickup_datetime', 'tpep_dropoff_datetime'):
+            df[col] = pd.to_datetime(df[col]).dt.strftime('%Y-%m-%d %H:%M:%S')
+        df = df.astype(object).where(df.notna(), None)
+        yield list(df.itertuples(index=False, name=None))
+
+
+def load_trips(conn, batch_size=500, trip_csv=TRIP_CSV):
+    # Read the trips CSV (or Parquet) and load them into the trip table in batches
+    # (returns how many rows were read)
     cur = conn.cursor()
 
     insert_sql = """
@@ -126,81 +159,105 @@ def load_trips(conn, batch_size=500):
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
 
-  batch = []
+    batch = []
     total = 0
     skipped = 0
 
-    with open(TRIP_CSV, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-
-        for i, r in enumerate(reader, 1):
-            try:
-                batch.append((
-                    int(r['VendorID']),
-                    r['tpep_pickup_datetime'],
-                    r['tpep_dropoff_datetime'],
-                    int(r['passenger_count']) if r['passenger_count'] else None,
-                    float(r['trip_distance']) if r['trip_distance'] else None,
-                    int(r['PULocationID']),
-                    int(r['DOLocationID']),
-                    float(r['fare_amount']) if r['fare_amount'] else None,
-                    float(r['total_amount']) if r['total_amount'] else None,
-                ))
- except (ValueError, KeyError) as e:
-                skipped += 1
-                if skipped <= 5:
-                    print(f"  Warning: row {i} skipped – {e}")
-                continue
-
-            if len(batch) >= batch_size:
-                cur.executemany(insert_sql, batch)
-                conn.commit()
-                total += len(batch)
-                batch = []
-                print(f"  {total} trips inserted...")
-
-   if batch:
+    if is_parquet(trip_csv):
+        for batch in parquet_trip_batches(trip_csv, batch_size):
+            cur.executemany(insert_sql, batch)
+            conn.commit()
+            total += len(batch)
+            print(f"  {total} trips inserted...")
+        batch = []
+    else:
+        with open(trip_csv, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+
+            for i, r in enumerate(reader, 1):
+                try:
+                    batch.append((
+                        int(r['VendorID']),
+                        r['tpep_pickup_datetime'],
+                        r['tpep_dropoff_datetime'],
+                        int(r['passenger_count']) if r['passenger_count'] else None,
+                        float(r['trip_distance']) if r['trip_distance'] else None,
+                        int(r['PULocationID']),
+                        int(r['DOLocationID']),
+                        float(r['fare_amount']) if r['fare_amount'] else None,
+                        float(r['total_amount']) if r['total_amount'] else None,
+                    ))
+                except (ValueError, KeyError) as e:
+                    skipped += 1
+                    if skipped <= 5:
+                        print(f"  Warning: row {i} skipped – {e}")
+                    continue
+
+                if len(batch) >= batch_size:
+                    cur.executemany(insert_sql, batch)
+                    conn.commit()
+                    total += len(batch)
+                    batch = []
+                    print(f"  {total} trips inserted...")
+
+    if batch:
         cur.executemany(insert_sql, batch)
         conn.commit()
         total += len(batch)
 
     cur.close()
-    msg = f"[3/3] Loaded {total} trips from cleaned_yellow_trips.csv"
+    msg = f"[3/3] Loaded {total} trips from {os.path.basename(trip_csv)}"
     if skipped:
         msg += f"  ({skipped} rows skipped)"
     print(msg)
+    return total + skipped
 
 
-def main():
+def main(trip_csv=TRIP_CSV):
+    # Returns True if everything loaded (the pipeline runner uses this)
     print("Insurtech Data Loader")
     print()
 
-    # Make sure the CSV files are there before we start
-    for label, path in [('Location CSV', LOCATION_CSV), ('Trip CSV', TRIP_CSV)]:
+    # Make sure the input files are there before we start
+    for label, path in [('Location CSV', LOCATION_CSV), ('Trip data', trip_csv)]:
         if not os.path.exists(path):
             print(f"ERROR: {label} not found at {path}")
-            return
-        
- conn = get_connection()
+            return False
+
+    # Timings, row counts and SQL per stage end up in data/load_data_run_report.json
+    report = instrumentation.RunReport("load_data")
+    report.info = {"trip_csv": trip_csv}
+
+    conn = report.wrap(get_connection())
     if not conn:
         print("ERROR: Could not connect to database")
-        return
+        return False
 
     try:
-        create_tables(conn)
-        load_locations(conn)
-        load_trips(conn)
+        with report.stage("create_tables"):
+            create_tables(conn)
+        with report.stage("load_locations") as stage:
+            stage.count(read=load_locations(conn))
+        with report.stage("load_trips") as stage:
+            stage.count(read=load_trips(conn, trip_csv=trip_csv))
         print("\nDone – all data loaded successfully.")
+        return True
     except Exception as e:
         print(f"ERROR: {e}")
         import traceback
         traceback.print_exc()
+        return False
     finally:
         conn.close()
+        report.save()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create the base tables and load the zones, locations and trips")
+    parser.add_argument("--trips", default=TRIP_CSV,
+                        help="cleaned trips: a .csv, a .parquet file or a Parquet dataset folder")
+    args = parser.parse_args()
+    main(trip_csv=args.trips)
 
 
 
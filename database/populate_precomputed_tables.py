@@ -8,278 +8,566 @@ DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
 sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
 
-from database_config import get_connection
+from database_config import get_connection, POOL_SIZE
+import argparse
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
+import aggregation_engine
+import instrumentation
+import metrics_artifact
+from metrics_store import load_grid, load_daily_rollup, fetch_version
 
+# Running totals per zone-hour that every metric can be worked out from.
+# New trips are added on top, so a refresh only has to read the trips loaded since the last one.
+CREATE_ZONE_HOURLY_STATS = """
+    CREATE TABLE IF NOT EXISTS zone_hourly_stats (
+        zone_id INT NOT NULL,
+        hour INT NOT NULL CHECK (hour >= 0 AND hour <= 23),
+        zone_name VARCHAR(100),
+        trip_count INT NOT NULL DEFAULT 0,
+        duration_sum BIGINT NOT NULL DEFAULT 0,
+        fare_count INT NOT NULL DEFAULT 0,
+        fare_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+        fare_sq_sum DECIMAL(30, 4) NOT NULL DEFAULT 0,
+        PRIMARY KEY (zone_id, hour),
+        FOREIGN KEY (zone_id) REFERENCES Zone(zone_id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;
+"""
 
-def populate_zone_hourly_metrics(conn):
-    # Count trips per zone per hour, then figure out exposure, duration, congestion, volatility, and risk
-    cursor = conn.cursor()
-    
-    print("\nComputing zone_hourly_metrics (the main table)...")
-    
-    try:
-        # Make the table if it doesn't exist, then empty it out
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS zone_hourly_metrics (
-                zone_id INT NOT NULL,
-                hour INT NOT NULL CHECK (hour >= 0 AND hour <= 23),
-                trip_count INT DEFAULT 0,
-                exposure_index DECIMAL(10, 2),
-                avg_trip_duration DECIMAL(10, 2),
-                congestion_index DECIMAL(10, 2),
-                revenue_volatility DECIMAL(10, 2),
-                risk_score DECIMAL(10, 2),
-                zone_name VARCHAR(100),
-                PRIMARY KEY (zone_id, hour),
-                FOREIGN KEY (zone_id) REFERENCES Zone(zone_id) ON DELETE CASCADE,
-                INDEX idx_hour (hour),
-                INDEX idx_zone (zone_id),
-                INDEX idx_risk (risk_score)
-            ) ENGINE=InnoDB;
-        """)
-        
-        cursor.execute("TRUNCATE TABLE zone_hourly_metrics;")
-        
-        # Count trips per zone per hour and calculate how busy each zone is (exposure)
-        # Exposure = this zone's trips divided by the busiest zone's trips, times 100
-        query_density_exposure = """
-        INSERT INTO zone_hourly_metrics (zone_id, hour, trip_count, exposure_index, zone_name)
-        WITH hourly_counts AS (
-            SELECT
-                z.zone_id,
-                HOUR(t.pickup_time) AS hour,
-                COUNT(*) AS trip_count,
-                z.zone_name
-            FROM Trip t
-            JOIN Location l ON t.pickup_location_id = l.loc_id
-            JOIN Zone z ON l.zone_id = z.zone_id
-            GROUP BY z.zone_id, HOUR(t.pickup_time), z.zone_name
-        ),
-        hourly_max AS (
-            SELECT
-                hour,
-                MAX(trip_count) AS max_count
-            FROM hourly_counts
-            GROUP BY hour
-        )
-        SELECT
-            hc.zone_id,
-            hc.hour,
-            hc.trip_count,
-            ROUND((hc.trip_count / hm.max_count) * 100, 2) AS exposure_index,
-            hc.zone_name
-        FROM hourly_counts hc
-        JOIN hourly_max hm ON hc.hour = hm.hour
-        ORDER BY hc.zone_id, hc.hour;
-        """
-        # Quick check: how many zone-hour groups do we have?
-        try:
-            cursor.execute("""
-            SELECT COUNT(*) FROM (
-                SELECT z.zone_id, HOUR(t.pickup_time) AS hour
-                FROM Trip t
-                JOIN Location l ON t.pickup_location_id = l.loc_id
-                JOIN Zone z ON l.zone_id = z.zone_id
-                GROUP BY z.zone_id, HOUR(t.pickup_time)
-            ) AS groups;
-            """)
-            groups_cnt = cursor.fetchone()[0]
-            print(f"   • Found {groups_cnt} non-empty (zone,hour) groups before insert")
+# How far through the trip table zone_hourly_stats has got (one row)
+# last_pickup_time is the pickup time of trip last_trip_id, used to spot a reloaded trip table
+CREATE_PRECOMPUTE_WATERMARK = """
+    CREATE TABLE IF NOT EXISTS precompute_watermark (
+        id INT PRIMARY KEY DEFAULT 1,
+        last_trip_id INT NOT NULL DEFAULT 0,
+        last_pickup_time DATETIME DEFAULT NULL,
+        total_trips BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        CHECK (id = 1)
+    ) ENGINE=InnoDB;
+"""
+
+# The same totals split by pickup date, so the API can add up any date range (see api/window_metrics.py)
+# ({table} is zone_daily_hourly_stats, or its delta table when zone partitions are folded in parallel)
+CREATE_ZONE_DAILY_HOURLY_STATS = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        pickup_date DATE NOT NULL,
+        zone_id INT NOT NULL,
+        hour INT NOT NULL CHECK (hour >= 0 AND hour <= 23),
+        trip_count INT NOT NULL DEFAULT 0,
+        duration_sum BIGINT NOT NULL DEFAULT 0,
+        fare_count INT NOT NULL DEFAULT 0,
+        fare_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+        fare_sq_sum DECIMAL(30, 4) NOT NULL DEFAULT 0,
+        PRIMARY KEY (pickup_date, zone_id, hour)
+    ) ENGINE=InnoDB;
+"""
+
+# Adds the trips with last_trip_id < trip_id <= new_last_trip_id into zone_hourly_stats
+# ({table} is zone_hourly_stats, or the delta table when trip id ranges are folded in parallel; then
+# {part} is "part, " and {part_value} "%s, " so each worker's rows are kept apart under its own part)
+FOLD_TRIPS_INTO_STATS = """
+    INSERT INTO {table}
+        ({part}zone_id, hour, zone_name, trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)
+    SELECT
+        {part_value}z.zone_id,
+        HOUR(t.pickup_time) AS hour,
+        z.zone_name,
+        COUNT(*),
+        SUM(TIMESTAMPDIFF(MINUTE, t.pickup_time, t.dropoff_time)),
+        COUNT(t.fare_amount),
+        COALESCE(SUM(t.fare_amount), 0),
+        COALESCE(SUM(t.fare_amount * t.fare_amount), 0)
+    FROM Trip t
+    JOIN Location l ON t.pickup_location_id = l.loc_id
+    JOIN Zone z ON l.zone_id = z.zone_id
+    WHERE t.trip_id > %s AND t.trip_id <= %s
+    GROUP BY z.zone_id, HOUR(t.pickup_time), z.zone_name
+    ON DUPLICATE KEY UPDATE
+        zone_name = VALUES(zone_name),
+        trip_count = trip_count + VALUES(trip_count),
+        duration_sum = duration_sum + VALUES(duration_sum),
+        fare_count = fare_count + VALUES(fare_count),
+        fare_sum = fare_sum + VALUES(fare_sum),
+        fare_sq_sum = fare_sq_sum + VALUES(fare_sq_sum);
+"""
+
+# Same trips, added into zone_daily_hourly_stats (or its delta table)
+FOLD_TRIPS_INTO_DAILY_STATS = """
+    INSERT INTO {table}
+        ({part}pickup_date, zone_id, hour, trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)
+    SELECT
+        {part_value}DATE(t.pickup_time) AS pickup_date,
+        z.zone_id,
+        HOUR(t.pickup_time) AS hour,
+        COUNT(*),
+        SUM(TIMESTAMPDIFF(MINUTE, t.pickup_time, t.dropoff_time)),
+        COUNT(t.fare_amount),
+        COALESCE(SUM(t.fare_amount), 0),
+        COALESCE(SUM(t.fare_amount * t.fare_amount), 0)
+    FROM Trip t
+    JOIN Location l ON t.pickup_location_id = l.loc_id
+    JOIN Zone z ON l.zone_id = z.zone_id
+    WHERE t.trip_id > %s AND t.trip_id <= %s
+    GROUP BY DATE(t.pickup_time), z.zone_id, HOUR(t.pickup_time)
+    ON DUPLICATE KEY UPDATE
+        trip_count = trip_count + VALUES(trip_count),
+        duration_sum = duration_sum + VALUES(duration_sum),
+        fare_count = fare_count + VALUES(fare_count),
+        fare_sum = fare_sum + VALUES(fare_sum),
+        fare_sq_sum = fare_sq_sum + VALUES(fare_sq_sum);
+"""
 
-            cursor.execute("SELECT HOUR(pickup_time) AS hour, COUNT(*) AS trips FROM Trip GROUP BY hour ORDER BY hour;")
-            hour_dist = cursor.fetchall()
-            print("   • Trip distribution by HOUR(pickup_time):")
-            for hr, cnt in hour_dist:
-                print(f"     - hour {hr}: {cnt} trips")
-        except Exception:
-            # Not a big deal if this check fails, keep going
-            pass
 
-        cursor.execute(query_density_exposure)
+# The tables the API and dashboard read. Each refresh builds them under a "_new" name and then
+# swaps all of them in with one RENAME TABLE, so readers only ever see complete tables.
+# zone_hourly_metrics is the one zone-hour table: stability_score is worked out by MySQL from
+# risk_score, idx_hour_risk answers "zones in this hour ranked by risk" without touching the rows,
+# and zone lookups go straight through the primary key (InnoDB keeps the rows in it).
+PRECOMPUTED_TABLES = {
+    "zone_hourly_metrics": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            zone_id INT NOT NULL,
+            hour INT NOT NULL CHECK (hour >= 0 AND hour <= 23),
+            trip_count INT DEFAULT 0,
+            exposure_index DECIMAL(10, 2),
+            avg_trip_duration DECIMAL(10, 2),
+            congestion_index DECIMAL(10, 2),
+            revenue_volatility DECIMAL(10, 2),
+            risk_score DECIMAL(10, 2),
+            stability_score DECIMAL(10, 2) AS (ROUND(100 - COALESCE(risk_score, 0), 2)) STORED,
+            zone_name VARCHAR(100),
+            PRIMARY KEY (zone_id, hour),
+            FOREIGN KEY (zone_id) REFERENCES Zone(zone_id) ON DELETE CASCADE,
+            INDEX idx_hour_risk (hour, risk_score DESC, trip_count, exposure_index, zone_name)
+        ) ENGINE=InnoDB;
+    """
+}
+
+# The old separate copies live on as views over zone_hourly_metrics, so anything still querying
+# them keeps working (they used to be filled with the same rows, just fewer columns)
+COMPATIBILITY_VIEWS = {
+    "zone_hourly_risk": """
+        CREATE OR REPLACE VIEW zone_hourly_risk AS
+        SELECT zone_id, hour, risk_score, trip_count, zone_name
+        FROM zone_hourly_metrics;
+    """,
+    "zone_hourly_details": """
+        CREATE OR REPLACE VIEW zone_hourly_details AS
+        SELECT zone_id, hour, zone_name, trip_count, avg_trip_duration,
+               exposure_index, revenue_volatility, stability_score, risk_score
+        FROM zone_hourly_metrics;
+    """
+}
+
+SHADOW_SUFFIX = "_new"
+OLD_SUFFIX = "_old"
+
+
+# Parallel folds write each trip id range here first, under its own part so workers never touch the
+# same row; one statement then adds the parts up into zone_hourly_stats
+CREATE_ZONE_HOURLY_STATS_DELTA = """
+    CREATE TABLE zone_hourly_stats_delta (
+        part INT NOT NULL,
+        zone_id INT NOT NULL,
+        hour INT NOT NULL,
+        zone_name VARCHAR(100),
+        trip_count INT NOT NULL DEFAULT 0,
+        duration_sum BIGINT NOT NULL DEFAULT 0,
+        fare_count INT NOT NULL DEFAULT 0,
+        fare_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+        fare_sq_sum DECIMAL(30, 4) NOT NULL DEFAULT 0,
+        PRIMARY KEY (part, zone_id, hour)
+    ) ENGINE=InnoDB;
+"""
+
+CREATE_ZONE_DAILY_HOURLY_STATS_DELTA = """
+    CREATE TABLE zone_daily_hourly_stats_delta (
+        part INT NOT NULL,
+        pickup_date DATE NOT NULL,
+        zone_id INT NOT NULL,
+        hour INT NOT NULL,
+        trip_count INT NOT NULL DEFAULT 0,
+        duration_sum BIGINT NOT NULL DEFAULT 0,
+        fare_count INT NOT NULL DEFAULT 0,
+        fare_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+        fare_sq_sum DECIMAL(30, 4) NOT NULL DEFAULT 0,
+        PRIMARY KEY (part, pickup_date, zone_id, hour)
+    ) ENGINE=InnoDB;
+"""
+
+MERGE_DELTA_INTO_STATS = """
+    INSERT INTO zone_hourly_stats
+        (zone_id, hour, zone_name, trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)
+    SELECT zone_id, hour, MAX(zone_name), SUM(trip_count), SUM(duration_sum), SUM(fare_count),
+           SUM(fare_sum), SUM(fare_sq_sum)
+    FROM zone_hourly_stats_delta
+    GROUP BY zone_id, hour
+    ORDER BY zone_id, hour
+    ON DUPLICATE KEY UPDATE
+        zone_name = VALUES(zone_name),
+        trip_count = trip_count + VALUES(trip_count),
+        duration_sum = duration_sum + VALUES(duration_sum),
+        fare_count = fare_count + VALUES(fare_count),
+        fare_sum = fare_sum + VALUES(fare_sum),
+        fare_sq_sum = fare_sq_sum + VALUES(fare_sq_sum);
+"""
+
+MERGE_DAILY_DELTA_INTO_STATS = """
+    INSERT INTO zone_daily_hourly_stats
+        (pickup_date, zone_id, hour, trip_count, duration_sum, fare_count, fare_sum, fare_sq_sum)
+    SELECT pickup_date, zone_id, hour, SUM(trip_count), SUM(duration_sum), SUM(fare_count),
+           SUM(fare_sum), SUM(fare_sq_sum)
+    FROM zone_daily_hourly_stats_delta
+    GROUP BY pickup_date, zone_id, hour
+    ORDER BY pickup_date, zone_id, hour
+    ON DUPLICATE KEY UPDATE
+        trip_count = trip_count + VALUES(trip_count),
+        duration_sum = duration_sum + VALUES(duration_sum),
+        fare_count = fare_count + VALUES(fare_count),
+        fare_sum = fare_sum + VALUES(fare_sum),
+        fare_sq_sum = fare_sq_sum + VALUES(fare_sq_sum);
+"""
+
+
+def check_workers(workers):
+    # Workers each hold a pooled connection while the main one stays open
+    if not 1 <= workers < POOL_SIZE:
+        raise ValueError(f"workers must be between 1 and {POOL_SIZE - 1} (DB_POOL_SIZE - 1), got {workers}")
+
+
+def trip_id_ranges(last_id, new_last_id, workers):
+    # Split last_id < trip_id <= new_last_id into up to `workers` contiguous (lo, hi] ranges of about
+    # the same size; trip ids come from AUTO_INCREMENT, so that's about the same number of trips
+    span = new_last_id - last_id
+    parts = max(min(workers, span), 1)
+    bounds = [last_id + span * k // parts for k in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def fold_partition(part, id_range, parent=None):
+    # One worker: fold the trips in one trip id range into the delta tables on its own connection
+    # (instrumented like parent, the main connection, so the run report sees the worker's statements)
+    # The range is a primary key range, so each worker only reads its own trips
+    conn = instrumentation.wrap_like(parent, get_connection())
+    if not conn:
+        raise RuntimeError("Could not get a connection for a partition worker")
+    cursor = conn.cursor()
+    params = (part,) + tuple(id_range)
+    try:
+        cursor.execute(FOLD_TRIPS_INTO_STATS.format(table="zone_hourly_stats_delta", part="part, ",
+                                                    part_value="%s, "), params)
+        rows = cursor.rowcount
+        cursor.execute(FOLD_TRIPS_INTO_DAILY_STATS.format(table="zone_daily_hourly_stats_delta", part="part, ",
+                                                          part_value="%s, "), params)
         conn.commit()
-        print(f"Done: Trip counts and exposure ({cursor.rowcount} records)")
-        
-    except mysql.connector.Error as e:
-        print(f"Error in density/exposure: {e}")
-        conn.rollback()
+        return rows
     finally:
         cursor.close()
+        conn.close()
 
 
-def compute_trip_duration(conn):
-    # Work out how long each trip took on average, per zone per hour
+def fold_partitions_in_parallel(conn, last_id, new_last_id, workers):
+    # Fold trip id ranges side by side into the delta tables (each under its own part, so they never
+    # share a row); nothing is added to zone_hourly_stats here, so a failed worker leaves the stats untouched
+    check_workers(workers)
     cursor = conn.cursor()
-    
-    print("\nWorking out average trip times...")
-    
     try:
-        query = """
-        UPDATE zone_hourly_metrics zhm
-        SET avg_trip_duration = (
-            SELECT ROUND(AVG(TIMESTAMPDIFF(MINUTE, t.pickup_time, t.dropoff_time)), 2)
-            FROM Trip t
-            JOIN Location l ON t.pickup_location_id = l.loc_id
-            WHERE l.zone_id = zhm.zone_id
-            AND HOUR(t.pickup_time) = zhm.hour
-        )
-        WHERE zhm.trip_count > 0;
-        """
-        
-        cursor.execute(query)
-        conn.commit()
-        print(f"Done: Trip durations ({cursor.rowcount} records)")
-        
-    except mysql.connector.Error as e:
-        print(f"Error computing duration: {e}")
-        conn.rollback()
+        # Scratch tables, made fresh each time (older runs kept them without the part column)
+        cursor.execute("DROP TABLE IF EXISTS zone_hourly_stats_delta, zone_daily_hourly_stats_delta;")
+        cursor.execute(CREATE_ZONE_HOURLY_STATS_DELTA)
+        cursor.execute(CREATE_ZONE_DAILY_HOURLY_STATS_DELTA)
     finally:
         cursor.close()
 
+    ranges = trip_id_ranges(last_id, new_last_id, workers)
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        results = list(pool.map(lambda p: fold_partition(p, ranges[p], parent=conn), range(len(ranges))))
+    # Report in partition order, whatever order the workers finished in
+    for (lo, hi), rows in zip(ranges, results):
+        print(f"   • Trips {lo + 1}-{hi}: {rows} zone-hour rows")
+
 
-def compute_congestion_index(conn):
-    # Measures how jammed up a zone is (long trips + busy zone = bad traffic)
+def read_watermark(cursor):
+    # (last_trip_id, last_pickup_time, total_trips), or None if stats were never built
+    cursor.execute("SELECT last_trip_id, last_pickup_time, total_trips FROM precompute_watermark WHERE id = 1;")
+    return cursor.fetchone()
+
+
+def update_zone_hourly_stats(conn, incremental=False, workers=1):
+    # Bring zone_hourly_stats (and its per-day copy, zone_daily_hourly_stats) up to date with the trip table
+    # Incremental runs only read trips past the watermark; otherwise (or if the trip table was
+    # reloaded since) the stats are rebuilt from every trip. Returns how many trips were added.
+    # With workers > 1 the trips are folded by trip id range on that many connections at once.
     cursor = conn.cursor()
-    
-    print("\nWorking out congestion levels...")
-    
+
+    print("\nUpdating zone_hourly_stats...")
+
     try:
-        query = """
-        UPDATE zone_hourly_metrics
-        SET congestion_index = ROUND(
-            (COALESCE(avg_trip_duration, 0) * COALESCE(exposure_index, 0)) / 100,
-            2
-        )
-        WHERE congestion_index IS NULL;
-        """
-        
-        cursor.execute(query)
+        cursor.execute(CREATE_ZONE_HOURLY_STATS)
+        cursor.execute(CREATE_ZONE_DAILY_HOURLY_STATS.format(table="zone_daily_hourly_stats"))
+        cursor.execute(CREATE_PRECOMPUTE_WATERMARK)
+
+        watermark = read_watermark(cursor) if incremental else None
+        if incremental and watermark is None:
+            print("   No watermark yet, building the stats from every trip")
+        elif watermark is not None and watermark[0] > 0:
+            # load_data.py drops the watermark when it recreates the trip table; in case the table was
+            # reloaded some other way, make sure trip ids still mean the same trips (the last one's
+            # pickup time alone is easy to match by chance, so the number of trips up to it too)
+            cursor.execute("SELECT pickup_time FROM Trip WHERE trip_id = %s;", (watermark[0],))
+            row = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*) FROM Trip WHERE trip_id <= %s;", (watermark[0],))
+            trips_so_far = cursor.fetchone()[0]
+            if row is None or row[0] != watermark[1] or trips_so_far != watermark[2]:
+                print("   Trip table was reloaded since the last run, building the stats from every trip")
+                watermark = None
+
+        # Fix the upper end now so trips loaded while we run are left for next time
+        cursor.execute("SELECT COALESCE(MAX(trip_id), 0) FROM Trip;")
+        new_last_id = cursor.fetchone()[0]
+
+        if watermark is None:
+            last_id, total_trips = 0, 0
+            cursor.execute("TRUNCATE TABLE zone_hourly_stats;")
+            cursor.execute("TRUNCATE TABLE zone_daily_hourly_stats;")
+            cursor.execute("DELETE FROM precompute_watermark;")
+            conn.commit()
+        else:
+            last_id, _, total_trips = watermark
+
+        if new_last_id <= last_id:
+            print(f"   No new trips since trip_id {last_id}")
+            return 0
+
+        cursor.execute("SELECT COUNT(*) FROM Trip WHERE trip_id > %s AND trip_id <= %s;", (last_id, new_last_id))
+        new_trips = cursor.fetchone()[0]
+        cursor.execute("SELECT pickup_time FROM Trip WHERE trip_id = %s;", (new_last_id,))
+        last_pickup_time = cursor.fetchone()[0]
+
+        # Stats and watermark move together so a failed run can just be repeated
+        if workers > 1:
+            fold_partitions_in_parallel(conn, last_id, new_last_id, workers)
+            cursor.execute(MERGE_DELTA_INTO_STATS)
+            cursor.execute(MERGE_DAILY_DELTA_INTO_STATS)
+        else:
+            cursor.execute(FOLD_TRIPS_INTO_STATS.format(table="zone_hourly_stats", part="", part_value=""),
+                           (last_id, new_last_id))
+            cursor.execute(FOLD_TRIPS_INTO_DAILY_STATS.format(table="zone_daily_hourly_stats", part="",
+                                                              part_value=""), (last_id, new_last_id))
+        cursor.execute("""
+            INSERT INTO precompute_watermark (id, last_trip_id, last_pickup_time, total_trips)
+            VALUES (1, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                last_trip_id = VALUES(last_trip_id),
+                last_pickup_time = VALUES(last_pickup_time),
+                total_trips = VALUES(total_trips);
+        """, (new_last_id, last_pickup_time, total_trips + new_trips))
         conn.commit()
-        print(f"Done: Congestion levels ({cursor.rowcount} records)")
-        
+        print(f"Done: Added {new_trips} trips (trip_id {last_id + 1} to {new_last_id}) to zone_hourly_stats")
+        return new_trips
+
     except mysql.connector.Error as e:
-        print(f"Error computing congestion: {e}")
+        print(f"Error updating zone_hourly_stats: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
 
 
-def compute_revenue_volatility(conn):
-    # Check how much fares jump around per zone (big swings = unpredictable earnings)
+def populate_zone_hourly_metrics(conn, suffix=""):
+    # Every metric for every zone-hour, worked out from the running totals in zone_hourly_stats:
+    # trips, exposure, duration, congestion, fare volatility and risk
     cursor = conn.cursor()
     
-    print("\nChecking fare swings per zone...")
+    print("\nComputing zone_hourly_metrics (the main table)...")
     
     try:
-        query = """
-        UPDATE zone_hourly_metrics zhm
-        SET revenue_volatility = (
-            SELECT ROUND(COALESCE(STDDEV_POP(t.fare_amount), 0), 2)
-            FROM Trip t
-            JOIN Location l ON t.pickup_location_id = l.loc_id
-            WHERE l.zone_id = zhm.zone_id
+        # zone_hourly_stats has one row of totals per zone-hour, so this never touches Trip.
+        # Per-zone fare volatility comes from the fare sums/sums of squares of the zone's hours, and
+        # the per-hour and overall maximums come from window functions. Exposure, volatility and risk
+        # are scaled against those maximums, so new trips anywhere can move every row.
+        # Each step is cast to DECIMAL(10,2), just like when the metrics were stored column by column,
+        # so the numbers match the old one-UPDATE-per-metric version.
+        query_metrics = f"""
+        INSERT INTO zone_hourly_metrics{suffix}
+            (zone_id, hour, trip_count, exposure_index, avg_trip_duration,
+             congestion_index, revenue_volatility, risk_score, zone_name)
+        WITH zone_hour AS (
+            SELECT
+                zone_id,
+                hour,
+                zone_name,
+                trip_count,
+                duration_sum / trip_count AS avg_duration,
+                fare_count,
+                fare_sum,
+                fare_sq_sum
+            FROM zone_hourly_stats
+            WHERE trip_count > 0
+        ),
+        zone_totals AS (
+            SELECT
+                zh.*,
+                MAX(trip_count) OVER (PARTITION BY hour) AS max_count,
+                SUM(fare_count) OVER (PARTITION BY zone_id) AS zone_fare_count,
+                SUM(fare_sum) OVER (PARTITION BY zone_id) AS zone_fare_sum,
+                SUM(fare_sq_sum) OVER (PARTITION BY zone_id) AS zone_fare_sq_sum
+            FROM zone_hour zh
+        ),
+        base_metrics AS (
+            SELECT
+                zone_id, hour, zone_name, trip_count,
+                CAST(ROUND((trip_count / max_count) * 100, 2) AS DECIMAL(10, 2)) AS exposure_index,
+                CAST(ROUND(avg_duration, 2) AS DECIMAL(10, 2)) AS avg_trip_duration,
+                -- population stddev of the zone's fares: sqrt(E[x^2] - E[x]^2)
+                CAST(ROUND(COALESCE(SQRT(GREATEST(
+                    (zone_fare_sq_sum - zone_fare_sum * zone_fare_sum / NULLIF(zone_fare_count, 0))
+                        / NULLIF(zone_fare_count, 0), 0)), 0), 2) AS DECIMAL(10, 2)) AS revenue_volatility
+            FROM zone_totals
+        ),
+        with_congestion AS (
+            SELECT
+                bm.*,
+                CAST(ROUND((COALESCE(avg_trip_duration, 0) * COALESCE(exposure_index, 0)) / 100, 2)
+                     AS DECIMAL(10, 2)) AS congestion_index
+            FROM base_metrics bm
+        ),
+        with_maximums AS (
+            -- Biggest congestion and volatility so both can be scaled to 0-100 (1 if they're all zero)
+            SELECT
+                wc.*,
+                COALESCE(NULLIF(MAX(congestion_index) OVER (), 0), 1) AS max_congestion,
+                COALESCE(NULLIF(MAX(revenue_volatility) OVER (), 0), 1) AS max_volatility
+            FROM with_congestion wc
         )
-        WHERE revenue_volatility IS NULL;
+        SELECT
+            zone_id,
+            hour,
+            trip_count,
+            exposure_index,
+            avg_trip_duration,
+            congestion_index,
+            revenue_volatility,
+            -- 40% exposure + 30% congestion + 30% fare swings, all scaled 0 to 100
+            ROUND(
+                (0.4 * COALESCE(exposure_index, 0)) +
+                (0.3 * (COALESCE(congestion_index, 0) / max_congestion * 100)) +
+                (0.3 * (COALESCE(revenue_volatility, 0) / max_volatility * 100)),
+                2
+            ) AS risk_score,
+            zone_name
+        FROM with_maximums
+        ORDER BY zone_id, hour;
         """
-        
-        cursor.execute(query)
+
+        cursor.execute(query_metrics)
         conn.commit()
-        print(f"Done: Fare volatility ({cursor.rowcount} records)")
+        print(f"Done: Trip counts, exposure, duration, congestion, volatility and risk ({cursor.rowcount} records)")
+
+        # Quick check using the table we just filled (no need to go back to Trip for it)
+        try:
+            cursor.execute(f"""
+                SELECT hour, SUM(trip_count)
+                FROM zone_hourly_metrics{suffix}
+                GROUP BY hour
+                ORDER BY hour;
+            """)
+            print("   • Trip distribution by hour:")
+            for hr, cnt in cursor.fetchall():
+                print(f"     - hour {hr}: {cnt} trips")
+
+            cursor.execute(f"SELECT MAX(congestion_index), MAX(revenue_volatility) FROM zone_hourly_metrics{suffix};")
+            max_congestion, max_volatility = cursor.fetchone()
+            print(f"   Normalization factors: congestion_max={max_congestion or 1}, volatility_max={max_volatility or 1}")
+        except Exception:
+            # Not a big deal if this check fails, keep going
+            pass
         
     except mysql.connector.Error as e:
-        print(f"Error computing volatility: {e}")
+        print(f"Error computing zone_hourly_metrics: {e}")
         conn.rollback()
+        # A half-built shadow table must never reach the swap (zero-filled it would pass for empty hours)
+        if suffix:
+            raise
     finally:
         cursor.close()
 
 
-def compute_risk_score(conn):
-    # Mix everything together into one risk score per zone per hour
-    # 40% exposure + 30% congestion + 30% fare swings, all scaled 0 to 100
+def populate_from_engine(conn, trips_path, suffix=""):
+    # Fill zone_hourly_metrics from a trips file with the pandas engine instead of SQL
+    # The numbers match the SQL path; MySQL only receives the finished rows. Returns the grid.
     cursor = conn.cursor()
-    
-    print("\nCalculating risk scores...")
-    
+
+    print(f"\nComputing zone-hour metrics from {os.path.basename(trips_path)} with the pandas engine...")
+
     try:
-        # Find the biggest values so we can scale everything to 0-100
-        query_max = """
-        SELECT
-            COALESCE(MAX(congestion_index), 1) as max_congestion,
-            COALESCE(MAX(revenue_volatility), 1) as max_volatility
-        FROM zone_hourly_metrics
-        WHERE congestion_index > 0 OR revenue_volatility > 0;
-        """
-        
-        cursor.execute(query_max)
-        result = cursor.fetchone()
-        max_congestion = result[0] if result[0] else 1
-        max_volatility = result[1] if result[1] else 1
-        
-        # Now combine the three parts into one risk number
-        query_risk = f"""
-        UPDATE zone_hourly_metrics
-        SET risk_score = ROUND(
-            (0.4 * COALESCE(exposure_index, 0)) +
-            (0.3 * (COALESCE(congestion_index, 0) / {max_congestion} * 100)) +
-            (0.3 * (COALESCE(revenue_volatility, 0) / {max_volatility} * 100)),
-            2
-        )
-        WHERE risk_score IS NULL;
-        """
-        
-        cursor.execute(query_risk)
+        # Use the zone ids the Zone table actually has so rows line up with the rest of the database
+        cursor.execute("SELECT zone_id, zone_name FROM Zone;")
+        zone_ids = {name: zid for zid, name in cursor.fetchall()}
+
+        zones, locations = aggregation_engine.read_zones()
+        trips = aggregation_engine.read_trips(trips_path)
+        grid = aggregation_engine.build_grid(trips, zones, locations, zone_ids=zone_ids)
+        metrics = grid.metrics_rows()
+        print(f"   • Aggregated {grid.total_trips} trips into {len(metrics)} zone-hour rows")
+
+        _insert_rows(cursor, f"zone_hourly_metrics{suffix}",
+                     ("zone_id", "hour", "trip_count", "exposure_index", "avg_trip_duration",
+                      "congestion_index", "revenue_volatility", "risk_score", "zone_name"), metrics)
         conn.commit()
-        print(f"Done: Risk scores ({cursor.rowcount} records)")
-        print(f"   Normalization factors: congestion_max={max_congestion}, volatility_max={max_volatility}")
-        
+        print(f"Done: zone_hourly_metrics{suffix} ({len(metrics)} rows)")
+        return grid
+
     except mysql.connector.Error as e:
-        print(f"Error computing risk: {e}")
+        print(f"Error writing engine results: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
 
 
-def populate_zone_hourly_risk(conn):
-    # Copy risk data into a separate table used by the top zones API
+def write_engine_stats(conn, grid):
+    # Replace zone_hourly_stats and zone_daily_hourly_stats with the pandas engine's totals, so date
+    # ranges (and the artifact's rollup) come from the same trips as the metrics just published.
+    # They weren't folded from the trip table, so the watermark goes and the next SQL run starts over.
     cursor = conn.cursor()
-    
-    print("\nFilling zone_hourly_risk table...")
-    
+
+    print("\nWriting the engine's totals to zone_hourly_stats and zone_daily_hourly_stats...")
+
     try:
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS zone_hourly_risk (
-                zone_id INT NOT NULL,
-                hour INT NOT NULL CHECK (hour >= 0 AND hour <= 23),
-                risk_score DECIMAL(10, 2),
-                trip_count INT DEFAULT 0,
-                zone_name VARCHAR(100),
-                PRIMARY KEY (zone_id, hour),
-                FOREIGN KEY (zone_id) REFERENCES Zone(zone_id) ON DELETE CASCADE,
-                INDEX idx_hour (hour)
-            ) ENGINE=InnoDB;
-        """)
+        cursor.execute(CREATE_ZONE_HOURLY_STATS)
+        cursor.execute(CREATE_ZONE_DAILY_HOURLY_STATS.format(table="zone_daily_hourly_stats"))
+        cursor.execute(CREATE_PRECOMPUTE_WATERMARK)
+        cursor.execute("DELETE FROM precompute_watermark;")
+        conn.commit()
 
-        cursor.execute("TRUNCATE TABLE zone_hourly_risk;")
-        
-        query = """
-        INSERT INTO zone_hourly_risk (zone_id, hour, risk_score, trip_count, zone_name)
-        SELECT zone_id, hour, risk_score, trip_count, zone_name
-        FROM zone_hourly_metrics
-        ORDER BY zone_id, hour;
-        """
-        
-        cursor.execute(query)
+        cursor.execute("TRUNCATE TABLE zone_hourly_stats;")
+        cursor.execute("TRUNCATE TABLE zone_daily_hourly_stats;")
+        sums = aggregation_engine.SUM_COLUMNS
+        stats = grid.stats_rows()
+        daily = grid.daily_rows()
+        _insert_rows(cursor, "zone_hourly_stats", ("zone_id", "hour", "zone_name") + sums, stats)
+        _insert_rows(cursor, "zone_daily_hourly_stats", ("pickup_date", "zone_id", "hour") + sums, daily)
         conn.commit()
-        print(f"Done: zone_hourly_risk ({cursor.rowcount} rows)")
-        
+        print(f"Done: zone_hourly_stats ({len(stats)} rows), zone_daily_hourly_stats ({len(daily)} rows)")
+
     except mysql.connector.Error as e:
-        print(f"Error populating zone_hourly_risk: {e}")
+        print(f"Error writing engine totals: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
 
 
-def populate_overview_metrics(conn):
+def _insert_rows(cursor, table, columns, rows, batch_size=1000):
+    # Multi-row INSERTs in batches (executemany turns each batch into one statement)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def populate_overview_metrics(conn, total_trips=None):
     # Calculate the big picture numbers for the dashboard overview
     cursor = conn.cursor(dictionary=True)
     
@@ -289,21 +577,23 @@ def populate_overview_metrics(conn):
         # Clear old data
         cursor.execute("DELETE FROM overview_metrics WHERE id = 1;")
         
-        # How many trips total
-        cursor.execute("SELECT COUNT(*) as cnt FROM Trip;")
-        total_trips = cursor.fetchone()['cnt']
+        # How many trips total (kept up to date with the stats, so no need to count Trip)
+        if total_trips is None:
+            cursor.execute("SELECT total_trips FROM precompute_watermark WHERE id = 1;")
+            row = cursor.fetchone()
+            total_trips = row['total_trips'] if row else 0
         
         # How many zones have a risk score of 50 or higher
         cursor.execute("""
             SELECT COUNT(DISTINCT zone_id) as cnt
-            FROM zone_hourly_risk
+            FROM zone_hourly_metrics
             WHERE risk_score >= 50;
         """)
         high_risk_zones = cursor.fetchone()['cnt'] or 0
         
         # Which hour has the most trips
         cursor.execute("""
-            SELECT hour FROM zone_hourly_risk
+            SELECT hour FROM zone_hourly_metrics
             ORDER BY trip_count DESC
             LIMIT 1;
         """)
@@ -335,147 +625,220 @@ def populate_overview_metrics(conn):
         cursor.close()
 
 
-def populate_zone_hourly_details(conn):
-    # Build the detailed breakdown table used when you click on a zone
+def fill_missing_hours(conn, suffix=""):
+    # Some zones don't have data for every hour, so fill the gaps with zeros
     cursor = conn.cursor()
     
-    print("\nFilling zone_hourly_details table...")
+    print("\nFilling in missing hours (0 through 23) for every zone...")
     
     try:
-        cursor.execute("TRUNCATE TABLE zone_hourly_details;")
-        
-        query = """
-        INSERT INTO zone_hourly_details 
-        (zone_id, hour, zone_name, trip_count, avg_trip_duration, 
-         exposure_index, revenue_volatility, stability_score, risk_score)
-        SELECT 
-            zhm.zone_id,
-            zhm.hour,
-            zhm.zone_name,
-            zhm.trip_count,
-            zhm.avg_trip_duration,
-            zhm.exposure_index,
-            zhm.revenue_volatility,
-            ROUND(100 - COALESCE(zhm.risk_score, 0), 2) as stability_score,
-            zhm.risk_score
-        FROM zone_hourly_metrics zhm
-        ORDER BY zhm.zone_id, zhm.hour;
+        # One INSERT for every zone: all zones x hours 0-23, minus the rows that already exist
+        query = f"""
+        INSERT INTO zone_hourly_metrics{suffix}
+        (zone_id, hour, trip_count, exposure_index, avg_trip_duration, 
+         congestion_index, revenue_volatility, risk_score, zone_name)
+        WITH RECURSIVE hours (hour) AS (
+            SELECT 0 UNION ALL SELECT hour + 1 FROM hours WHERE hour < 23
+        )
+        SELECT z.zone_id, h.hour, 0, 0, 0, 0, 0, 0, z.zone_name
+        FROM Zone z
+        CROSS JOIN hours h
+        WHERE NOT EXISTS (
+            SELECT 1 FROM zone_hourly_metrics{suffix} m
+            WHERE m.zone_id = z.zone_id AND m.hour = h.hour
+        );
         """
         
         cursor.execute(query)
         conn.commit()
-        print(f"Done: zone_hourly_details ({cursor.rowcount} rows)")
+        print(f"Done: Filled missing hours in zone_hourly_metrics{suffix}")
         
     except mysql.connector.Error as e:
-        print(f"Error populating zone_hourly_details: {e}")
+        print(f"Error filling missing hours: {e}")
         conn.rollback()
+        if suffix:
+            raise
     finally:
         cursor.close()
 
 
-def fill_missing_hours(conn):
-    # Some zones don't have data for every hour, so fill the gaps with zeros
+def prepare_shadow_tables(conn):
+    # Fresh, empty "_new" copies of every precomputed table (and the live tables if this is the first run)
     cursor = conn.cursor()
-    
-    print("\nFilling in missing hours (0 through 23) for every zone...")
-    
     try:
-        # Get every zone we have
-        cursor.execute("SELECT DISTINCT zone_id, zone_name FROM Zone;")
-        zones = cursor.fetchall()
-        
-        for zone_id, zone_name in zones:
-            # Add hours 0-23 for any that are missing in the main metrics table
-            query = """
-            INSERT INTO zone_hourly_metrics 
-            (zone_id, hour, trip_count, exposure_index, avg_trip_duration, 
-             congestion_index, revenue_volatility, risk_score, zone_name)
-            SELECT %s, h.hour, 0, 0, 0, 0, 0, 0, %s
-            FROM (
-                SELECT 0 as hour UNION SELECT 1 UNION SELECT 2 UNION SELECT 3 
-                UNION SELECT 4 UNION SELECT 5 UNION SELECT 6 UNION SELECT 7 
-                UNION SELECT 8 UNION SELECT 9 UNION SELECT 10 UNION SELECT 11
-                UNION SELECT 12 UNION SELECT 13 UNION SELECT 14 UNION SELECT 15
-                UNION SELECT 16 UNION SELECT 17 UNION SELECT 18 UNION SELECT 19
-                UNION SELECT 20 UNION SELECT 21 UNION SELECT 22 UNION SELECT 23
-            ) h
-            WHERE NOT EXISTS (
-                SELECT 1 FROM zone_hourly_metrics 
-                WHERE zone_id = %s AND hour = h.hour
-            )
-            ON DUPLICATE KEY UPDATE trip_count = trip_count;
-            """
-            
-            cursor.execute(query, (zone_id, zone_name, zone_id))
-        
-        conn.commit()
-        print(f"Done: Filled missing hours in zone_hourly_metrics")
-        
-        # Fill missing hours in zone_hourly_risk
-        query_risk = """
-        INSERT INTO zone_hourly_risk (zone_id, hour, risk_score, trip_count, zone_name)
-        SELECT z.zone_id, z.hour, 0, 0, z.zone_name
-        FROM zone_hourly_metrics z
-        WHERE NOT EXISTS (
-            SELECT 1 FROM zone_hourly_risk 
-            WHERE zone_id = z.zone_id AND hour = z.hour
-        );
-        """
-        
-        cursor.execute(query_risk)
+        for table, ddl in PRECOMPUTED_TABLES.items():
+            cursor.execute(ddl.format(table=table))
+            cursor.execute(f"DROP TABLE IF EXISTS {table}{SHADOW_SUFFIX}, {table}{OLD_SUFFIX};")
+            cursor.execute(ddl.format(table=table + SHADOW_SUFFIX))
         conn.commit()
-        print(f"Done: Filled missing hours in zone_hourly_risk")
-        
-        # Do the same for the details table
-        query_details = """
-        INSERT INTO zone_hourly_details 
-        (zone_id, hour, zone_name, trip_count, avg_trip_duration, 
-         exposure_index, revenue_volatility, stability_score, risk_score)
-        SELECT z.zone_id, z.hour, z.zone_name, 0, 0, 0, 0, 100, 0
-        FROM zone_hourly_metrics z
-        WHERE NOT EXISTS (
-            SELECT 1 FROM zone_hourly_details 
-            WHERE zone_id = z.zone_id AND hour = z.hour
-        );
-        """
+    finally:
+        cursor.close()
+
+
+def validate_shadow_tables(conn, expected_trips=None):
+    # Every shadow table needs exactly one row per zone per hour, and between them the rows must hold
+    # every trip, before it is allowed to go live. expected_trips defaults to the zone_hourly_stats
+    # total (the pandas engine doesn't use the stats, so it passes its own count)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM Zone;")
+        expected = cursor.fetchone()[0] * 24
+        if expected_trips is None:
+            cursor.execute("SELECT COALESCE(SUM(trip_count), 0) FROM zone_hourly_stats;")
+            expected_trips = int(cursor.fetchone()[0])
+        problems = []
+        for table in PRECOMPUTED_TABLES:
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM(trip_count), 0) FROM {table}{SHADOW_SUFFIX};")
+            count, trips = cursor.fetchone()
+            if count != expected:
+                problems.append(f"{table}{SHADOW_SUFFIX} has {count} rows, expected {expected}")
+            if int(trips) != expected_trips:
+                problems.append(f"{table}{SHADOW_SUFFIX} holds {int(trips)} trips, expected {expected_trips}")
+        return problems
+    finally:
+        cursor.close()
 
-        cursor.execute(query_details)
+
+def swap_in_shadow_tables(conn):
+    # One RENAME TABLE moves every new table in and every old one out at the same instant;
+    # MySQL applies the whole statement atomically, so readers see either all old or all new tables
+    cursor = conn.cursor()
+    try:
+        renames = []
+        for table in PRECOMPUTED_TABLES:
+            renames.append(f"{table} TO {table}{OLD_SUFFIX}")
+            renames.append(f"{table}{SHADOW_SUFFIX} TO {table}")
+        cursor.execute("RENAME TABLE " + ", ".join(renames) + ";")
+        cursor.execute("DROP TABLE IF EXISTS " + ", ".join(t + OLD_SUFFIX for t in PRECOMPUTED_TABLES) + ";")
+        print(f"\nDone: Swapped in {', '.join(PRECOMPUTED_TABLES)}")
+    finally:
+        cursor.close()
+
+
+def create_compatibility_views(conn):
+    # Replace the old zone_hourly_risk / zone_hourly_details tables (if this database still has them)
+    # with views; views look the table up by name, so they follow every later swap on their own
+    cursor = conn.cursor()
+    try:
+        for view, ddl in COMPATIBILITY_VIEWS.items():
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND TABLE_TYPE = 'BASE TABLE';
+            """, (view,))
+            if cursor.fetchone()[0]:
+                cursor.execute(f"DROP TABLE {view};")
+                print(f"   • Dropped the old {view} table, it is a view now")
+            cursor.execute(ddl)
         conn.commit()
-        print(f"Done: Filled missing hours in zone_hourly_details")
-        
-    except mysql.connector.Error as e:
-        print(f"Error filling missing hours: {e}")
-        conn.rollback()
     finally:
         cursor.close()
 
 
-def main():
-    print("Insurtech - Building precomputed tables")
+def drop_shadow_tables(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP TABLE IF EXISTS " + ", ".join(t + SHADOW_SUFFIX for t in PRECOMPUTED_TABLES) + ";")
+    finally:
+        cursor.close()
+
+
+def write_metrics_artifact(conn, path):
+    # Read back the tables that just went live and save them as the memory-mapped file the API serves
+    print(f"\nWriting metrics artifact to {path}...")
+    grid = load_grid(conn)
+    # The daily rollup goes in too, so an API serving from the file answers date ranges without MySQL
+    grid.daily = load_daily_rollup(conn, grid)
+    metrics_artifact.write_artifact(grid, path)
+    print(f"Done: {grid.zone_count} zones x 24 hours, version {grid.version} ({os.path.getsize(path)} bytes)")
+
+
+def artifact_is_current(conn, path):
+    # True if the file at path was written from the overview_metrics row that's live now
+    try:
+        written = metrics_artifact.read_version(path)
+    except (OSError, ValueError, metrics_artifact.ArtifactError):
+        return False
+    live = fetch_version(conn)
+    return written is not None and (live is None or written >= live)
+
+
+def main(incremental=False, engine="sql", trips_path=aggregation_engine.TRIP_CSV, artifact_path=None,
+         workers=1):
+    check_workers(workers)
+    print("Insurtech - Building precomputed tables"
+          + (" (incremental)" if incremental else "") + (" (pandas engine)" if engine == "pandas" else ""))
     print()
     
-    conn = get_connection()
+    # Timings, row counts and SQL per stage end up in data/populate_precomputed_tables_run_report.json
+    report = instrumentation.RunReport("populate_precomputed_tables")
+    report.info = {"incremental": incremental, "engine": engine, "workers": workers}
+
+    conn = report.wrap(get_connection())
     if not conn:
         print("Could not connect to database")
         sys.exit(1)
     
     try:
-        # Build the main metrics table first
-        populate_zone_hourly_metrics(conn)
-        
-        # Then add each metric one by one
-        compute_trip_duration(conn)
-        compute_congestion_index(conn)
-        compute_revenue_volatility(conn)
-        compute_risk_score(conn)
-        
-        # Copy data into the tables each API endpoint reads from
-        populate_zone_hourly_risk(conn)
-        populate_overview_metrics(conn)
-        populate_zone_hourly_details(conn)
-        
-        # Make sure every zone has all 24 hours filled in
-        fill_missing_hours(conn)
+        total_trips = None
+        expected_trips = None
+        if engine == "pandas":
+            # The pandas engine reads the trips file itself, so the trip table isn't used; the stats
+            # tables get its totals once the new metrics are live (see write_engine_stats)
+            with report.stage("prepare_shadow_tables"):
+                prepare_shadow_tables(conn)
+            with report.stage("populate_from_engine") as stage:
+                grid = populate_from_engine(conn, trips_path, suffix=SHADOW_SUFFIX)
+                total_trips = grid.total_trips
+                # Trips outside the known zones aren't in any row
+                expected_trips = int(grid.trip_count.sum())
+                stage.count(read=total_trips)
+        else:
+            # Fold the trips into the per zone-hour totals (only the new ones if incremental)
+            with report.stage("update_zone_hourly_stats", explain=True):
+                new_trips = update_zone_hourly_stats(conn, incremental=incremental, workers=workers)
+            report.info["new_trips"] = new_trips
+            if incremental and not new_trips:
+                print("\nNothing new to add, the precomputed tables are already up to date.")
+                # The file may still be missing or from before the last run (one without --artifact)
+                if artifact_path and not artifact_is_current(conn, artifact_path):
+                    with report.stage("write_metrics_artifact"):
+                        write_metrics_artifact(conn, artifact_path)
+                return
+
+            # Everything is built in "_new" shadow tables while the live ones keep serving reads
+            with report.stage("prepare_shadow_tables"):
+                prepare_shadow_tables(conn)
+
+            # Build the main metrics table from those totals
+            with report.stage("populate_zone_hourly_metrics", explain=True):
+                populate_zone_hourly_metrics(conn, suffix=SHADOW_SUFFIX)
+
+
+            # Make sure every zone has all 24 hours filled in
+            with report.stage("fill_missing_hours", explain=True):
+                fill_missing_hours(conn, suffix=SHADOW_SUFFIX)
+
+        # Only publish complete tables; if anything is off the live tables stay as they were
+        with report.stage("validate_and_swap"):
+            problems = validate_shadow_tables(conn, expected_trips=expected_trips)
+            if problems:
+                drop_shadow_tables(conn)
+                raise RuntimeError("Shadow tables are incomplete, live tables left untouched: " + "; ".join(problems))
+            swap_in_shadow_tables(conn)
+            create_compatibility_views(conn)
+
+        if engine == "pandas":
+            # Before overview_metrics moves, so the API reloads the daily totals along with the grid
+            with report.stage("write_engine_stats"):
+                write_engine_stats(conn, grid)
+
+        # Written last: bumping overview_metrics.last_updated is what tells the API to reload
+        with report.stage("populate_overview_metrics", explain=True):
+            populate_overview_metrics(conn, total_trips=total_trips)
+
+        if artifact_path:
+            with report.stage("write_metrics_artifact"):
+                write_metrics_artifact(conn, artifact_path)
         
         print("\nAll done! Precomputed tables are ready.")
         print("The API endpoints will now load instantly.")
@@ -487,7 +850,28 @@ def main():
         sys.exit(1)
     finally:
         conn.close()
+        report.save()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the precomputed tables the API reads from")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fold in trips loaded since the last run instead of rereading every trip")
+    parser.add_argument("--engine", choices=("sql", "pandas"), default="sql",
+                        help="aggregate inside MySQL (default) or in this process with pandas/numpy")
+    parser.add_argument("--trips", default=aggregation_engine.TRIP_CSV,
+                        help="trips file (.parquet or .csv) or Parquet dataset folder for the pandas engine")
+    parser.add_argument("--artifact", nargs="?", const=metrics_artifact.DEFAULT_ARTIFACT_PATH,
+                        help="also write the memory-mapped grid file the API can serve from "
+                             f"(default path: {metrics_artifact.DEFAULT_ARTIFACT_PATH})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="fold trips by trip id range on this many connections at once (default 1)")
+    args = parser.parse_args()
+    if args.incremental and args.engine == "pandas":
+        parser.error("--incremental only works with the sql engine")
+    try:
+        check_workers(args.workers)
+    except ValueError as e:
+        parser.error(f"--{e}")
+    main(incremental=args.incremental, engine=args.engine, trips_path=args.trips, artifact_path=args.artifact,
+         workers=args.workers)
\ No newline at end of file
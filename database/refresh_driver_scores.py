@@ -0,0 +1,135 @@
+# Fills the driver_risk_scores table so the API can look up a driver's score instead of working it out
+# Run after seed_drivers.py and populate_precomputed_tables.py. Only rows that changed get written.
+
+import sys
+import os
+import json
+
+# Figure out where this file is so we can find other project files
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+
+import numpy as np
+from database_config import get_connection
+from risk_scorer import DriverRiskScorer, RISK_LEVELS
+from driver_scores import create_table, upsert_scores
+from metrics_store import fetch_version
+
+
+def compute_scores(conn, scorer):
+    # Score every driver from driver_operations in one pass
+    # Returns {driver_id: row} in the same layout as driver_risk_scores
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT driver_id, zone_id, hour, trips_in_period
+            FROM driver_operations
+            ORDER BY driver_id;
+        """)
+        ops = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    if not ops:
+        return {}
+
+    ops = np.asarray(ops, dtype=np.int64)
+    driver_col, zone_col, hour_col, trips_col = ops[:, 0], ops[:, 1], ops[:, 2], ops[:, 3]
+    drivers, composite, levels, trips, zone_counts, hour_counts = scorer.score_many(
+        driver_col, zone_col, hour_col, trips_col)
+
+    # Which known zones and hours each driver works (needed to render the explanation)
+    known = scorer.rows_for(zone_col) >= 0
+    zone_pairs = np.unique(np.stack([driver_col[known], zone_col[known]], axis=1), axis=0)
+    hour_pairs = np.unique(np.stack([driver_col[known], hour_col[known]], axis=1), axis=0)
+    zones_by_driver = {}
+    hours_by_driver = {}
+    for did, zid in zone_pairs.tolist():
+        zones_by_driver.setdefault(did, []).append(zid)
+    for did, hour in hour_pairs.tolist():
+        hours_by_driver.setdefault(did, []).append(hour)
+
+    scores = {}
+    for did, score, level, n_trips, n_zones, n_hours in zip(
+            drivers.tolist(), composite.tolist(), levels.tolist(),
+            trips.tolist(), zone_counts.tolist(), hour_counts.tolist()):
+        scores[did] = (
+            did, round(score, 2), RISK_LEVELS[level], n_trips, n_zones, n_hours,
+            json.dumps(zones_by_driver.get(did, [])), json.dumps(hours_by_driver.get(did, []))
+        )
+    return scores
+
+
+def fetch_existing(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT driver_id, composite_risk_score, risk_level, total_trips,
+                   zone_count, hour_count, zone_ids, hours
+            FROM driver_risk_scores;
+        """)
+        existing = {}
+        for r in cursor.fetchall():
+            existing[r[0]] = (
+                r[0], round(float(r[1]), 2), r[2], r[3], r[4], r[5],
+                json.dumps(json.loads(r[6])), json.dumps(json.loads(r[7]))
+            )
+        return existing
+    finally:
+        cursor.close()
+
+
+def refresh():
+    print("Insurtech - Refreshing driver_risk_scores")
+    print()
+
+    conn = get_connection()
+    if not conn:
+        print("Could not connect to database")
+        sys.exit(1)
+
+    cur = conn.cursor()
+    try:
+        create_table(cur)
+        conn.commit()
+
+        # Score everyone against the current zone risks (cheap: one numpy pass)
+        # The version is read first, so if the risks move in between the scores just look older than they are
+        version = fetch_version(conn)
+        scorer = DriverRiskScorer.from_connection(conn)
+        scores = compute_scores(conn, scorer)
+        existing = fetch_existing(conn)
+        print(f"  Scored {len(scores)} drivers ({len(existing)} rows already stored)")
+
+        # Only write drivers whose operations or zone risks moved their row
+        changed = [row for did, row in scores.items() if existing.get(did) != row]
+        removed = [(did,) for did in existing if did not in scores]
+
+        upsert_scores(cur, [row + (version,) for row in changed])
+        if removed:
+            cur.executemany("DELETE FROM driver_risk_scores WHERE driver_id = %s;", removed)
+        # The rest still hold for the current zone risks, so the API can keep using them
+        cur.execute("""
+            UPDATE driver_risk_scores SET zone_risk_version = %s
+            WHERE NOT (zone_risk_version <=> %s);
+        """, (version, version))
+        conn.commit()
+
+        print(f"  Updated {len(changed)} rows, removed {len(removed)}, "
+              f"left {len(scores) - len(changed)} unchanged")
+        print("\nDone: driver_risk_scores is up to date.")
+
+    except Exception as e:
+        print(f"\nSomething went wrong: {e}")
+        import traceback
+        traceback.print_exc()
+        conn.rollback()
+        sys.exit(1)
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    refresh()
@@ -0,0 +1,360 @@
+# Runs the whole refresh (clean -> load -> precompute -> seed drivers -> score drivers) in one go,
+# skipping every stage whose inputs haven't changed since it last ran successfully.
+#
+# Each stage is fingerprinted from what it reads: the files (by content hash), the cleaning
+# thresholds, its own source code, the database tables it reads (by a cheap version query) and the
+# outputs of the stages it depends on. The fingerprints and outputs of the last good run are kept in
+# data/pipeline_state.json. A stage whose fingerprint matches, and whose outputs are still what it
+# left behind, is skipped; if it reruns but ends up with the same outputs, the stages after it are
+# skipped too.
+#
+#   python database/run_pipeline.py                 # refresh whatever changed
+#   python database/run_pipeline.py --dry-run       # just show what would run
+#   python database/run_pipeline.py --force load    # rerun load (and whatever that changes)
+
+import sys
+import os
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+# Figure out where this file is so we can find other project files
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(DATABASE_DIR)
+API_DIR = os.path.join(PROJECT_ROOT, 'api')
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, DATA_DIR)
+
+from database_config import get_connection
+import risk_scorer
+import driver_scores
+import metric_formulas
+import metrics_artifact
+import data_cleaning
+import load_data
+import aggregation_engine
+import populate_precomputed_tables
+import seed_drivers
+import refresh_driver_scores
+
+STATE_PATH = os.path.join(DATA_DIR, 'pipeline_state.json')
+
+# Bumped if the way fingerprints are worked out changes, so old state files don't cause skips
+STATE_FORMAT = 1
+
+
+class Stage:
+    """One step of the pipeline: what it needs, how to fingerprint it and how to run it"""
+
+    def __init__(self, name, run, inputs, deps=(), outputs=None, available=None):
+        self.name = name
+        self.run = run              # returns False (or raises / exits) when it fails
+        self.inputs = inputs        # -> dict describing everything the stage reads
+        self.deps = deps
+        self.outputs = outputs      # -> dict describing what it leaves behind (None: use the fingerprint)
+        self.available = available  # -> False if the stage has nothing to work from (it's then skipped)
+
+
+class Fingerprinter:
+    """Content hashes for files, reusing the last hash while a file's size and mtime stay the same"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def file(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = os.path.relpath(path, PROJECT_ROOT)
+        cached = self.cache.get(key)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest.hexdigest()}
+        return self.cache[key]["sha256"]
+
+    def code(self, *modules):
+        # The source of the scripts a stage runs, so editing one reruns it
+        return {os.path.basename(m.__file__): self.file(m.__file__) for m in modules}
+
+
+def table_version(sql):
+    # One cheap query whose result changes whenever the table's contents do (None if it can't be read)
+    conn = get_connection()
+    if not conn:
+        raise RuntimeError("Could not connect to database")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        return [str(v) for v in cursor.fetchone()]
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def cleaning_thresholds():
+    # The quality limits at the top of data_cleaning.py (numbers and durations)
+    return {k: str(v) for k, v in sorted(vars(data_cleaning).items())
+            if k.isupper() and isinstance(v, (int, float, timedelta)) and not isinstance(v, bool)}
+
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def build_stages(fp, trips_csv=None, workers=1, artifact_path=None):
+    # The stages in the order they run; each one's deps come before it
+    raw_trips = data_cleaning.TRIP_DATA_PATH
+    cleaned = os.path.exists(raw_trips) and trips_csv is None
+    trips_csv = trips_csv or (data_cleaning.CLEANED_TRIP_DATA if cleaned else load_data.TRIP_CSV)
+
+    loaded = []     # set once the load stage has run in this invocation
+
+    def load():
+        ok = load_data.main(trip_csv=trips_csv)
+        loaded.append(ok)
+        return ok
+
+    def precompute():
+        # A reload recreates the trip table, so the watermark says nothing about it: fold every trip again
+        populate_precomputed_tables.main(incremental=not loaded, workers=workers, artifact_path=artifact_path)
+        return True
+
+    def refresh():
+        refresh_driver_scores.refresh()
+        return True
+
+    return [
+        Stage(
+            "clean",
+            run=lambda: data_cleaning.main() or True,
+            available=lambda: cleaned,
+            inputs=lambda: {
+                "raw_trips": fp.file(raw_trips),
+                "locations": fp.file(data_cleaning.ZONE_METADATA_PATH),
+                "thresholds": cleaning_thresholds(),
+                "code": fp.code(data_cleaning)
+            },
+            outputs=lambda: {"cleaned_trips": fp.file(data_cleaning.CLEANED_TRIP_DATA)}
+        ),
+        Stage(
+            "load",
+            run=load,
+            deps=("clean",),
+            inputs=lambda: {
+                "trips": fp.file(trips_csv),
+                "trips_path": os.path.relpath(trips_csv, PROJECT_ROOT),
+                "locations": fp.file(load_data.LOCATION_CSV),
+                "code": fp.code(load_data)
+            },
+            # The file hash too: a re-clean can change trips without changing the count or the time span
+            outputs=lambda: {
+                "trips": fp.file(trips_csv),
+                "trip": table_version(
+                    "SELECT COUNT(*), MAX(trip_id), MIN(pickup_time), MAX(pickup_time) FROM trip;")
+            }
+        ),
+        Stage(
+            "precompute",
+            run=precompute,
+            deps=("load",),
+            inputs=lambda: {
+                "zone": table_version("SELECT COUNT(*), MAX(zone_id) FROM zone;"),
+                "artifact": artifact_path and os.path.relpath(artifact_path, PROJECT_ROOT),
+                "code": fp.code(populate_precomputed_tables, aggregation_engine, metric_formulas, metrics_artifact)
+            },
+            outputs=lambda: {
+                "overview": table_version("SELECT last_updated, total_trips FROM overview_metrics WHERE id = 1;"),
+                "artifact": fp.file(artifact_path) if artifact_path else None
+            }
+        ),
+        Stage(
+            "seed_drivers",
+            run=seed_drivers.seed,
+            deps=("load", "precompute"),
+            inputs=lambda: {"code": fp.code(seed_drivers, risk_scorer)}
+        ),
+        Stage(
+            "refresh_driver_scores",
+            run=refresh,
+            deps=("seed_drivers", "precompute"),
+            inputs=lambda: {
+                # The API adds operations for drivers it has to make up, so look at the table itself
+                "driver_operations": table_version(
+                    "SELECT COUNT(*), MAX(id), SUM(trips_in_period) FROM driver_operations;"),
+                "code": fp.code(refresh_driver_scores, risk_scorer, driver_scores)
+            }
+        )
+    ]
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        state = {}
+    if state.get("format") != STATE_FORMAT:
+        state = {}
+    state.setdefault("format", STATE_FORMAT)
+    state.setdefault("stages", {})
+    state.setdefault("files", {})
+    return state
+
+
+def save_state(state, path=STATE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def changed_keys(old, new):
+    # Top-level inputs that differ from last time (for the "why is this running" line)
+    old = old or {}
+    return sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+
+def run_pipeline(stages, state, force=(), dry_run=False, state_path=STATE_PATH):
+    # Returns [(stage, status, seconds)] where status is ran / skipped / unavailable / would run / failed
+    results = []
+    outputs = {}
+    pending = set()         # dry run: stages that would run, so their dependents can't be judged yet
+
+    for stage in stages:
+        previous = state["stages"].get(stage.name)
+
+        if stage.available is not None and not stage.available():
+            # Nothing to work from; dependents use whatever its output was last time (or nothing)
+            outputs[stage.name] = previous.get("outputs") if previous else None
+            print(f"- {stage.name}: nothing to run from, skipped")
+            results.append((stage.name, "unavailable", 0.0))
+            continue
+
+        inputs = stage.inputs()
+        upstream = {d: outputs.get(d) for d in stage.deps}
+        fingerprint = digest({"inputs": inputs, "upstream": upstream})
+
+        current_outputs = stage.outputs() if stage.outputs else None
+        reasons = []
+        if stage.name in force:
+            reasons.append("forced")
+        if previous is None or previous.get("status") != "ok":
+            reasons.append("no successful run recorded")
+        else:
+            if previous.get("fingerprint") != fingerprint:
+                changed = changed_keys(previous.get("inputs"), inputs)
+                changed += [f"{d} output" for d in stage.deps
+                            if (previous.get("upstream") or {}).get(d) != upstream[d]]
+                reasons.append("changed: " + ", ".join(changed or ["inputs"]))
+            if stage.outputs and previous.get("outputs") != current_outputs:
+                reasons.append("its output was changed or removed since")
+        waiting_on = [d for d in stage.deps if d in pending]
+        if dry_run and waiting_on and not reasons:
+            reasons.append("only if the output of " + " or ".join(waiting_on) + " changes")
+
+        if not reasons:
+            outputs[stage.name] = previous["outputs"]
+            print(f"- {stage.name}: up to date, skipped")
+            results.append((stage.name, "skipped", 0.0))
+            continue
+
+        print(f"- {stage.name}: {'would run' if dry_run else 'running'} ({'; '.join(reasons)})")
+        if dry_run:
+            pending.add(stage.name)
+            outputs[stage.name] = previous.get("outputs") if previous else None
+            results.append((stage.name, "would run", 0.0))
+            continue
+
+        print()
+        started = time.perf_counter()
+        try:
+            ok = stage.run() is not False
+        except SystemExit as e:
+            ok = not e.code
+        except Exception as e:
+            print(f"Error in {stage.name}: {e}")
+            import traceback
+            traceback.print_exc()
+            ok = False
+        seconds = time.perf_counter() - started
+        print()
+
+        if not ok:
+            state["stages"][stage.name] = {"status": "failed", "finished_at": datetime.now().isoformat(timespec="seconds")}
+            save_state(state, state_path)
+            results.append((stage.name, "failed", seconds))
+            print(f"- {stage.name}: failed after {seconds:.1f}s, stopping here")
+            return results
+
+        # Outputs are read after the run; with no outputs to look at, the fingerprint stands in
+        new_outputs = stage.outputs() if stage.outputs else {"fingerprint": fingerprint}
+        outputs[stage.name] = new_outputs
+        state["stages"][stage.name] = {
+            "status": "ok",
+            "fingerprint": fingerprint,
+            "inputs": inputs,
+            "upstream": upstream,
+            "outputs": new_outputs,
+            "seconds": round(seconds, 3),
+            "finished_at": datetime.now().isoformat(timespec="seconds")
+        }
+        save_state(state, state_path)
+        results.append((stage.name, "ran", seconds))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh everything, skipping stages whose inputs haven't changed")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages would run and why")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        help="rerun these stages even if nothing changed (no names: every stage)")
+    parser.add_argument("--trips", help="trips CSV to load instead of the cleaned output (skips cleaning)")
+    parser.add_argument("--workers", type=int, default=1, help="passed on to populate_precomputed_tables.py")
+    parser.add_argument("--artifact", nargs="?", const=metrics_artifact.DEFAULT_ARTIFACT_PATH,
+                        help="also write the memory-mapped grid file (see populate_precomputed_tables.py)")
+    parser.add_argument("--state", default=STATE_PATH, help=f"state file (default {STATE_PATH})")
+    args = parser.parse_args()
+    try:
+        populate_precomputed_tables.check_workers(args.workers)
+    except ValueError as e:
+        parser.error(f"--{e}")
+
+    state = load_state(args.state)
+    fp = Fingerprinter(state["files"])
+    stages = build_stages(fp, trips_csv=args.trips, workers=args.workers, artifact_path=args.artifact)
+    names = [s.name for s in stages]
+    force = names if args.force == [] else (args.force or [])
+    unknown = [f for f in force if f not in names]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (stages are {', '.join(names)})")
+
+    print("Insurtech - Pipeline" + (" (dry run)" if args.dry_run else ""))
+    print()
+    started = time.perf_counter()
+    results = run_pipeline(stages, state, force=force, dry_run=args.dry_run, state_path=args.state)
+    if not args.dry_run:
+        # Keep the file hash cache even if every stage was skipped
+        save_state(state, args.state)
+
+    print("\nSummary:")
+    for name, status, seconds in results:
+        print(f"   {name:22s} {status:12s} {seconds:8.1f}s")
+    print(f"   {'total':22s} {'':12s} {time.perf_counter() - started:8.1f}s")
+    if any(status == "failed" for _, status, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()